@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL_HOURS = {'critical': 6, 'warning': 24}
+
+
+class AlertDedupStore:
+    """
+    Estado compartido de deduplicación y cooldown de notificaciones.
+
+    Cada clave (plc_id, alert_type, severity) guarda hasta cuándo está en
+    cooldown, con un TTL por severidad. claim() decide si se notifica con una
+    sola sentencia (INSERT ... ON CONFLICT DO UPDATE ... WHERE caducada) sobre
+    la clave primaria, así que entre varios procesos (agente, dashboard con
+    varios navegadores, workers) solo uno gana cada ventana y una tormenta de
+    alertas iguales se queda en una notificación. La base es un SQLite en
+    modo WAL junto a los demás ficheros locales.
+
+    Cada proceso recuerda además hasta cuándo sabe que una clave está en
+    cooldown: mientras no caduque, la respuesta sale de un dict sin tocar
+    SQLite.
+    """
+
+    def __init__(self, path='alert_dedup.db', ttl_hours=None, default_ttl_hours=24, busy_timeout_s=5.0,
+                 purge_interval_s=3600):
+        self.path = path
+        self.ttl_hours = dict(DEFAULT_TTL_HOURS, **(ttl_hours or {}))
+        self.default_ttl_hours = default_ttl_hours
+        self.purge_interval_s = purge_interval_s
+        self.logger = logging.getLogger('AlertDedup')
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_s, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS alert_dedup (
+                plc_id TEXT NOT NULL,
+                alert_type TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                first_sent REAL NOT NULL,
+                last_sent REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                suppressed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (plc_id, alert_type, severity)
+            ) WITHOUT ROWID
+        """)
+        self._known = {}
+        self._last_purge = time.time()
+        self.stats = {'claimed': 0, 'suppressed': 0, 'local_hits': 0, 'released': 0, 'purged': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config.get('alert_dedup', {}))
+
+    def ttl_seconds(self, severity):
+        return 3600.0 * self.ttl_hours.get(severity, self.default_ttl_hours)
+
+    def claim(self, plc_id, alert_type, severity, now=None):
+        """
+        Reserva la notificación de una clave si no está en cooldown.
+
+        Returns:
+            True si quien llama debe notificar (y la clave queda en cooldown)
+        """
+        key = (str(plc_id), alert_type, severity)
+        now = time.time() if now is None else now
+        if self._known.get(key, 0.0) > now:
+            self.stats['local_hits'] += 1
+            self.stats['suppressed'] += 1
+            return False
+
+        expires_at = now + self.ttl_seconds(severity)
+        with self._lock:
+            cursor = self._conn.execute("""
+                INSERT INTO alert_dedup (plc_id, alert_type, severity, first_sent, last_sent, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (plc_id, alert_type, severity) DO UPDATE SET
+                    last_sent = excluded.last_sent, expires_at = excluded.expires_at, suppressed = 0
+                WHERE alert_dedup.expires_at <= excluded.last_sent
+            """, (*key, now, now, expires_at))
+            claimed = cursor.rowcount == 1
+            if not claimed:
+                # Otro proceso notificó antes: se anota hasta cuándo dura su ventana
+                cursor = self._conn.execute("""
+                    UPDATE alert_dedup SET suppressed = suppressed + 1
+                    WHERE plc_id = ? AND alert_type = ? AND severity = ?
+                    RETURNING expires_at
+                """, key)
+                row = cursor.fetchone()
+                expires_at = row[0] if row else now
+            self._known[key] = expires_at
+            if now - self._last_purge >= self.purge_interval_s:
+                self._purge(now)
+        self.stats['claimed' if claimed else 'suppressed'] += 1
+        return claimed
+
+    def release(self, plc_id, alert_type, severity):
+        """Deshace un claim cuando la notificación no llegó a enviarse"""
+        key = (str(plc_id), alert_type, severity)
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM alert_dedup WHERE plc_id = ? AND alert_type = ? AND severity = ?', key
+            )
+            self._known.pop(key, None)
+        self.stats['released'] += 1
+
+    def remaining_seconds(self, plc_id, alert_type, severity, now=None):
+        """Segundos de cooldown que le quedan a una clave (0 si puede notificarse)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at FROM alert_dedup WHERE plc_id = ? AND alert_type = ? AND severity = ?',
+                (str(plc_id), alert_type, severity)
+            ).fetchone()
+        return max(0.0, row[0] - now) if row else 0.0
+
+    def _purge(self, now):
+        # Las claves caducadas no aportan nada: se borran para acotar la tabla
+        cursor = self._conn.execute('DELETE FROM alert_dedup WHERE expires_at <= ?', (now,))
+        self._known = {key: expires for key, expires in self._known.items() if expires > now}
+        self._last_purge = now
+        self.stats['purged'] += cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_stats(self):
+        with self._lock:
+            keys, active = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(expires_at > ?), 0) FROM alert_dedup', (time.time(),)
+            ).fetchone()
+        return dict(self.stats, keys=keys, active_keys=active)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from fleet_state import to_epoch_seconds
+
+SEGMENT_PATTERN = 'alerts-{:06d}.jsonl'
+
+
+def _epoch(timestamp):
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return float(to_epoch_seconds([timestamp])[0])
+
+
+class AlertStore:
+    """
+    Historial de alertas acotado y de solo escritura al final.
+
+    Las alertas se acumulan en un búfer y se añaden por lotes a un log JSONL
+    segmentado: el segmento activo se cierra al superar segment_max_bytes y
+    solo se conservan los últimos max_segments, así que el disco también está
+    acotado. En memoria solo queda un anillo con las ring_size alertas más
+    recientes. Cada segmento lleva un índice (por máquina: primera y última
+    alerta y número de alertas) con el que las consultas por máquina y rango
+    de tiempo solo leen los segmentos que pueden contener resultados.
+
+    Un solo proceso escribe en cada directorio; otros procesos (el dashboard)
+    pueden abrirlo y ven las alertas nuevas con refresh().
+    """
+
+    def __init__(self, directory='alerts', ring_size=1000, flush_every=50, flush_interval_s=5.0,
+                 segment_max_bytes=8 * 1024 * 1024, max_segments=20):
+        self.directory = directory
+        self.ring_size = ring_size
+        self.flush_every = flush_every
+        self.flush_interval_s = flush_interval_s
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self.logger = logging.getLogger('AlertStore')
+
+        self._ring = deque(maxlen=ring_size)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self.stats = {'appended': 0, 'flushes': 0, 'rotations': 0, 'segments_dropped': 0,
+                      'ring_queries': 0, 'disk_queries': 0, 'segments_read': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        for path in sorted(glob.glob(os.path.join(directory, 'alerts-*.jsonl'))):
+            self.segments.append(self._load_index(path))
+        if not self.segments or os.path.exists(self._index_path(self.segments[-1]['path'])):
+            # Se escribe siempre en un segmento abierto
+            self.segments.append(self._new_segment(self.segments[-1]['seq'] + 1 if self.segments else 1))
+        self._load_ring()
+
+    @classmethod
+    def from_config(cls, config):
+        settings = dict(config.get('alert_store', {}))
+        return cls(**settings)
+
+    def _new_segment(self, seq):
+        path = os.path.join(self.directory, SEGMENT_PATTERN.format(seq))
+        return {'seq': seq, 'path': path, 'bytes': 0, 'count': 0, 'machines': {}}
+
+    def _index_path(self, path):
+        return path[:-len('.jsonl')] + '.idx.json'
+
+    def _index_record(self, segment, record):
+        ts, plc_id = record['ts'], str(record.get('plc_id'))
+        first, last, count = segment['machines'].get(plc_id, (ts, ts, 0))
+        segment['machines'][plc_id] = (min(first, ts), max(last, ts), count + 1)
+        segment['count'] += 1
+
+    def _load_index(self, path):
+        seq = int(os.path.basename(path)[len('alerts-'):-len('.jsonl')])
+        segment = self._new_segment(seq)
+        segment['bytes'] = os.path.getsize(path)
+        index_path = self._index_path(path)
+        if os.path.exists(index_path):
+            # Segmento cerrado: el índice se escribió al rotar
+            with open(index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            segment['count'] = saved['count']
+            segment['machines'] = {k: tuple(v) for k, v in saved['machines'].items()}
+            return segment
+        # Segmento activo (o sin índice tras una caída): se reconstruye leyéndolo
+        for record in self._read_segment(path):
+            self._index_record(segment, record)
+        return segment
+
+    def _read_segment(self, path):
+        if not os.path.exists(path):
+            # Segmento abierto sin escribir todavía (o ya eliminado por la retención)
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Última línea a medias tras una caída
+                    continue
+
+    def _load_ring(self):
+        # Rellena el anillo con las alertas más recientes del disco
+        for segment in reversed(self.segments):
+            if len(self._ring) >= self.ring_size:
+                break
+            records = list(self._read_segment(segment['path']))
+            for record in reversed(records[-(self.ring_size - len(self._ring)):]):
+                self._ring.appendleft(record)
+
+    def append(self, alert):
+        """Añade una alerta; se escribe al disco con el siguiente lote"""
+        record = json.loads(json.dumps(alert, default=str))
+        record['ts'] = _epoch(alert.get('timestamp'))
+        with self._lock:
+            self._ring.append(record)
+            self._pending.append(record)
+            self.stats['appended'] += 1
+            due = (len(self._pending) >= self.flush_every
+                   or time.time() - self._last_flush >= self.flush_interval_s)
+        if due:
+            self.flush()
+        return record
+
+    def flush(self):
+        """Escribe las alertas pendientes al segmento activo con una sola escritura"""
+        with self._lock:
+            self._last_flush = time.time()
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, []
+            segment = self.segments[-1]
+            lines = ''.join(json.dumps(record) + '\n' for record in pending)
+            with open(segment['path'], 'a', encoding='utf-8') as f:
+                f.write(lines)
+            segment['bytes'] += len(lines.encode('utf-8'))
+            for record in pending:
+                self._index_record(segment, record)
+            self.stats['flushes'] += 1
+            if segment['bytes'] >= self.segment_max_bytes:
+                self._rotate()
+            return len(pending)
+
+    def _rotate(self):
+        segment = self.segments[-1]
+        with open(self._index_path(segment['path']), 'w', encoding='utf-8') as f:
+            json.dump({'count': segment['count'], 'machines': segment['machines']}, f)
+        self.segments.append(self._new_segment(segment['seq'] + 1))
+        self.stats['rotations'] += 1
+        while len(self.segments) > self.max_segments:
+            dropped = self.segments.pop(0)
+            for path in (dropped['path'], self._index_path(dropped['path'])):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.stats['segments_dropped'] += 1
+        self.logger.info(f"Segmento de alertas cerrado: {os.path.basename(segment['path'])}")
+
+    def refresh(self):
+        """Incorpora lo que otro proceso haya escrito en el directorio desde la última vez"""
+        with self._lock:
+            known = {segment['path']: segment for segment in self.segments}
+            paths = sorted(glob.glob(os.path.join(self.directory, 'alerts-*.jsonl')))
+            segments = []
+            for path in paths:
+                segment = known.get(path)
+                if segment is None:
+                    segment = self._load_index(path)
+                    new_records = list(self._read_segment(path))
+                elif os.path.getsize(path) > segment['bytes']:
+                    # Solo se lee la parte añadida
+                    with open(path, 'r', encoding='utf-8') as f:
+                        f.seek(segment['bytes'])
+                        tail = f.read()
+                    complete = tail[:tail.rfind('\n') + 1]
+                    segment['bytes'] += len(complete.encode('utf-8'))
+                    new_records = [json.loads(line) for line in complete.splitlines() if line]
+                    for record in new_records:
+                        self._index_record(segment, record)
+                else:
+                    new_records = []
+                self._ring.extend(new_records)
+                segments.append(segment)
+            if self.segments and self.segments[-1]['path'] not in paths:
+                # Segmento abierto todavía sin escribir
+                segments.append(self.segments[-1])
+            self.segments = segments
+
+    def maybe_flush(self):
+        """Escribe el búfer si ha pasado flush_interval_s (para bucles sin alertas nuevas)"""
+        if self._pending and time.time() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def query(self, plc_id=None, start=None, end=None, limit=None):
+        """
+        Alertas de una máquina (o de todas) en un rango de tiempo, de la más
+        antigua a la más reciente.
+
+        Si el rango cae dentro del anillo se responde sin leer el disco; si no,
+        solo se leen los segmentos cuyo índice tiene alertas de esa máquina en
+        el rango.
+
+        Args:
+            start, end: datetime o epoch (incluidos); None = sin límite
+            limit: devuelve como mucho las `limit` alertas más recientes
+        """
+        start = _epoch(start) if start is not None else float('-inf')
+        end = _epoch(end) if end is not None else float('inf')
+        key = None if plc_id is None else str(plc_id)
+
+        def matches(record):
+            return start <= record['ts'] <= end and (key is None or str(record.get('plc_id')) == key)
+
+        with self._lock:
+            ring = list(self._ring)
+            pending = list(self._pending)
+            segments = [dict(s, machines=dict(s['machines'])) for s in self.segments]
+
+        # El anillo basta si contiene todo lo posterior a start (o si ya llena limit)
+        in_ring = [r for r in ring if matches(r)]
+        ring_complete = len(ring) < self.ring_size or (ring and ring[0]['ts'] <= start)
+        if ring_complete or (limit is not None and len(in_ring) >= limit):
+            self.stats['ring_queries'] += 1
+            return in_ring[-limit:] if limit else in_ring
+
+        self.stats['disk_queries'] += 1
+        results = []
+        for segment in segments:
+            machines = segment['machines'] if key is None else {key: segment['machines'].get(key)}
+            if not any(v is not None and v[0] <= end and v[1] >= start for v in machines.values()):
+                continue
+            self.stats['segments_read'] += 1
+            results.extend(r for r in self._read_segment(segment['path']) if matches(r))
+        results.extend(r for r in pending if matches(r))
+        results.sort(key=lambda r: r['ts'])
+        return results[-limit:] if limit else results
+
+    def recent(self, n=100):
+        """Las n alertas más recientes (desde memoria)"""
+        with self._lock:
+            return list(self._ring)[-n:]
+
+    def __len__(self):
+        return sum(segment['count'] for segment in self.segments) + len(self._pending)
+
+    def close(self):
+        self.flush()
+
+    def get_stats(self):
+        return dict(
+            self.stats,
+            segments=len(self.segments),
+            stored=len(self),
+            ring=len(self._ring),
+            pending=len(self._pending),
+            disk_bytes=sum(segment['bytes'] for segment in self.segments)
+        )
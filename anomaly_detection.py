@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+import numpy as np
+from fleet_state import MachineIndex, rank_within_group, to_epoch_seconds
+
+SENSOR_COLUMNS = [
+    'temperature', 'vibration', 'pressure', 'rotation_speed',
+    'power_consumption', 'noise_level', 'oil_level', 'humidity'
+]
+
+ANOMALY_TYPES = ('spike', 'drift', 'seasonal')
+
+
+class StreamingAnomalyDetector:
+    """
+    Detección de anomalías en streaming con estado O(1) por máquina y sensor.
+
+    Para cada sensor se combinan tres detectores:
+      - spike: z-score frente a una media/varianza EWMA
+      - drift: CUSUM bilateral de la desviación frente a una media lenta
+        (drift_alpha), en unidades de la desviación típica EWMA; acumula
+        desvíos pequeños pero persistentes que la media rápida ya absorbió
+      - seasonal: z-score frente a una línea base EWMA por franja del periodo
+        (por defecto, la hora del día)
+    El z-score se calcula antes de actualizar el estado con la lectura. Un lote
+    se procesa vectorizado sobre todas las máquinas; las lecturas de una misma
+    máquina se aplican en orden, por rondas.
+    """
+
+    def __init__(self, sensors=None, alpha=0.05, z_threshold=4.0, drift_alpha=0.002, cusum_k=0.5, cusum_h=8.0,
+                 season_period_s=86400, season_bins=24, season_alpha=0.05, season_threshold=4.0,
+                 warmup=30):
+        self.sensors = list(sensors or SENSOR_COLUMNS)
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.drift_alpha = drift_alpha
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.season_period_s = season_period_s
+        self.season_bins = season_bins
+        self.season_alpha = season_alpha
+        self.season_threshold = season_threshold
+        self.warmup = warmup
+        self.logger = logging.getLogger('AnomalyDetector')
+
+        n_sensors = len(self.sensors)
+        self.index = MachineIndex()
+        self.index.register('count', dtype=np.int64, fill=0)
+        self.index.register('mean', (n_sensors,))
+        self.index.register('var', (n_sensors,))
+        self.index.register('slow_mean', (n_sensors,))
+        self.index.register('cusum_pos', (n_sensors,))
+        self.index.register('cusum_neg', (n_sensors,))
+        self.index.register('season_count', (season_bins,), dtype=np.int64, fill=0)
+        self.index.register('season_mean', (season_bins, n_sensors))
+        self.index.register('season_var', (season_bins, n_sensors))
+        self.stats = {'rows': 0, 'batches': 0, 'seconds': 0.0, 'flags': dict.fromkeys(ANOMALY_TYPES, 0)}
+
+    @classmethod
+    def from_config(cls, config, sensors=None):
+        settings = dict(config.get('anomaly_detection', {}))
+        return cls(sensors, **settings)
+
+    def _zscore(self, x, mean, var):
+        return (x - mean) / np.sqrt(np.maximum(var, 1e-12))
+
+    def _ewma(self, x, mean, var, alpha, count):
+        # Durante el arranque se usa la media acumulada (alpha = 1 / n)
+        alpha = np.maximum(alpha, 1.0 / (count + 1))[:, None]
+        diff = x - mean
+        return mean + alpha * diff, (1 - alpha) * (var + alpha * diff * diff)
+
+    def update(self, plc_ids, timestamps, X):
+        """
+        Aplica un lote de lecturas y devuelve puntuaciones y marcas por sensor.
+
+        Args:
+            plc_ids: máquina de cada fila
+            timestamps: instante de cada lectura (datetime o epoch)
+            X: valores de los sensores (n, n_sensores) en el orden de self.sensors
+
+        Returns:
+            dict con arrays (n, n_sensores): z, cusum y seasonal_z (puntuaciones) y
+            spike, drift y seasonal (marcas); y anomaly (n,) si hay alguna marca
+        """
+        started = time.perf_counter()
+        X = np.asarray(X, dtype=np.float64)
+        n, n_sensors = len(X), len(self.sensors)
+        result = {name: np.full((n, n_sensors), np.nan) for name in ('z', 'cusum', 'seasonal_z')}
+        result.update({name: np.zeros((n, n_sensors), dtype=bool) for name in ANOMALY_TYPES})
+        if n == 0:
+            result['anomaly'] = np.zeros(0, dtype=bool)
+            return result
+
+        rows = self.index.indices(list(plc_ids))
+        seconds = to_epoch_seconds(timestamps)
+        bins = ((seconds % self.season_period_s) / self.season_period_s * self.season_bins).astype(np.intp)
+        bins = np.clip(bins, 0, self.season_bins - 1)
+        state = {name: self.index.array(name) for name in (
+            'count', 'mean', 'var', 'slow_mean', 'cusum_pos', 'cusum_neg', 'season_count', 'season_mean', 'season_var'
+        )}
+
+        ranks = rank_within_group(rows)
+        order = np.argsort(ranks, kind='stable')
+        bounds = np.searchsorted(ranks[order], np.arange(ranks.max() + 2))
+        for r in range(len(bounds) - 1):
+            sel = order[bounds[r]:bounds[r + 1]]
+            m, b, x = rows[sel], bins[sel], X[sel]
+            count = state['count'][m]
+            warm = (count >= self.warmup)[:, None]
+
+            # Spike: z-score frente al EWMA previo
+            mean, var = state['mean'][m], state['var'][m]
+            z = np.where(warm, self._zscore(x, mean, var), 0.0)
+            spike = warm & (np.abs(z) > self.z_threshold)
+
+            # Drift: CUSUM frente a la media lenta; al dar la alarma se reinicia
+            # y la media lenta pasa al nivel actual
+            slow_mean = state['slow_mean'][m]
+            shift = np.where(warm, self._zscore(x, slow_mean, var), 0.0)
+            pos = np.maximum(0.0, state['cusum_pos'][m] + shift - self.cusum_k)
+            neg = np.maximum(0.0, state['cusum_neg'][m] - shift - self.cusum_k)
+            drift = (pos > self.cusum_h) | (neg > self.cusum_h)
+            cusum = np.maximum(pos, neg)
+            state['cusum_pos'][m] = np.where(drift, 0.0, pos)
+            state['cusum_neg'][m] = np.where(drift, 0.0, neg)
+            slow_alpha = np.maximum(self.drift_alpha, 1.0 / (count + 1))[:, None]
+            state['slow_mean'][m] = np.where(drift, mean, slow_mean + slow_alpha * (x - slow_mean))
+
+            # Seasonal: z-score frente a la línea base de la franja
+            season_count = state['season_count'][m, b]
+            season_warm = (season_count >= self.warmup)[:, None]
+            season_mean, season_var = state['season_mean'][m, b], state['season_var'][m, b]
+            seasonal_z = np.where(season_warm, self._zscore(x, season_mean, season_var), 0.0)
+            seasonal = season_warm & (np.abs(seasonal_z) > self.season_threshold)
+
+            state['mean'][m], state['var'][m] = self._ewma(x, mean, var, self.alpha, count)
+            state['season_mean'][m, b], state['season_var'][m, b] = self._ewma(
+                x, season_mean, season_var, self.season_alpha, season_count
+            )
+            state['count'][m] = count + 1
+            state['season_count'][m, b] = season_count + 1
+
+            result['z'][sel], result['cusum'][sel], result['seasonal_z'][sel] = z, cusum, seasonal_z
+            result['spike'][sel], result['drift'][sel], result['seasonal'][sel] = spike, drift, seasonal
+
+        result['anomaly'] = result['spike'].any(axis=1) | result['drift'].any(axis=1) | result['seasonal'].any(axis=1)
+        self.stats['rows'] += n
+        self.stats['batches'] += 1
+        self.stats['seconds'] += time.perf_counter() - started
+        for name in ANOMALY_TYPES:
+            self.stats['flags'][name] += int(result[name].sum())
+        return result
+
+    def describe(self, result):
+        """Lista de anomalías por fila: sensor, tipo y puntuación"""
+        scores = {'spike': result['z'], 'drift': result['cusum'], 'seasonal': result['seasonal_z']}
+        anomalies = [[] for _ in range(len(result['anomaly']))]
+        for row in np.flatnonzero(result['anomaly']):
+            for kind in ANOMALY_TYPES:
+                for sensor in np.flatnonzero(result[kind][row]):
+                    anomalies[row].append({
+                        'sensor': self.sensors[sensor],
+                        'type': kind,
+                        'score': float(scores[kind][row, sensor])
+                    })
+        return anomalies
+
+    def get_stats(self):
+        rows = self.stats['rows']
+        return {
+            'machines': len(self.index),
+            'rows': rows,
+            'batches': self.stats['batches'],
+            'flags': dict(self.stats['flags']),
+            'rows_per_s': rows / self.stats['seconds'] if self.stats['seconds'] > 0 else None
+        }
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+import io
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from feature_pipeline import FEATURE_COLUMNS, build_features, scale_features
+from rul_estimator import TrendRULEstimator, rul_from_probability
+from data_retention import create_index_concurrently, raw_retention_days
+
+PREDICTION_COLUMNS = [
+    'plc_id', 'timestamp', 'model_version', 'predicted_at', 'needs_maintenance',
+    'probability', 'rul_hours', 'rul_lower_hours', 'rul_upper_hours'
+]
+
+
+def database_url(config):
+    pg = config['postgres_local']
+    return f"postgresql://{pg['user']}:{pg['password']}@{pg['host']}:{pg['port']}/{pg['dbname']}"
+
+
+def ensure_predictions_table(engine):
+    """Crea la tabla de predicciones si no existe"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                plc_id VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                model_version VARCHAR(50) NOT NULL,
+                predicted_at TIMESTAMP NOT NULL,
+                needs_maintenance BOOLEAN,
+                probability FLOAT,
+                rul_hours FLOAT,
+                rul_lower_hours FLOAT,
+                rul_upper_hours FLOAT,
+                PRIMARY KEY (plc_id, timestamp, model_version)
+            )
+        """))
+        # Tablas creadas antes de guardar las cotas de la RUL
+        conn.execute(text("""
+            ALTER TABLE predictions
+                ADD COLUMN IF NOT EXISTS rul_lower_hours FLOAT,
+                ADD COLUMN IF NOT EXISTS rul_upper_hours FLOAT
+        """))
+
+
+def ensure_latest_reading_index(engine):
+    """
+    Índice de plc_mech para leer la última lectura de cada máquina.
+
+    Paso de preparación único: se construye con CREATE INDEX CONCURRENTLY
+    para no bloquear la ingesta. Devuelve True si se ha creado.
+    """
+    return create_index_concurrently(
+        engine, 'plc_mech_plc_id_timestamp_idx', 'plc_mech', 'plc_id, timestamp DESC'
+    )
+
+
+def score_matrix(pipeline, X, inference_engine='auto', flat_max_rows=512):
+    """
+    Puntúa una matriz de features sin escalar con una sola llamada a predict_proba.
+
+    La etiqueta se deriva de las mismas probabilidades (clase de mayor
+    probabilidad), igual que hace predict() internamente. Si la versión tiene
+    bosque aplanado se usa para los lotes pequeños, donde el coste fijo de cada
+    llamada a sklearn domina; ambos dan las mismas probabilidades.
+
+    Returns:
+        (needs_maintenance, probability) como arrays de longitud n
+    """
+    flat = pipeline.get('flat')
+    if flat is not None and (
+        inference_engine == 'flat'
+        or (inference_engine == 'auto' and len(X) <= flat_max_rows)
+    ):
+        # El bosque aplanado incorpora el scaler
+        model = flat
+    else:
+        model = pipeline['model']
+        X = scale_features(X, pipeline['scaler'])
+    probabilities = model.predict_proba(X)
+    classes = list(model.classes_)
+    labels = np.asarray(classes)[probabilities.argmax(axis=1)].astype(bool)
+    positive = [i for i, c in enumerate(classes) if bool(c)]
+    if positive:
+        probability = probabilities[:, positive[0]]
+    else:
+        probability = np.zeros(len(X))
+    return labels, probability
+
+
+def copy_predictions(engine, frame):
+    """
+    Inserta predicciones en bloque: COPY a una tabla temporal y un único
+    INSERT ... ON CONFLICT DO NOTHING (repetir un lote no duplica filas).
+    """
+    if frame.empty:
+        return 0
+    buffer = io.StringIO()
+    frame[PREDICTION_COLUMNS].to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+    columns = ', '.join(PREDICTION_COLUMNS)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS predictions_stage "
+            "(LIKE predictions INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_expert(f"COPY predictions_stage ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer)
+        cursor.execute(
+            f"INSERT INTO predictions ({columns}) SELECT {columns} FROM predictions_stage "
+            "ON CONFLICT (plc_id, timestamp, model_version) DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        raw.commit()
+        return inserted
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def time_chunks(start, end, chunk_hours):
+    """Divide [start, end) en tramos consecutivos de chunk_hours"""
+    chunks = []
+    step = timedelta(hours=chunk_hours)
+    current = start
+    while current < end:
+        chunks.append((current, min(current + step, end)))
+        current += step
+    return chunks
+
+
+# Estado de cada proceso del pool: el modelo se carga una vez por proceso, no por tramo
+_worker = {}
+
+
+def _init_worker(settings):
+    from model_registry import ModelRegistry
+    from threadpoolctl import threadpool_limits
+    # Un núcleo por proceso: el paralelismo lo da el pool
+    threadpool_limits(limits=1)
+    config = settings['config']
+    registry = ModelRegistry.from_config(config)
+    pipeline = registry.load(settings['version'])
+    if pipeline is None:
+        raise RuntimeError("No hay ningún modelo registrado")
+    if hasattr(pipeline['model'], 'n_jobs'):
+        pipeline['model'].n_jobs = 1
+    _worker.clear()
+    _worker.update(settings, pipeline=pipeline)
+    if settings['source'] == 'db' or settings['output_dir'] is None:
+        _worker['engine'] = create_engine(database_url(config))
+
+
+def _read_chunk(start, end):
+    """
+    Lecturas de plc_mech en [start, end), ordenadas por tiempo, en bloques de
+    como mucho max_rows filas: la memoria de un proceso no depende del tamaño
+    de la flota ni de la duración del tramo.
+    """
+    max_rows = _worker['max_rows']
+    if _worker['source'] == 'db':
+        query = text(f"""
+            SELECT plc_id, timestamp, {', '.join(FEATURE_COLUMNS)}
+            FROM plc_mech
+            WHERE timestamp >= :start AND timestamp < :end
+            ORDER BY timestamp
+        """)
+        with _worker['engine'].connect() as conn:
+            # Cursor con nombre: el servidor entrega las filas por bloques
+            conn = conn.execution_options(stream_results=True, max_row_buffer=max_rows)
+            for frame in pd.read_sql(query, conn, params={'start': start, 'end': end}, chunksize=max_rows):
+                frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+                yield frame
+        return
+
+    # Flota sintética para medir el rendimiento sin BD (mismo tramo -> mismos datos)
+    from synthetic_data import generate_history
+    spec = _worker['source']
+    freq_s = spec['freq_s']
+    n_steps = int((end - start).total_seconds() // freq_s)
+    steps_per_frame = max(1, max_rows // spec['machines'])
+    for first in range(0, n_steps, steps_per_frame):
+        frame_start = start + timedelta(seconds=first * freq_s)
+        seed = int(frame_start.timestamp()) % (2 ** 31)
+        yield generate_history(n_machines=spec['machines'], n_steps=min(steps_per_frame, n_steps - first),
+                               start=frame_start, freq_s=freq_s, seed=seed)
+
+
+def _estimate_rul(estimator, frame, probability):
+    """
+    RUL por tendencia fila a fila en pasos de rul_step_s: cada fila recibe la
+    estimación con las lecturas hasta el final de su paso. El estimador
+    conserva la ventana de cada máquina entre bloques del mismo tramo.
+    """
+    names = estimator.names
+    n = len(frame)
+    result = {name: np.full(n, np.nan) for name in ('rul_hours', 'rul_lower_hours', 'rul_upper_hours')}
+    seconds = frame['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    steps = ((seconds - seconds[0]) // _worker['rul_step_s']).astype(np.int64)
+    bounds = np.flatnonzero(np.diff(steps)) + 1
+    plc_ids = frame['plc_id'].to_numpy()
+    Y = build_features(frame, names, np.float64)
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, n]):
+        ids = plc_ids[lo:hi].tolist()
+        estimator.update(ids, frame['timestamp'].iloc[lo:hi], Y[lo:hi])
+        estimate = estimator.estimate(ids)
+        for name in result:
+            result[name][lo:hi] = estimate[name]
+
+    # Sin historial suficiente, la estimación de respaldo por probabilidad (sin cotas)
+    missing = np.isnan(result['rul_hours'])
+    if missing.any():
+        fallback = rul_from_probability(probability, frame['machine_age'].to_numpy())
+        result['rul_hours'] = np.where(missing, fallback, result['rul_hours'])
+    return result
+
+
+def _write_chunk(index, part, frame):
+    if _worker['output_dir'] is None:
+        return copy_predictions(_worker['engine'], frame)
+    # Un .npz por bloque del tramo (columnas como arrays), publicado con rename atómico
+    path = os.path.join(_worker['output_dir'], f"predictions_{_worker['version']}_{index:06d}_{part:04d}.npz")
+    tmp_path = path + f'.tmp-{os.getpid()}.npz'
+    np.savez(tmp_path, **{
+        name: frame[name].to_numpy(dtype=str if name in ('plc_id', 'model_version') else None)
+        for name in PREDICTION_COLUMNS
+    })
+    os.replace(tmp_path, path)
+    return len(frame)
+
+
+def _score_chunk(index, start, end):
+    """Lee, puntúa y guarda un tramo bloque a bloque; devuelve filas y tiempos por fase"""
+    cpu_start = time.process_time()
+    timings = {'read_s': 0.0, 'score_s': 0.0, 'write_s': 0.0}
+    pipeline = _worker['pipeline']
+    estimator = TrendRULEstimator.from_config(_worker['config'])
+
+    # Calentar la tendencia de cada máquina con las lecturas anteriores al tramo
+    t = time.perf_counter()
+    for warmup in _read_chunk(start - timedelta(minutes=_worker['warmup_minutes']), start):
+        estimator.update(warmup['plc_id'].tolist(), warmup['timestamp'],
+                         build_features(warmup, estimator.names, np.float64))
+    timings['read_s'] += time.perf_counter() - t
+
+    rows = written = 0
+    frames = _read_chunk(start, end)
+    for part in itertools.count():
+        t = time.perf_counter()
+        frame = next(frames, None)
+        timings['read_s'] += time.perf_counter() - t
+        if frame is None:
+            break
+        if frame.empty:
+            continue
+
+        t = time.perf_counter()
+        frame = frame.reset_index(drop=True)
+        X = build_features(frame, pipeline.get('features') or FEATURE_COLUMNS)
+        needs_maintenance, probability = score_matrix(pipeline, X, inference_engine='sklearn')
+        rul = _estimate_rul(estimator, frame, probability)
+        output = pd.DataFrame({
+            'plc_id': frame['plc_id'],
+            'timestamp': frame['timestamp'],
+            'model_version': pipeline['version'],
+            'predicted_at': datetime.now(),
+            'needs_maintenance': needs_maintenance,
+            'probability': probability
+        })
+        for name, values in rul.items():
+            output[name] = values
+        timings['score_s'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        written += _write_chunk(index, part, output)
+        timings['write_s'] += time.perf_counter() - t
+        rows += len(frame)
+    return dict(timings, index=index, rows=rows, written=written, cpu_s=time.process_time() - cpu_start)
+
+
+class BackfillJob:
+    """
+    Puntuación por lotes de un rango histórico de plc_mech.
+
+    El rango se divide en tramos de tiempo que un pool de procesos puntúa en
+    paralelo; cada proceso carga el modelo una sola vez. Cada tramo se guarda
+    en bloque (COPY + INSERT ... ON CONFLICT DO NOTHING en predictions, o un
+    fichero por bloque) y se anota en un checkpoint JSON. Al relanzar el mismo
+    trabajo solo se procesan los tramos pendientes; un tramo interrumpido se
+    repite entero sin duplicar filas. Cada tramo se lee en bloques de
+    max_rows filas, así que la memoria por proceso no crece con la flota.
+
+    Las lecturas crudas solo existen mientras las conserva la retención de
+    plc_mech (nivel raw); un rango más antiguo se puntúa incompleto o vacío.
+    """
+
+    def __init__(self, config, start, end, version=None, chunk_hours=6, n_workers=None,
+                 checkpoint_path='backfill_checkpoint.json', output_dir=None, source='db',
+                 warmup_minutes=15, rul_step_s=60, max_rows=200000, logger=None):
+        self.config = config
+        self.start = start
+        self.end = end
+        self.chunk_hours = chunk_hours
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.checkpoint_path = checkpoint_path
+        self.output_dir = output_dir
+        self.source = source
+        self.warmup_minutes = warmup_minutes
+        self.rul_step_s = rul_step_s
+        self.max_rows = max_rows
+        self.logger = logger or logging.getLogger('BackfillJob')
+
+        from model_registry import ModelRegistry
+        self.version = version or ModelRegistry.from_config(config).current_version()
+        if self.version is None:
+            raise RuntimeError("No hay ningún modelo registrado")
+        self.chunks = time_chunks(start, end, chunk_hours)
+
+    def job_key(self):
+        """Identifica el trabajo: un checkpoint solo se reutiliza para el mismo trabajo"""
+        return {
+            'start': self.start.isoformat(), 'end': self.end.isoformat(), 'version': self.version,
+            'chunk_hours': self.chunk_hours, 'output_dir': self.output_dir,
+            'source': self.source if self.source == 'db' else 'synthetic'
+        }
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return set(), 0
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('job') != self.job_key():
+            self.logger.warning("El checkpoint es de otro trabajo; se empieza desde el principio")
+            return set(), 0
+        return set(checkpoint.get('done', [])), checkpoint.get('rows', 0)
+
+    def save_checkpoint(self, done, rows):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'job': self.job_key(), 'done': sorted(done), 'rows': rows,
+                       'updated_at': datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self, progress_every_s=10):
+        """
+        Procesa los tramos pendientes.
+
+        Returns:
+            dict con filas, tramos, tiempo total, filas/s y tiempo por fase
+        """
+        done, previous_rows = self.load_checkpoint()
+        pending = [(i, start, end) for i, (start, end) in enumerate(self.chunks) if i not in done]
+        raw_days = raw_retention_days(self.config)
+        if self.source == 'db' and raw_days is not None and self.start < datetime.now() - timedelta(days=raw_days):
+            self.logger.warning(
+                f"El rango empieza antes de los {raw_days} días de plc_mech crudo que conserva la retención: "
+                "los tramos anteriores saldrán incompletos o vacíos"
+            )
+        self.logger.info(
+            f"[INFO] {len(self.chunks)} tramos de {self.chunk_hours} h, {len(done)} ya hechos, "
+            f"{len(pending)} pendientes con {self.n_workers} procesos (modelo {self.version})"
+        )
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+        elif self.source == 'db':
+            ensure_predictions_table(create_engine(database_url(self.config)))
+
+        settings = {
+            'config': self.config, 'version': self.version,
+            'source': self.source, 'output_dir': self.output_dir,
+            'warmup_minutes': self.warmup_minutes, 'rul_step_s': self.rul_step_s,
+            'max_rows': self.max_rows
+        }
+        totals = {'rows': 0, 'written': 0, 'read_s': 0.0, 'score_s': 0.0, 'write_s': 0.0, 'cpu_s': 0.0}
+        failed = []
+        started = time.perf_counter()
+        last_progress = started
+        with ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker,
+                                 initargs=(settings,)) as pool:
+            futures = {pool.submit(_score_chunk, *chunk): chunk for chunk in pending}
+            for future in as_completed(futures):
+                index, start, end = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error(f"[ERROR] Tramo {index} ({start} - {end}) fallido: {e}")
+                    failed.append(index)
+                    continue
+                for name in totals:
+                    totals[name] += result[name]
+                done.add(index)
+                self.save_checkpoint(done, previous_rows + totals['rows'])
+                if time.perf_counter() - last_progress >= progress_every_s:
+                    last_progress = time.perf_counter()
+                    elapsed = last_progress - started
+                    self.logger.info(
+                        f"[STATUS] {len(done)}/{len(self.chunks)} tramos, {totals['rows']} filas, "
+                        f"{totals['rows'] / elapsed:,.0f} filas/s"
+                    )
+
+        wall_s = time.perf_counter() - started
+        return dict(
+            totals,
+            chunks=len(self.chunks),
+            chunks_done=len(done),
+            chunks_failed=failed,
+            total_rows=previous_rows + totals['rows'],
+            wall_time_s=wall_s,
+            rows_per_s=totals['rows'] / wall_s if wall_s > 0 else None,
+            n_workers=self.n_workers,
+            version=self.version
+        )
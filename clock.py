@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import datetime
+import pandas as pd
+
+
+class SystemClock:
+    """Reloj real: la hora de las alertas y los intervalos del agente en servicio"""
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def advance_to(self, timestamp):
+        pass
+
+
+class VirtualClock:
+    """
+    Reloj virtual para reproducir histórico: la hora es la de la última
+    lectura procesada, así que alertas e intervalos (p. ej. un pase de
+    pronóstico por minuto) siguen el tiempo de los datos y no el de la
+    máquina que reproduce. Solo avanza.
+    """
+
+    def __init__(self, start=None):
+        self._now = pd.Timestamp(start) if start is not None else None
+
+    def now(self):
+        return self._now.to_pydatetime() if self._now is not None else datetime.now()
+
+    def time(self):
+        # Solo se usan diferencias entre instantes: basta un epoch coherente
+        return self._now.value / 1e9 if self._now is not None else time.time()
+
+    def advance_to(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        if self._now is None or timestamp > self._now:
+            self._now = timestamp
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+
+# Configurar salida para UTF-8 en Windows
+if sys.platform.startswith('win'):
+    sys.stdout.reconfigure(encoding='utf-8')
+
+SENSOR_COLUMNS = [
+    'temperature', 'vibration', 'pressure', 'rotation_speed',
+    'power_consumption', 'noise_level', 'oil_level', 'humidity', 'wear_level'
+]
+
+# Niveles de retención: cada uno se calcula a partir del anterior
+DEFAULT_TIERS = [
+    {'name': 'raw', 'table': 'plc_mech', 'bucket': None, 'retention_days': 35},
+    {'name': '1m', 'table': 'plc_mech_1m', 'bucket': 'minute', 'retention_days': 90},
+    {'name': '1h', 'table': 'plc_mech_1h', 'bucket': 'hour', 'retention_days': None}
+]
+
+BUCKET_SIZES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+
+
+def raw_min_days(config):
+    """
+    Días mínimos de plc_mech crudo: entrenamiento, reentrenamiento y holdout
+    de evaluación lo leen, así que nunca se borra nada más reciente.
+    """
+    return max(
+        config.get('training_data', {}).get('days', 30),
+        config.get('evaluation', {}).get('holdout', {}).get('days', 7)
+    )
+
+
+def raw_retention_days(config):
+    """Días de plc_mech crudo que conserva la retención (None = sin límite)"""
+    tiers = config.get('retention', {}).get('tiers', DEFAULT_TIERS)
+    days = next((tier.get('retention_days') for tier in tiers if tier['bucket'] is None), None)
+    return None if days is None else max(days, raw_min_days(config))
+
+
+def create_index_concurrently(engine, name, table, columns):
+    """
+    Crea un índice sin bloquear las escrituras de la tabla.
+
+    CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción, así que
+    se ejecuta en una conexión en autocommit. Si una construcción anterior se
+    interrumpió, el índice queda marcado como inválido y IF NOT EXISTS no lo
+    repararía: se elimina y se vuelve a crear.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        valid = conn.execute(text("""
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name
+        """), {'name': name}).scalar()
+        if valid:
+            return False
+        if valid is not None:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+        return True
+
+
+def floor_bucket(ts, bucket):
+    if bucket == 'minute':
+        return ts.replace(second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class RetentionManager:
+    """
+    Compactación por niveles de plc_mech (raw -> 1 minuto -> 1 hora).
+
+    Cada nivel agregado guarda un watermark en retention_state: todo lo anterior
+    ya está compactado. Los lotes son ventanas de tiempo acotadas que se insertan
+    con ON CONFLICT DO UPDATE, así que repetir un lote tras una caída no duplica
+    nada y el trabajo se reanuda desde el último watermark confirmado.
+    """
+
+    def __init__(self, config_path='config.json'):
+        self.setup_logging()
+        self.load_config(config_path)
+        self.setup_database_connection()
+
+        retention = self.config.get('retention', {})
+        self.tiers = retention.get('tiers', DEFAULT_TIERS)
+        self.batch_target_rows = retention.get('batch_target_rows', 50000)
+        self.initial_batch_minutes = retention.get('initial_batch_minutes', 60)
+        self.max_delete_rows = retention.get('max_delete_rows', 20000)
+        self.duty_cycle = retention.get('duty_cycle', 0.2)
+        self.lock_timeout_ms = retention.get('lock_timeout_ms', 500)
+        self.statement_timeout_ms = retention.get('statement_timeout_ms', 30000)
+        self.closing_lag = timedelta(seconds=retention.get('closing_lag_seconds', 120))
+        self.interval_seconds = retention.get('interval_seconds', 300)
+        self.raw_min_days = raw_min_days(self.config)
+        for tier in self.tiers:
+            days = tier.get('retention_days')
+            if tier['bucket'] is None and days is not None and days < self.raw_min_days:
+                self.logger.warning(
+                    f"Retención de {tier['table']} ({days} días) menor que la ventana de entrenamiento; "
+                    f"se conservan {self.raw_min_days} días"
+                )
+
+        self.ready = False
+        self.batch_windows = {}
+        self.stats = {
+            tier['name']: {
+                'batches': 0, 'rows_read': 0, 'buckets_written': 0,
+                'rows_deleted': 0, 'watermark': None, 'lag_seconds': None,
+                'last_batch_seconds': 0.0
+            }
+            for tier in self.tiers
+        }
+
+    def setup_logging(self):
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler('retention.log', encoding='utf-8'),
+                logging.StreamHandler()
+            ]
+        )
+        self.logger = logging.getLogger(__name__)
+
+    def load_config(self, config_path):
+        with open(config_path, 'r') as f:
+            self.config = json.load(f)
+
+    def setup_database_connection(self):
+        pg = self.config['postgres_local']
+        db_url = f"postgresql://{pg['user']}:{pg['password']}@{pg['host']}:{pg['port']}/{pg['dbname']}"
+        self.engine = create_engine(db_url)
+
+    def create_tables(self):
+        """Crea las tablas agregadas y la tabla de estado si no existen"""
+        aggregate_columns = ',\n'.join(
+            f"{col}_avg FLOAT, {col}_min FLOAT, {col}_max FLOAT" for col in SENSOR_COLUMNS
+        )
+        with self.engine.begin() as conn:
+            for tier in self.tiers[1:]:
+                conn.execute(text(f"""
+                    CREATE TABLE IF NOT EXISTS {tier['table']} (
+                        bucket TIMESTAMP NOT NULL,
+                        plc_id VARCHAR(50) NOT NULL,
+                        n_samples INTEGER NOT NULL,
+                        {aggregate_columns},
+                        machine_age INTEGER,
+                        maintenance_needed BOOLEAN,
+                        PRIMARY KEY (plc_id, bucket)
+                    )
+                """))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {tier['table']}_bucket_idx ON {tier['table']} (bucket)"
+                ))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS retention_state (
+                    tier VARCHAR(20) PRIMARY KEY,
+                    watermark TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP NOT NULL
+                )
+            """))
+
+    def setup(self):
+        """
+        Preparación única por proceso: tablas agregadas e índice por timestamp
+        de plc_mech. El índice se construye sin bloquear la ingesta y fuera de
+        las pasadas periódicas.
+        """
+        self.create_tables()
+        if create_index_concurrently(self.engine, 'plc_mech_timestamp_idx', 'plc_mech', 'timestamp'):
+            self.logger.info("[INFO] Índice plc_mech_timestamp_idx creado")
+        self.ready = True
+
+    def _aggregate_select(self, source, bucket):
+        """SELECT que agrega el nivel origen en buckets del nivel destino"""
+        if source['bucket'] is None:
+            # Desde datos raw
+            columns = ',\n'.join(
+                f"AVG({col}), MIN({col}), MAX({col})" for col in SENSOR_COLUMNS
+            )
+            return f"""
+                SELECT date_trunc('{bucket}', timestamp) AS bucket, plc_id, COUNT(*),
+                       {columns},
+                       MAX(machine_age), BOOL_OR(maintenance_needed)
+                FROM {source['table']}
+                WHERE timestamp >= :start AND timestamp < :end
+                GROUP BY 1, 2
+            """
+        # Desde otro nivel agregado: media ponderada por número de muestras
+        columns = ',\n'.join(
+            f"SUM({col}_avg * n_samples) / SUM(n_samples), MIN({col}_min), MAX({col}_max)"
+            for col in SENSOR_COLUMNS
+        )
+        return f"""
+            SELECT date_trunc('{bucket}', bucket) AS bucket, plc_id, SUM(n_samples),
+                   {columns},
+                   MAX(machine_age), BOOL_OR(maintenance_needed)
+            FROM {source['table']}
+            WHERE bucket >= :start AND bucket < :end
+            GROUP BY 1, 2
+        """
+
+    def _time_column(self, tier):
+        return 'timestamp' if tier['bucket'] is None else 'bucket'
+
+    def get_watermark(self, conn, tier):
+        row = conn.execute(
+            text("SELECT watermark FROM retention_state WHERE tier = :tier"),
+            {'tier': tier['name']}
+        ).fetchone()
+        return row[0] if row else None
+
+    def _initial_watermark(self, conn, source, target):
+        """Primer watermark: el bucket del dato más antiguo del nivel origen"""
+        oldest = conn.execute(
+            text(f"SELECT MIN({self._time_column(source)}) FROM {source['table']}")
+        ).scalar()
+        return floor_bucket(oldest, target['bucket']) if oldest else None
+
+    def _apply_timeouts(self, conn):
+        # Ceder ante la ingesta: no esperar bloqueos ni alargar sentencias
+        conn.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+        conn.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}"))
+
+    def compact_batch(self, source, target, horizon):
+        """
+        Compacta una ventana acotada del nivel origen en el nivel destino.
+
+        Returns:
+            True si queda trabajo pendiente hasta el horizonte
+        """
+        size = BUCKET_SIZES[target['bucket']]
+        window = self.batch_windows.get(target['name'], timedelta(minutes=self.initial_batch_minutes))
+        window = max(size, window - window % size)
+        stats = self.stats[target['name']]
+
+        started = time.time()
+        with self.engine.begin() as conn:
+            self._apply_timeouts(conn)
+            watermark = self.get_watermark(conn, target) or self._initial_watermark(conn, source, target)
+            if watermark is None or watermark >= horizon:
+                stats['watermark'] = watermark
+                return False
+
+            end = min(watermark + window, horizon)
+            select = self._aggregate_select(source, target['bucket'])
+            value_columns = ', '.join(
+                f"{col}_avg, {col}_min, {col}_max" for col in SENSOR_COLUMNS
+            )
+            updates = ', '.join(
+                f"{col} = EXCLUDED.{col}"
+                for col in ['n_samples', 'machine_age', 'maintenance_needed'] + [
+                    f"{c}_{agg}" for c in SENSOR_COLUMNS for agg in ('avg', 'min', 'max')
+                ]
+            )
+            rows = conn.execute(text(f"""
+                INSERT INTO {target['table']} (
+                    bucket, plc_id, n_samples, {value_columns}, machine_age, maintenance_needed
+                )
+                {select}
+                ON CONFLICT (plc_id, bucket) DO UPDATE SET {updates}
+                RETURNING n_samples
+            """), {'start': watermark, 'end': end}).fetchall()
+            buckets = len(rows)
+            rows_read = sum(row[0] for row in rows)
+
+            conn.execute(text("""
+                INSERT INTO retention_state (tier, watermark, updated_at)
+                VALUES (:tier, :watermark, NOW())
+                ON CONFLICT (tier) DO UPDATE SET watermark = EXCLUDED.watermark,
+                                                 updated_at = EXCLUDED.updated_at
+            """), {'tier': target['name'], 'watermark': end})
+
+        elapsed = time.time() - started
+        stats['batches'] += 1
+        stats['rows_read'] += int(rows_read)
+        stats['buckets_written'] += buckets
+        stats['watermark'] = end
+        stats['lag_seconds'] = (datetime.now() - end).total_seconds()
+        stats['last_batch_seconds'] = elapsed
+
+        # Ajustar la ventana para acercarse al objetivo de filas leídas por lote
+        if source['bucket'] is not None:
+            rows_read = buckets * (size // BUCKET_SIZES[source['bucket']])
+        if rows_read:
+            factor = min(4.0, max(0.25, self.batch_target_rows / float(rows_read)))
+            self.batch_windows[target['name']] = (end - watermark) * factor
+
+        self.throttle(elapsed)
+        return end < horizon
+
+    def purge_batch(self, tier, cutoff):
+        """Elimina un lote acotado de filas anteriores al cutoff. Devuelve filas borradas"""
+        column = self._time_column(tier)
+        started = time.time()
+        with self.engine.begin() as conn:
+            self._apply_timeouts(conn)
+            result = conn.execute(text(f"""
+                DELETE FROM {tier['table']}
+                WHERE ctid IN (
+                    SELECT ctid FROM {tier['table']}
+                    WHERE {column} < :cutoff
+                    LIMIT :limit
+                )
+            """), {'cutoff': cutoff, 'limit': self.max_delete_rows})
+            deleted = max(0, result.rowcount)
+
+        self.stats[tier['name']]['rows_deleted'] += deleted
+        self.throttle(time.time() - started)
+        return deleted
+
+    def throttle(self, elapsed):
+        """Duerme lo suficiente para no superar el ciclo de trabajo configurado"""
+        if 0 < self.duty_cycle < 1:
+            time.sleep(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+
+    def run_once(self):
+        """Ejecuta una pasada completa: compacta todos los niveles y aplica la retención"""
+        if not self.ready:
+            self.setup()
+        now = datetime.now()
+
+        for source, target in zip(self.tiers, self.tiers[1:]):
+            # Solo se compactan buckets cerrados y ya compactados en el nivel origen
+            horizon = floor_bucket(now - self.closing_lag, target['bucket'])
+            if source['bucket'] is not None:
+                source_watermark = self.stats[source['name']]['watermark']
+                if source_watermark is None:
+                    break
+                horizon = min(horizon, floor_bucket(source_watermark, target['bucket']))
+            while self.compact_batch(source, target, horizon):
+                pass
+
+        for tier, next_tier in zip(self.tiers, self.tiers[1:] + [None]):
+            if tier.get('retention_days') is None:
+                continue
+            days = tier['retention_days']
+            if tier['bucket'] is None:
+                days = max(days, self.raw_min_days)
+            cutoff = now - timedelta(days=days)
+            # Nunca borrar lo que el nivel siguiente aún no ha compactado
+            if next_tier is not None:
+                compacted = self.stats[next_tier['name']]['watermark']
+                if compacted is None:
+                    continue
+                cutoff = min(cutoff, compacted)
+            while self.purge_batch(tier, cutoff) >= self.max_delete_rows:
+                pass
+
+        self.log_progress()
+
+    def log_progress(self):
+        for name, stats in self.stats.items():
+            lag = f"{stats['lag_seconds']:.0f}s" if stats['lag_seconds'] is not None else 'N/A'
+            self.logger.info(
+                f"[STATUS] Retención {name}: lotes={stats['batches']} "
+                f"filas_leidas={stats['rows_read']} buckets={stats['buckets_written']} "
+                f"borradas={stats['rows_deleted']} watermark={stats['watermark']} retraso={lag}"
+            )
+
+    def get_stats(self):
+        return {name: dict(stats) for name, stats in self.stats.items()}
+
+    def run(self):
+        """Bucle en segundo plano: una pasada cada interval_seconds"""
+        self.logger.info("[INFO] Iniciando compactación por niveles...")
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"[ERROR] Error en compactación: {e}")
+            time.sleep(self.interval_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compactación y retención por niveles de plc_mech')
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Ejecuta una sola pasada y termina')
+    args = parser.parse_args()
+
+    manager = RetentionManager()
+    if args.una_vez:
+        manager.run_once()
+    else:
+        manager.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import time
+from datetime import datetime
+import numpy as np
+from fleet_state import MachineIndex, rank_within_group, to_epoch_seconds
+
+DEFAULT_RULES_PATH = 'failure_rules.json'
+
+# Operador -> (signo, estricto): x > v  <=>  +1 * (x - v) > 0 ; x < v  <=>  -1 * (x - v) > 0
+OPERATORS = {'>': (1.0, True), '>=': (1.0, False), '<': (-1.0, True), '<=': (-1.0, False)}
+
+
+def threshold_rules(thresholds, units=None):
+    """Convierte los umbrales warning/critical por variable en reglas de una condición"""
+    units = units or {}
+    rules = []
+    for feature, spec in thresholds.items():
+        op = '>' if spec.get('direction', 'above') == 'above' else '<'
+        sign = OPERATORS[op][0]
+        for severity in ('warning', 'critical'):
+            if spec.get(severity) is None:
+                continue
+            value = spec[severity]
+            rules.append({
+                'name': f'{feature}_{severity}',
+                'description': f"{feature} {op} {value} {units.get(feature, '')}".rstrip(),
+                'severity': severity,
+                'for_seconds': spec.get('for_seconds', 0),
+                'conditions': [{
+                    'feature': feature, 'op': op, 'value': value,
+                    'clear': value - sign * spec.get('hysteresis', 0.0)
+                }]
+            })
+    return rules
+
+
+class FailureRuleEngine:
+    """
+    Motor de reglas de fallo vectorizado con estado por máquina.
+
+    Las reglas se definen en failure_rules.json y se compilan en arrays (una
+    columna por condición), de modo que una sola llamada evalúa todas las
+    reglas sobre todo un lote o toda la flota. Cada regla puede exigir que se
+    cumpla durante for_seconds antes de activarse y tiene histéresis: una vez
+    activa, solo se desactiva cuando alguna condición cruza su valor clear. El
+    estado (activa y desde cuándo se cumple) se guarda por máquina y se
+    actualiza de forma incremental con cada lectura.
+
+    Los umbrales warning/critical del fichero son para mostrar y pronosticar;
+    solo generan reglas propias con threshold_alerts (desactivado por defecto).
+    """
+
+    def __init__(self, rules, features, units=None, thresholds=None):
+        self.features = list(features)
+        self.units = units or {}
+        self.thresholds = thresholds or {}
+        self.rules = list(rules)
+        self.logger = logging.getLogger('FailureRuleEngine')
+
+        feature_idx, signs, strict, values, clears, starts = [], [], [], [], [], []
+        for rule in self.rules:
+            starts.append(len(feature_idx))
+            if not rule.get('conditions'):
+                raise ValueError(f"La regla {rule.get('name')} no tiene condiciones")
+            for condition in rule['conditions']:
+                if condition['feature'] not in self.features:
+                    raise ValueError(f"Variable desconocida en la regla {rule['name']}: {condition['feature']}")
+                if condition['op'] not in OPERATORS:
+                    raise ValueError(f"Operador no soportado en la regla {rule['name']}: {condition['op']}")
+                sign, is_strict = OPERATORS[condition['op']]
+                feature_idx.append(self.features.index(condition['feature']))
+                signs.append(sign)
+                strict.append(is_strict)
+                values.append(condition['value'])
+                clears.append(condition.get('clear', condition['value']))
+
+        self.condition_feature = np.asarray(feature_idx, dtype=np.intp)
+        self.condition_sign = np.asarray(signs)
+        self.condition_strict = np.asarray(strict)
+        self.condition_value = np.asarray(values, dtype=np.float64)
+        self.condition_clear = np.asarray(clears, dtype=np.float64)
+        self.rule_starts = np.asarray(starts, dtype=np.intp)
+        self.for_seconds = np.asarray([r.get('for_seconds', 0) for r in self.rules], dtype=np.float64)
+        self.names = [r['name'] for r in self.rules]
+
+        self.index = MachineIndex()
+        self.index.register('active', (len(self.rules),), dtype=bool, fill=False)
+        self.index.register('pending_since', (len(self.rules),), fill=np.nan)
+        self.stats = {'rows': 0, 'batches': 0, 'seconds': 0.0, 'activations': 0}
+
+    @classmethod
+    def from_file(cls, path, features, threshold_alerts=False):
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        units = spec.get('units', {})
+        thresholds = spec.get('thresholds', {})
+        rules = spec.get('rules', [])
+        if threshold_alerts:
+            rules = rules + threshold_rules(thresholds, units)
+        return cls(rules, features, units=units, thresholds=thresholds)
+
+    @classmethod
+    def from_config(cls, config, features):
+        rules_config = config.get('failure_rules', {})
+        path = rules_config.get('path', DEFAULT_RULES_PATH)
+        if not os.path.isabs(path) and not os.path.exists(path):
+            # Por defecto, el fichero que acompaña al código
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        return cls.from_file(path, features, threshold_alerts=rules_config.get('threshold_alerts', False))
+
+    def _compare(self, V, reference):
+        d = self.condition_sign * (V - reference)
+        return np.where(self.condition_strict, d > 0, d >= 0)
+
+    def evaluate(self, X):
+        """
+        Evalúa todas las reglas sin estado.
+
+        Returns:
+            (trigger, hold): arrays (n, n_reglas); trigger es la condición de
+            activación y hold la de permanencia (umbrales clear)
+        """
+        V = np.asarray(X, dtype=np.float64)[:, self.condition_feature]
+        trigger = np.logical_and.reduceat(self._compare(V, self.condition_value), self.rule_starts, axis=1)
+        hold = np.logical_and.reduceat(self._compare(V, self.condition_clear), self.rule_starts, axis=1)
+        return trigger, hold
+
+    def update(self, plc_ids, timestamps, X):
+        """
+        Aplica un lote de lecturas al estado de cada máquina.
+
+        Las lecturas de una misma máquina se procesan en el orden del lote.
+
+        Returns:
+            array bool (n, n_reglas) con las reglas activas tras cada lectura
+        """
+        started = time.perf_counter()
+        n = len(X)
+        if n == 0:
+            return np.zeros((0, len(self.rules)), dtype=bool)
+        rows = self.index.indices(list(plc_ids))
+        ts = to_epoch_seconds(timestamps)[:, None]
+        trigger, hold = self.evaluate(X)
+        active = self.index.array('active')
+        pending = self.index.array('pending_since')
+        result = np.empty_like(trigger)
+
+        # Por rondas: en cada una, cada máquina aparece como mucho una vez
+        ranks = rank_within_group(rows)
+        order = np.argsort(ranks, kind='stable')
+        bounds = np.searchsorted(ranks[order], np.arange(ranks.max() + 2))
+        for r in range(len(bounds) - 1):
+            sel = order[bounds[r]:bounds[r + 1]]
+            machines = rows[sel]
+            was_active = active[machines]
+            since = np.where(trigger[sel], np.fmin(pending[machines], ts[sel]), np.nan)
+            # fmin ignora NaN: si no había inicio pendiente se toma el timestamp actual
+            now_active = np.where(was_active, hold[sel], trigger[sel] & (ts[sel] - since >= self.for_seconds))
+            self.stats['activations'] += int((now_active & ~was_active).sum())
+            active[machines] = now_active
+            pending[machines] = since
+            result[sel] = now_active
+
+        self.stats['rows'] += n
+        self.stats['batches'] += 1
+        self.stats['seconds'] += time.perf_counter() - started
+        return result
+
+    def describe(self, active, timestamp=None):
+        """
+        Lista de patrones activos por fila, en el formato de las alertas.
+
+        timestamp puede ser un instante común o uno por fila (la hora de cada
+        lectura); por defecto, ahora.
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+        per_row = np.ndim(timestamp) > 0
+        patterns = [[] for _ in range(len(active))]
+        for row, rule in zip(*np.nonzero(active)):
+            patterns[row].append({
+                'pattern': self.names[rule],
+                'description': self.rules[rule].get('description', self.names[rule]),
+                'severity': self.rules[rule].get('severity', 'warning'),
+                'timestamp': timestamp[row] if per_row else timestamp
+            })
+        return patterns
+
+    def active_rules(self, plc_id):
+        """Reglas activas ahora mismo para una máquina"""
+        row = self.index.lookup([plc_id])[0]
+        if row < 0:
+            return []
+        return [self.names[i] for i in np.flatnonzero(self.index.array('active')[row])]
+
+    def get_stats(self):
+        rows = self.stats['rows']
+        return {
+            'rules': len(self.rules),
+            'machines': len(self.index),
+            'rows': rows,
+            'batches': self.stats['batches'],
+            'activations': self.stats['activations'],
+            'rows_per_s': rows / self.stats['seconds'] if self.stats['seconds'] > 0 else None
+        }
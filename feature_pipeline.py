@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import logging
+import numpy as np
+
+# Columnas de entrada del modelo, en orden. Cualquier cambio en la lista, el
+# orden o el cálculo de las features debe subir FEATURE_VERSION: los modelos
+# registrados guardan la versión con la que se entrenaron.
+FEATURE_COLUMNS = [
+    'temperature', 'vibration', 'pressure', 'rotation_speed',
+    'power_consumption', 'noise_level', 'oil_level', 'humidity',
+    'machine_age', 'wear_level'
+]
+
+FEATURE_VERSION = 1
+
+# Las features se guardan y se sirven en float32 (la precisión con la que
+# comparan los árboles); el escalado se calcula en float64
+FEATURE_DTYPE = np.float32
+
+BUILD_BLOCK_ROWS = 8192
+
+logger = logging.getLogger('FeaturePipeline')
+
+
+def feature_metadata(columns=None):
+    """Información de las features que se registra junto al modelo"""
+    return {'feature_version': FEATURE_VERSION, 'features': list(columns or FEATURE_COLUMNS)}
+
+
+def check_feature_version(metadata, columns=None):
+    """
+    Comprueba que un modelo registrado espera las mismas features que este código.
+
+    Returns:
+        True si coinciden (o si el modelo es anterior al versionado de features)
+    """
+    metadata = metadata or {}
+    columns = list(columns or FEATURE_COLUMNS)
+    version = metadata.get('feature_version')
+    features = metadata.get('features')
+    if features is not None and list(features) != columns:
+        logger.warning(f"El modelo espera las features {features} y el pipeline genera {columns}")
+        return False
+    if version is not None and version != FEATURE_VERSION:
+        logger.warning(f"Modelo entrenado con features v{version}; el pipeline actual es v{FEATURE_VERSION}")
+        return False
+    return True
+
+
+def build_features(data, columns=None, dtype=FEATURE_DTYPE, out=None):
+    """
+    Convierte filas crudas en la matriz de features (n, n_features), contigua por filas.
+
+    Cada columna se copia una sola vez directamente en la matriz de salida,
+    sin el DataFrame intermedio de data[columns] ni una conversión a float64.
+
+    Args:
+        data: DataFrame, dict de columnas, lista de dicts (mensajes del stream)
+            o array (n, n_features) ya en el orden de columns
+        columns: columnas en orden (por defecto FEATURE_COLUMNS)
+        out: array de salida reutilizable (n, n_features) de tipo dtype
+
+    Returns:
+        array (n, n_features) de tipo dtype
+    """
+    columns = columns or FEATURE_COLUMNS
+    if isinstance(data, np.ndarray):
+        X = data if data.ndim == 2 else data.reshape(1, -1)
+        if X.shape[1] != len(columns):
+            raise ValueError(f"Se esperaban {len(columns)} features y llegaron {X.shape[1]}")
+        if out is None:
+            return np.ascontiguousarray(X, dtype=dtype)
+        out[...] = X
+        return out
+
+    if isinstance(data, (list, tuple)):
+        # Mensajes: una pasada por fila sin construir un DataFrame
+        if out is None:
+            return np.array([[row[column] for column in columns] for row in data], dtype=dtype).reshape(
+                len(data), len(columns)
+            )
+        out[...] = [[row[column] for column in columns] for row in data]
+        return out
+
+    # DataFrame o dict de columnas: se rellena por bloques de filas para que
+    # las escrituras en la matriz (contigua por filas) queden en caché
+    values = [np.asarray(data[column]) for column in columns]
+    n = len(values[0])
+    if out is None:
+        out = np.empty((n, len(columns)), dtype=dtype)
+    for start in range(0, n, BUILD_BLOCK_ROWS):
+        block = out[start:start + BUILD_BLOCK_ROWS]
+        for j, column in enumerate(values):
+            block[:, j] = column[start:start + BUILD_BLOCK_ROWS]
+    return out
+
+
+def scale_features(X, scaler, block_rows=65536, out=None):
+    """
+    Aplica el scaler del pipeline por bloques: cálculo en float64, resultado en float32.
+
+    Es la misma operación que hace el bosque aplanado y la que hace el scaler
+    sobre float64, así que entrenamiento y servicio escalan igual. Con out=X
+    se escala sin copiar la matriz completa.
+    """
+    if scaler is None:
+        return X
+    if out is None:
+        out = np.empty(X.shape, dtype=FEATURE_DTYPE)
+    # StandardScaler (o compatible): (x - mean_) / scale_; otros transformadores con su transform
+    standard = hasattr(scaler, 'with_mean') and hasattr(scaler, 'scale_')
+    mean = getattr(scaler, 'mean_', None) if standard and scaler.with_mean else None
+    scale = scaler.scale_ if standard and scaler.with_std else None
+    for start in range(0, len(X), block_rows):
+        block = np.array(X[start:start + block_rows], dtype=np.float64)
+        if not standard:
+            out[start:start + block_rows] = scaler.transform(block)
+            continue
+        if mean is not None:
+            block -= mean
+        if scale is not None:
+            block /= scale
+        out[start:start + block_rows] = block
+    return out
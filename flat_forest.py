@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Inferencia de bosques de árboles sobre arrays planos de NumPy.
+
+Este módulo solo depende de NumPy: en tiempo de servicio no se importa
+scikit-learn. El exportador recibe el modelo ya entrenado y no lo importa.
+"""
+import numpy as np
+
+FOREST_FILE = 'forest.npz'
+LEAF = -1
+
+
+class FlatForest:
+    """
+    Bosque de clasificación aplanado en arrays contiguos.
+
+    Todos los nodos de todos los árboles se concatenan: feature, threshold,
+    left y right son arrays de n_nodos (feature = -1 en las hojas) y roots
+    tiene la raíz de cada árbol. La evaluación avanza todos los pares
+    (fila, árbol) a la vez, un nivel por iteración, y retira de la lista activa
+    los que ya llegaron a una hoja, así cada nivel solo cuesta lo que queda por
+    recorrer. El scaler del pipeline se incorpora como media y escala.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes,
+                 mean=None, scale=None, missing_left=None, features=None, block_rows=1024):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.mean = mean
+        self.scale = scale
+        self.missing_left = missing_left
+        self.features = list(features) if features is not None else None
+        self.block_rows = block_rows
+        # Copias en intp para indexar sin conversiones; children[:, 1] es la rama izquierda
+        self._feature = feature.astype(np.intp)
+        self._children = np.stack([right, left], axis=1).astype(np.intp)
+        self._roots = roots.astype(np.intp)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        arrays = [self.feature, self.threshold, self.left, self.right, self.value, self.roots,
+                  self.mean, self.scale, self.missing_left]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def _prepare(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.mean is not None:
+            X = (X - self.mean) / self.scale
+        # Los árboles de sklearn comparan en float32
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def _leaves(self, X):
+        """Índice de la hoja alcanzada por cada fila en cada árbol: (n, n_trees)"""
+        n, n_features = X.shape
+        n_trees = len(self._roots)
+        handle_missing = self.missing_left is not None and np.isnan(X).any()
+        flat_X = X.ravel()
+        leaves = np.empty(n * n_trees, dtype=np.intp)
+        # Pares (fila, árbol) pendientes: posición en leaves, nodo actual y desplazamiento de la fila
+        active = np.arange(n * n_trees)
+        nodes = np.tile(self._roots, n)
+        row_offsets = np.repeat(np.arange(n, dtype=np.intp) * n_features, n_trees)
+        while True:
+            feature = self._feature[nodes]
+            at_leaf = feature < 0
+            if at_leaf.any():
+                leaves[active[at_leaf]] = nodes[at_leaf]
+                pending = ~at_leaf
+                if not pending.any():
+                    break
+                active, nodes, row_offsets, feature = (
+                    active[pending], nodes[pending], row_offsets[pending], feature[pending]
+                )
+            x = flat_X[row_offsets + feature]
+            go_left = x <= self.threshold[nodes]
+            if handle_missing:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = self._children[nodes, go_left.view(np.int8)]
+        return leaves.reshape(n, n_trees)
+
+    def predict_proba(self, X):
+        """Probabilidad por clase, media de las hojas de todos los árboles (como sklearn)"""
+        X = self._prepare(X)
+        out = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), self.block_rows):
+            leaves = self._leaves(X[start:start + self.block_rows])
+            out[start:start + len(leaves)] = self.value[leaves].mean(axis=1)
+        return out
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        """Guarda los arrays sin compresión (sin pickle)"""
+        arrays = {
+            'feature': self.feature, 'threshold': self.threshold, 'left': self.left,
+            'right': self.right, 'value': self.value, 'roots': self.roots,
+            'max_depth': np.array(self.max_depth), 'classes': self.classes_
+        }
+        for name in ('mean', 'scale', 'missing_left'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        if self.features is not None:
+            arrays['features'] = np.array(self.features)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(
+            arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+            arrays['value'], arrays['roots'], int(arrays['max_depth']), arrays['classes'],
+            mean=arrays.get('mean'), scale=arrays.get('scale'),
+            missing_left=arrays.get('missing_left'),
+            features=arrays['features'].tolist() if 'features' in arrays else None
+        )
+
+
+def is_exportable(model):
+    """True si el modelo es un bosque de clasificación de una sola salida"""
+    estimators = getattr(model, 'estimators_', None)
+    return (
+        isinstance(estimators, list) and len(estimators) > 0
+        and all(hasattr(tree, 'tree_') for tree in estimators)
+        and getattr(model, 'n_outputs_', 1) == 1
+        and hasattr(model, 'classes_') and hasattr(model, 'predict_proba')
+    )
+
+
+def export_forest(model, scaler=None, features=None):
+    """
+    Aplana un RandomForestClassifier/ExtraTreesClassifier entrenado.
+
+    Args:
+        model: bosque entrenado
+        scaler: StandardScaler ajustado cuya transformación se incorpora (opcional)
+        features: lista ordenada de columnas de entrada
+
+    Returns:
+        FlatForest equivalente
+    """
+    if not is_exportable(model):
+        raise ValueError(f"No se puede aplanar un modelo {type(model).__name__}")
+
+    features_, thresholds, lefts, rights, values, missing, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == LEAF
+
+        features_.append(np.where(is_leaf, LEAF, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, LEAF, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, LEAF, tree.children_right + offset).astype(np.int32))
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1, keepdims=True)
+        values.append(counts / np.where(totals > 0, totals, 1.0))
+        missing_go_to_left = getattr(tree, 'missing_go_to_left', None)
+        missing.append(np.zeros(n_nodes, dtype=bool) if missing_go_to_left is None
+                       else np.asarray(missing_go_to_left, dtype=bool) & ~is_leaf)
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    missing_left = np.concatenate(missing)
+    mean = scale = None
+    if scaler is not None:
+        mean = np.asarray(scaler.mean_, dtype=np.float64) if getattr(scaler, 'with_mean', True) \
+            else np.zeros(scaler.n_features_in_)
+        scale = np.asarray(scaler.scale_, dtype=np.float64) if getattr(scaler, 'with_std', True) \
+            else np.ones(scaler.n_features_in_)
+
+    return FlatForest(
+        feature=np.concatenate(features_),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max_depth,
+        classes=np.asarray(model.classes_),
+        mean=mean,
+        scale=scale,
+        missing_left=missing_left if missing_left.any() else None,
+        features=features
+    )
+
+
+def check_parity(model, flat, X_raw, scaler=None, tolerance=1e-9):
+    """
+    Compara las probabilidades del bosque aplanado con las de sklearn.
+
+    Returns:
+        (ok, max_abs_diff)
+    """
+    # En servicio las features llegan en float64
+    X_raw = np.asarray(X_raw, dtype=np.float64)
+    X = scaler.transform(X_raw) if scaler is not None else X_raw
+    expected = model.predict_proba(X)
+    actual = flat.predict_proba(X_raw)
+    diff = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    return diff <= tolerance, diff
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+
+def to_epoch_seconds(timestamps):
+    """Timestamps (datetime, texto o epoch) como array float64 de segundos epoch"""
+    values = np.asarray(timestamps)
+    if values.dtype.kind in 'iuf':
+        return values.astype(np.float64)
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+
+
+def rank_within_group(groups):
+    """
+    Posición de cada fila dentro de su grupo, respetando el orden del lote.
+
+    Con groups = [3, 1, 3, 3, 1] devuelve [0, 0, 1, 2, 1]. Las filas con el
+    mismo rango tocan cada una una máquina distinta, así que un estado por
+    máquina se puede actualizar por rondas (rango 0, luego 1, ...) con
+    operaciones vectorizadas y sin perder el orden temporal de cada máquina.
+    """
+    groups = np.asarray(groups)
+    if len(groups) == 0:
+        return np.empty(0, dtype=np.intp)
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    starts = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    positions = np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+    ranks = np.empty(len(groups), dtype=np.intp)
+    ranks[order] = positions
+    return ranks
+
+
+class MachineIndex:
+    """
+    Índice plc_id -> fila para guardar estado por máquina en arrays NumPy.
+
+    Los dueños del estado registran sus arrays con register(); cuando aparece
+    una máquina nueva y no cabe, todos los arrays crecen a la vez (al doble)
+    rellenando las filas nuevas con su valor inicial.
+    """
+
+    def __init__(self, initial_capacity=64):
+        self.rows = {}
+        self.capacity = initial_capacity
+        self._arrays = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def register(self, name, shape=(), dtype=np.float64, fill=0):
+        """Crea un array de estado (capacity, *shape) y lo mantiene al crecer"""
+        self._arrays[name] = (np.full((self.capacity,) + tuple(shape), fill, dtype=dtype), fill)
+        return self._arrays[name][0]
+
+    def array(self, name):
+        return self._arrays[name][0]
+
+    def lookup(self, plc_ids):
+        """Filas de las máquinas indicadas; -1 para las que no están registradas"""
+        return np.fromiter((self.rows.get(plc_id, -1) for plc_id in plc_ids), dtype=np.intp,
+                           count=len(plc_ids))
+
+    def indices(self, plc_ids):
+        """Filas de las máquinas indicadas, dando de alta las nuevas"""
+        for plc_id in pd.unique(np.asarray(plc_ids, dtype=object)):
+            if plc_id not in self.rows:
+                self.rows[plc_id] = len(self.rows)
+        if len(self.rows) > self.capacity:
+            self._grow(len(self.rows))
+        return self.lookup(plc_ids)
+
+    def machine_ids(self):
+        return list(self.rows)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name, (array, fill) in self._arrays.items():
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            self._arrays[name] = (grown, fill)
+        self.capacity = capacity
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import copy
+import logging
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+
+def add_trees(model, X_new, y_new, n_new_trees=10, max_trees=None):
+    """
+    Añade árboles a un bosque ya entrenado usando solo los datos nuevos (warm start).
+
+    Los árboles existentes no se tocan, así que el coste es proporcional a los
+    datos nuevos. Si se supera max_trees se descartan los árboles más antiguos,
+    de modo que el modelo se adapta a los datos recientes y el coste de
+    inferencia queda acotado.
+
+    Args:
+        model: RandomForestClassifier/ExtraTreesClassifier entrenado
+        X_new: features escaladas con el mismo scaler que los árboles existentes
+        y_new: etiquetas de los datos nuevos
+        n_new_trees: árboles a añadir
+        max_trees: máximo de árboles que se conservan (None = sin límite)
+
+    Con warm start sklearn recalcula classes_ a partir de y_new, así que los
+    datos nuevos deben tener exactamente las clases del modelo (p. ej. una
+    semana sin fallos no vale). Si no, la actualización se omite: los datos
+    siguen después del watermark y entran en el próximo intento.
+
+    Returns:
+        Copia del modelo con los árboles nuevos, o None si se omite la actualización
+    """
+    known_classes = set(np.asarray(model.classes_).tolist())
+    new_classes = set(np.unique(y_new).tolist())
+    if new_classes != known_classes:
+        logger.warning(
+            f"Actualización incremental omitida: los datos nuevos tienen las clases {sorted(new_classes)} "
+            f"y el modelo {sorted(known_classes)}"
+        )
+        return None
+
+    updated = copy.deepcopy(model)
+    updated.set_params(warm_start=True, n_estimators=len(updated.estimators_) + n_new_trees)
+    updated.fit(X_new, y_new)
+
+    if max_trees is not None and len(updated.estimators_) > max_trees:
+        updated.estimators_ = updated.estimators_[-max_trees:]
+        updated.set_params(n_estimators=max_trees)
+    updated.set_params(warm_start=False)
+    return updated
+
+
+def update_feature_stats(feature_stats, X_raw):
+    """
+    Actualiza las estadísticas en curso (media/varianza) con las features nuevas.
+
+    El scaler que transforma las entradas del bosque se mantiene congelado,
+    porque los umbrales de los árboles existentes están en sus unidades; estas
+    estadísticas en curso describen la distribución acumulada sin reajustar
+    nada sobre el histórico completo.
+    """
+    stats = copy.deepcopy(feature_stats) if feature_stats is not None else StandardScaler()
+    stats.partial_fit(X_raw)
+    return stats
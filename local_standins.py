@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+import socketserver
+import struct
+import threading
+from email import message_from_bytes
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from notification_channels import mqtt_packet, read_mqtt_packet
+
+
+class _StandinServer:
+    """Arranque y parada en un hilo comunes a los servidores de prueba"""
+
+    def __init__(self, server):
+        self._server = server
+        self._server.standin = self
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Una sesión SMTP: EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP y QUIT"""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('utf-8'))
+
+    def readline(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionResetError
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        server = self.server.standin
+        server._opened(self)
+        sender, recipients, authenticated = None, [], False
+        try:
+            self.reply('220 localhost SMTP de pruebas')
+            while True:
+                line = self.readline()
+                command, _, argument = line.partition(' ')
+                command = command.upper()
+                if command in ('EHLO', 'HELO'):
+                    if command == 'HELO':
+                        self.reply('250 localhost')
+                    else:
+                        self.reply('250-localhost')
+                        self.reply('250-AUTH PLAIN LOGIN')
+                        self.reply('250 8BITMIME')
+                elif command == 'AUTH':
+                    authenticated = self.authenticate(argument)
+                    if authenticated:
+                        server.stats['logins'] += 1
+                        self.reply('235 Autenticado')
+                    else:
+                        self.reply('535 Credenciales incorrectas')
+                elif command == 'NOOP':
+                    self.reply('250 OK')
+                elif command == 'RSET':
+                    sender, recipients = None, []
+                    self.reply('250 OK')
+                elif command == 'QUIT':
+                    self.reply('221 Adiós')
+                    return
+                elif command == 'MAIL':
+                    if server.credentials and not authenticated:
+                        self.reply('530 Autenticación requerida')
+                        continue
+                    failure = server._next_failure()
+                    if failure:
+                        self.reply(f'{failure} Error forzado')
+                        continue
+                    sender, recipients = argument.partition(':')[2].strip(' <>'), []
+                    self.reply('250 OK')
+                elif command == 'RCPT':
+                    recipients.append(argument.partition(':')[2].strip(' <>'))
+                    self.reply('250 OK')
+                elif command == 'DATA':
+                    if sender is None or not recipients:
+                        self.reply('503 Falta MAIL o RCPT')
+                        continue
+                    self.reply('354 Fin con <CRLF>.<CRLF>')
+                    lines = []
+                    while True:
+                        data = self.rfile.readline()
+                        if not data:
+                            raise ConnectionResetError
+                        if data in (b'.\r\n', b'.\n'):
+                            break
+                        lines.append(data[1:] if data.startswith(b'..') else data)
+                    server._received(sender, recipients, b''.join(lines))
+                    sender, recipients = None, []
+                    self.reply('250 Recibido')
+                else:
+                    self.reply('502 Comando no implementado')
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            server._closed(self)
+
+    def authenticate(self, argument):
+        mechanism, _, initial = argument.partition(' ')
+        credentials = self.server.standin.credentials
+        if mechanism.upper() == 'PLAIN':
+            if not initial:
+                self.reply('334 ')
+                initial = self.readline()
+            _, user, password = base64.b64decode(initial).decode('utf-8').split('\0')
+        elif mechanism.upper() == 'LOGIN':
+            if not initial:
+                self.reply('334 ' + base64.b64encode(b'Username:').decode())
+                initial = self.readline()
+            user = base64.b64decode(initial).decode('utf-8')
+            self.reply('334 ' + base64.b64encode(b'Password:').decode())
+            password = base64.b64decode(self.readline()).decode('utf-8')
+        else:
+            return False
+        return credentials is None or credentials == (user, password)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer(_StandinServer):
+    """
+    Servidor SMTP local en un hilo para probar el envío de notificaciones
+    sin un servidor de correo real (sin STARTTLS: usar use_tls=False).
+
+    Guarda los mensajes recibidos y permite forzar fallos: fail_next(n, code)
+    responde con error a los siguientes n MAIL FROM y drop_connections()
+    corta las sesiones abiertas, como un servidor que cierra por inactividad.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, credentials=None):
+        super().__init__(_ThreadingTCPServer((host, port), _SMTPHandler))
+        self.credentials = tuple(credentials) if credentials else None
+        self.messages = []
+        self.stats = {'connections': 0, 'logins': 0, 'messages': 0, 'forced_failures': 0}
+        self._failures = []
+        self._sessions = set()
+
+    def stop(self):
+        self._server.shutdown()
+        self.drop_connections()
+        self._server.server_close()
+
+    def fail_next(self, count=1, code=451):
+        with self._lock:
+            self._failures.extend([code] * count)
+
+    def drop_connections(self):
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                session.connection.shutdown(2)
+            except OSError:
+                pass
+
+    def _next_failure(self):
+        with self._lock:
+            if not self._failures:
+                return None
+            self.stats['forced_failures'] += 1
+            return self._failures.pop(0)
+
+    def _opened(self, session):
+        with self._lock:
+            self._sessions.add(session)
+            self.stats['connections'] += 1
+
+    def _closed(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _received(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=default_policy)
+        with self._lock:
+            self.messages.append({'from': sender, 'to': recipients, 'message': message})
+            self.stats['messages'] += 1
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        standin = self.server.standin
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = standin._next_failure() or 200
+        if status == 200:
+            standin._received(self.path, json.loads(body or b'null'))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalWebhookServer(_StandinServer):
+    """Servidor HTTP local que guarda los JSON recibidos por POST; fail_next(n, status) fuerza errores"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__(ThreadingHTTPServer((host, port), _WebhookHandler))
+        self.requests = []
+        self._failures = []
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f'http://{host}:{port}/alerts'
+
+    def fail_next(self, count=1, status=503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def _next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def _received(self, path, payload):
+        with self._lock:
+            self.requests.append({'path': path, 'json': payload})
+
+
+class _SyslogHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = self.request[0].rstrip(b'\x00\n').decode('utf-8', 'replace')
+        priority, _, message = data[1:].partition('>') if data.startswith('<') else ('', '', data)
+        with self.server.standin._lock:
+            self.server.standin.messages.append({'priority': int(priority) if priority else None, 'message': message})
+
+
+class LocalSyslogServer(_StandinServer):
+    """Receptor syslog UDP local que guarda la prioridad y el texto de cada línea"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__(socketserver.ThreadingUDPServer((host, port), _SyslogHandler))
+        self.messages = []
+
+
+class _MQTTHandler(socketserver.BaseRequestHandler):
+    def read(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionResetError
+            data += chunk
+        return data
+
+    def handle(self):
+        standin = self.server.standin
+        try:
+            packet_type, body = read_mqtt_packet(self.read)
+            if packet_type != 0x10:
+                return
+            with standin._lock:
+                standin.stats['connections'] += 1
+            self.request.sendall(mqtt_packet(0x20, b'\x00\x00'))
+            while True:
+                packet_type, body = read_mqtt_packet(self.read)
+                kind = packet_type & 0xF0
+                if kind == 0x30:
+                    qos = (packet_type >> 1) & 0x03
+                    topic_length = struct.unpack('!H', body[:2])[0]
+                    topic = body[2:2 + topic_length].decode('utf-8')
+                    offset = 2 + topic_length
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                    with standin._lock:
+                        standin.messages.append({'topic': topic, 'qos': qos, 'payload': body[offset:]})
+                    if qos:
+                        self.request.sendall(mqtt_packet(0x40, packet_id))
+                elif kind == 0xC0:
+                    self.request.sendall(mqtt_packet(0xD0))
+                elif kind == 0xE0:
+                    return
+        except (ConnectionError, OSError):
+            pass
+
+
+class LocalMQTTBroker(_StandinServer):
+    """
+    Broker MQTT 3.1.1 mínimo para pruebas: acepta CONNECT, PUBLISH (QoS 0/1),
+    PINGREQ y DISCONNECT y guarda lo publicado. No reenvía a suscriptores.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__(_ThreadingTCPServer((host, port), _MQTTHandler))
+        self.messages = []
+        self.stats = {'connections': 0}
+
+    def payloads(self, topic=None):
+        with self._lock:
+            return [json.loads(m['payload']) for m in self.messages if topic is None or m['topic'] == topic]
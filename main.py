@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import argparse
 import subprocess
 import time
 import signal
@@ -184,9 +185,25 @@ class ProcessManager:
             logger.error(f"Error instalando dependencias: {e}")
             return False
 
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description='Lanza el sistema de mantenimiento predictivo')
+    parser.add_argument('--transporte', choices=['kafka', 'filelog'], default=None,
+                        help='Backend de mensajería (por defecto, el de config.json)')
+    parser.add_argument('--directorio-transporte', default='transport_log',
+                        help='Directorio del log local cuando --transporte es filelog')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     manager = ProcessManager()
     
+    # Los procesos hijos heredan el entorno, así todos usan el mismo transporte
+    if args.transporte:
+        os.environ['PLC_TRANSPORT'] = args.transporte
+        os.environ['PLC_TRANSPORT_DIR'] = os.path.abspath(args.directorio_transporte)
+        logger.info(f"Usando transporte {args.transporte}")
+    
     try:
         # Iniciar productor
         if not manager.run_script('Producer', 'sensor_producerPLC.py'):
@@ -213,11 +230,17 @@ def main():
             manager.stop_all()
             return
         
+        # Compactación y retención de datos en segundo plano
+        if not manager.run_script('Retention', 'data_retention.py'):
+            manager.stop_all()
+            return
+        
         logger.info("""
         🚀 Sistema iniciado correctamente:
         - Producer: Generando datos
         - Consumer: Procesando datos
         - Dashboard: http://localhost:8050
+        - Retention: Compactando datos históricos
         
         Presiona Ctrl+C para detener todos los procesos
         """)
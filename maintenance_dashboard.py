@@ -11,8 +11,8 @@ from datetime import datetime, timedelta
 import logging
 from plotly.subplots import make_subplots
 import numpy as np
-from notification_service import MaintenanceNotificationService
 from predictive_maintenance_agent import PredictiveMaintenanceAgent
+from sensor_cache import SensorWindowCache
 from collections.abc import Sequence
 import sys
 sys.modules['IPython'] = None  # Finge que IPython no está disponible
@@ -27,6 +27,7 @@ class MaintenanceDashboard:
         )
         self.load_config(config_path)
         self.setup_database_connection()
+        self.window_cache = None
         self.setup_layout()
         self.setup_callbacks()
         
@@ -60,8 +61,24 @@ class MaintenanceDashboard:
         db_url = f"postgresql://{pg['user']}:{pg['password']}@{pg['host']}:{pg['port']}/{pg['dbname']}"
         self.engine = create_engine(db_url)
         
+    def get_window_cache(self):
+        """Mapea la caché compartida del consumidor en cuanto exista"""
+        if self.window_cache is None:
+            try:
+                self.window_cache = SensorWindowCache.from_config(self.config, readonly=True)
+            except Exception as e:
+                self.logger.warning(f"Caché de ventana no disponible: {e}")
+        return self.window_cache
+
     def get_sensor_data(self, minutes=5):
         """Obtiene los datos más recientes de los sensores"""
+        # Leer primero de la caché en memoria compartida, sin tráfico a la BD
+        window_cache = self.get_window_cache()
+        if window_cache is not None:
+            df = window_cache.to_frame(minutes=minutes)
+            if not df.empty:
+                return df
+
         try:
             # Verificar último dato recibido
             last_record_query = text("""
@@ -82,7 +99,7 @@ class MaintenanceDashboard:
             
             # Obtener datos normalmente
             query = text("""
-                SELECT timestamp, temperature, vibration, pressure, 
+                SELECT plc_id, timestamp, temperature, vibration, pressure, 
                        rotation_speed, power_consumption, noise_level,
                        oil_level, humidity, machine_age, wear_level, 
                        maintenance_needed
@@ -250,11 +267,14 @@ class MaintenanceDashboard:
 
                 # Calcular KPIs
                 health_status = self.calculate_health_status(latest)
-                time_to_maintenance = self.estimate_maintenance_time(latest)
+                time_to_maintenance = self.estimate_maintenance_time(df, latest)
                 efficiency = self.calculate_efficiency(df)
 
                 # Generar alertas
-                alerts = self.generate_alerts(latest)
+                alerts = self.generate_alerts(
+                    latest, self.get_alert_history(latest),
+                    self.ml_agent.forecast_breaches.get(latest.get('plc_id', 'default'))
+                )
 
                 # Tiempo de actualización
                 update_time = f"Última actualización: {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -505,42 +525,76 @@ class MaintenanceDashboard:
             html.Div("Eficiencia", style={'color': color})
         ])
 
-    def estimate_maintenance_time(self, latest):
+    def estimate_maintenance_time(self, df, latest):
         """Estima tiempo hasta próximo mantenimiento y envía alertas si es necesario"""
-        if latest['wear_level'] >= 0.7:
+        # Misma estimación por tendencia que el agente (solo procesa las lecturas nuevas)
+        predictions = self.ml_agent.get_predictions(df)
+        estimate = predictions['maintenance_time'].get(latest.get('plc_id', 'default'))
+        forecast = self.describe_forecast(predictions['forecasts'].get(latest.get('plc_id', 'default')))
+        if estimate is None or np.isnan(estimate['rul_hours']):
             return html.Div([
-                html.H2("0 días"),
-                html.Div("¡Mantenimiento requerido!", style={'color': 'red'})
+                html.H2("N/A"),
+                html.Div("Datos insuficientes")
             ])
-        
-        wear_rate = latest['wear_level'] / latest['machine_age'] if latest['machine_age'] > 0 else 0
-        if wear_rate > 0:
-            hours_to_maintenance = (0.7 - latest['wear_level']) / wear_rate
-            days = max(0, hours_to_maintenance / 24)
-            
-            # Enviar alerta si quedan menos de 3 días
-            if days < 3:
-                notification_service = MaintenanceNotificationService()
-                notification_service.send_maintenance_alert(
-                    days_to_maintenance=days,
-                    machine_status={
-                        'temperature': latest['temperature'],
-                        'vibration': latest['vibration'],
-                        'wear_level': latest['wear_level']
-                    }
-                )
-            
+
+        days = estimate['rul_hours'] / 24
+        if days <= 0:
             return html.Div([
-                html.H2(f"{int(days)} días"),
-                html.Div("hasta mantenimiento")
-            ])
+                html.H2("0 días"),
+                html.Div("¡Mantenimiento requerido!", style={'color': 'red'})
+            ] + forecast)
+
+        # Enviar alerta si quedan menos de 3 días
+        if days < 3:
+            # El servicio del agente envía en segundo plano: el callback no espera al SMTP,
+            # y el cooldown por máquina es compartido con el resto de procesos
+            self.ml_agent.notification_service.send_maintenance_alert(
+                days_to_maintenance=days,
+                plc_id=latest.get('plc_id', 'default'),
+                machine_status={
+                    'temperature': latest['temperature'],
+                    'vibration': latest['vibration'],
+                    'wear_level': latest['wear_level']
+                }
+            )
+
+        lower, upper = estimate['rul_lower_hours'] / 24, estimate['rul_upper_hours'] / 24
+        interval = (
+            f"entre {lower:.1f} y {upper:.1f} días" if np.isfinite(lower) and np.isfinite(upper)
+            else "hasta mantenimiento"
+        )
         return html.Div([
-            html.H2("N/A"),
-            html.Div("Datos insuficientes")
-        ])
+            html.H2(f"{days:.1f} días" if np.isfinite(days) else "Sin tendencia de desgaste"),
+            html.Div(interval)
+        ] + forecast)
+
+    def describe_forecast(self, forecast, signal='wear_level'):
+        """Líneas con el pronóstico de una señal a cada horizonte (vacío si aún no hay)"""
+        if not forecast or signal not in forecast:
+            return []
+        horizons = ', '.join(
+            f"{h} h: {mean * 100:.0f}% ({lower * 100:.0f}-{upper * 100:.0f}%)"
+            for h, (mean, lower, upper) in forecast[signal]['horizons'].items()
+        )
+        lines = [html.Div(f"Desgaste previsto: {horizons}", className='text-muted small')]
+        hours = forecast[signal]['hours_to_threshold']
+        if np.isfinite(hours) and hours > 0:
+            lines.append(html.Div(f"Umbral de desgaste en {hours:.1f} h según el pronóstico",
+                                  className='text-muted small'))
+        return lines
+
+    def get_alert_history(self, latest, hours=24, limit=5):
+        """Últimas alertas del agente para la máquina (consulta indexada del historial)"""
+        try:
+            return self.ml_agent.get_alert_history(
+                latest.get('plc_id', 'default'), start=datetime.now() - timedelta(hours=hours), limit=limit
+            )
+        except Exception as e:
+            self.logger.warning(f"Historial de alertas no disponible: {e}")
+            return []
 
-    def generate_alerts(self, latest):
-        """Genera alertas basadas en los datos actuales"""
+    def generate_alerts(self, latest, history=None, forecast_breaches=None):
+        """Genera alertas basadas en los datos actuales, el pronóstico y el historial reciente"""
         alerts = []
         
         # Alertas de temperatura
@@ -574,6 +628,15 @@ class MaintenanceDashboard:
                         className='alert alert-warning p-2 m-1')
             )
         
+        # Pronóstico: cruces de umbral previstos en las próximas horas
+        for breach in forecast_breaches or []:
+            level = 'alert-warning' if breach['likelihood'] == 'expected' else 'alert-info'
+            alerts.append(
+                html.Div(f"📈 {breach['signal']} superará {breach['threshold']:g} en {breach['horizon_h']} h "
+                         f"(previsto {breach['forecast']:.2f})",
+                        className=f'alert {level} p-2 m-1')
+            )
+        
         # Si no hay alertas, mostrar estado normal
         if not alerts:
             alerts.append(
@@ -581,6 +644,19 @@ class MaintenanceDashboard:
                         className='alert alert-success p-2 m-1')
             )
         
+        # Historial: alertas generadas por el agente en las últimas horas
+        for alert in reversed(history or []):
+            if alert.get('alert_type') == 'forecast':
+                signals = ', '.join(f"{b['signal']} en {b['horizon_h']} h" for b in alert.get('forecast_breaches', []))
+                summary = f"pronóstico: {signals}"
+            else:
+                patterns = ', '.join(p['pattern'] for p in alert.get('failure_patterns', [])) or 'predicción del modelo'
+                summary = f"{patterns} ({alert.get('probability') or 0:.0%})"
+            alerts.append(
+                html.Div(f"🕒 {alert['timestamp']}: {summary}",
+                        className='alert alert-secondary p-2 m-1')
+            )
+        
         # Retornar contenedor de alertas
         return html.Div(
             alerts,
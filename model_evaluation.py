@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import logging
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+from batch_scoring import score_matrix
+from feature_pipeline import FEATURE_COLUMNS, build_features, check_feature_version
+
+# Columnas del resumen CSV (una fila por evaluación)
+SUMMARY_COLUMNS = [
+    'evaluated_at', 'version', 'holdout_source', 'holdout_rows', 'holdout_start', 'holdout_end',
+    'accuracy', 'precision', 'recall', 'f1', 'roc_auc',
+    'latency_p50_ms', 'latency_p99_ms', 'throughput_rows_s', 'load_s', 'size_mb'
+]
+
+DEFAULT_THRESHOLDS = {
+    'max_f1_drop': 0.02,
+    'max_latency_ratio': 1.5,
+    'max_throughput_drop': 0.25,
+    'max_load_ratio': 2.0
+}
+
+
+def time_split(X, y, timestamps, fraction=0.2):
+    """
+    Separa como holdout la fracción más reciente del histórico.
+
+    El corte se hace en un instante: todas las lecturas de ese instante (de
+    todas las máquinas) quedan en el mismo lado, así que ningún dato del
+    holdout es anterior a uno de entrenamiento.
+
+    Returns:
+        (X_train, y_train, X_holdout, y_holdout, timestamps_holdout)
+    """
+    timestamps = np.asarray(timestamps)
+    order = np.argsort(timestamps, kind='stable')
+    X, y, timestamps = X[order], y[order], timestamps[order]
+    if len(y) == 0:
+        return X, y, X, y, timestamps
+    cut_time = timestamps[min(int(len(y) * (1 - fraction)), len(y) - 1)]
+    cut = int(np.searchsorted(timestamps, cut_time, side='left'))
+    return X[:cut], y[:cut], X[cut:], y[cut:], timestamps[cut:]
+
+
+def load_holdout(source, config=None, days=7, fraction=0.2, max_rows=None, path=None,
+                 machines=20, steps=5000, seed=7, logger=None):
+    """
+    Holdout temporal para evaluar modelos registrados.
+
+    Args:
+        source: 'db' (plc_mech de los últimos `days` días), 'csv' (histórico
+            exportado en `path`, con timestamp y maintenance_needed) o
+            'synthetic' (histórico de flota repetido con generate_history)
+        fraction: parte más reciente del rango que forma el holdout
+        max_rows: se conservan las max_rows lecturas más recientes del holdout
+
+    Returns:
+        (X float32 sin escalar, y bool, timestamps)
+    """
+    logger = logger or logging.getLogger('ModelEvaluation')
+    if source == 'db':
+        from sqlalchemy import create_engine
+        from batch_scoring import database_url
+        from training_data import TrainingDataLoader
+        engine = create_engine(database_url(config))
+        X, y, timestamps = TrainingDataLoader(engine, FEATURE_COLUMNS, logger=logger).load(days=days)
+    else:
+        if source == 'csv':
+            history = pd.read_csv(path, parse_dates=['timestamp'])
+        elif source == 'synthetic':
+            from synthetic_data import generate_history
+            history = generate_history(n_machines=machines, n_steps=steps, seed=seed)
+        else:
+            raise ValueError(f"Origen de holdout desconocido: {source}")
+        X = build_features(history)
+        y = history['maintenance_needed'].to_numpy(dtype=bool)
+        timestamps = pd.to_datetime(history['timestamp']).to_numpy()
+
+    _, _, X_holdout, y_holdout, timestamps = time_split(X, y, timestamps, fraction)
+    if max_rows and len(y_holdout) > max_rows:
+        X_holdout, y_holdout, timestamps = X_holdout[-max_rows:], y_holdout[-max_rows:], timestamps[-max_rows:]
+    if len(y_holdout) == 0:
+        raise ValueError(f"El holdout ({source}) está vacío")
+    logger.info(f"Holdout {source}: {len(y_holdout)} lecturas de {timestamps[0]} a {timestamps[-1]} "
+                f"({y_holdout.mean():.1%} con mantenimiento)")
+    return X_holdout, y_holdout, timestamps
+
+
+def _percentiles_ms(durations_ns):
+    durations = np.asarray(durations_ns, dtype=np.float64) / 1e6
+    return float(np.percentile(durations, 50)), float(np.percentile(durations, 99))
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+class ModelEvaluator:
+    """
+    Evalúa versiones registradas sobre un holdout temporal.
+
+    Por versión mide las métricas de clasificación con el pipeline registrado
+    (scaler y modelo tal como se sirven), la latencia de una lectura (p50/p99,
+    con el mismo motor que usa el agente), el rendimiento por lotes, el tiempo
+    de carga y el tamaño en disco. Los tiempos son la mediana de repeats
+    pasadas. Los resultados se añaden a un histórico JSONL por versión para
+    comparar cada candidato con el modelo actual: el F1 decide siempre; la
+    latencia, el rendimiento y la carga dependen del ruido de la máquina y
+    solo avisan, salvo con performance_gate.
+    """
+
+    def __init__(self, registry, results_path='model_evaluations.jsonl', summary_path='model_metrics.csv',
+                 latency_samples=1000, batch_sizes=(64, 512, 4096), repeats=3, inference_engine='auto',
+                 flat_max_rows=512, thresholds=None, performance_gate=False):
+        self.registry = registry
+        self.results_path = results_path
+        self.summary_path = summary_path
+        self.latency_samples = latency_samples
+        self.batch_sizes = tuple(batch_sizes)
+        self.repeats = repeats
+        self.inference_engine = inference_engine
+        self.flat_max_rows = flat_max_rows
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.performance_gate = performance_gate
+        self.logger = logging.getLogger('ModelEvaluation')
+        self.stats = {'evaluations': 0, 'comparisons': 0, 'regressions': 0, 'warnings': 0}
+
+    @classmethod
+    def from_config(cls, config, registry):
+        settings = dict(config.get('evaluation', {}))
+        settings.pop('holdout', None)
+        agent = config.get('agent', {})
+        settings.setdefault('inference_engine', agent.get('inference_engine', 'auto'))
+        settings.setdefault('flat_max_rows', agent.get('flat_max_rows', 512))
+        return cls(registry, **settings)
+
+    def _score(self, pipeline, X, engine=None):
+        return score_matrix(pipeline, X, engine or self.inference_engine, self.flat_max_rows)
+
+    def measure_load(self, version):
+        """Tiempo de carga del pipeline completo y del bosque aplanado (mediana de repeats)"""
+        load_times, flat_times = [], []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            self.registry.load(version)
+            load_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            flat = self.registry.load_flat(version)
+            if flat is not None:
+                flat_times.append(time.perf_counter() - start)
+        return float(np.median(load_times)), float(np.median(flat_times)) if flat_times else None
+
+    def classification_metrics(self, pipeline, X, y):
+        """Métricas sobre todo el holdout con el modelo sklearn (la referencia)"""
+        labels, probability = self._score(pipeline, X, engine='sklearn')
+        metrics = {
+            'accuracy': float(accuracy_score(y, labels)),
+            'precision': float(precision_score(y, labels, zero_division=0)),
+            'recall': float(recall_score(y, labels, zero_division=0)),
+            'f1': float(f1_score(y, labels, zero_division=0)),
+            'roc_auc': float(roc_auc_score(y, probability)) if 0 < y.sum() < len(y) else None,
+            'positive_rate': float(labels.mean())
+        }
+        if pipeline.get('flat') is not None:
+            # El bosque aplanado sirve los lotes pequeños: debe dar las mismas probabilidades
+            sample = X[:min(len(X), 2000)]
+            _, flat_probability = self._score(pipeline, sample, engine='flat')
+            metrics['flat_max_abs_diff'] = float(np.abs(flat_probability - probability[:len(sample)]).max())
+        return metrics
+
+    def single_row_latency(self, pipeline, X):
+        """
+        Latencia de puntuar una lectura, como en el bucle de sondeo y el
+        dashboard: p50/p99 de cada pasada y la mediana de repeats pasadas.
+        """
+        n = min(self.latency_samples, len(X))
+        rows = [X[i:i + 1] for i in range(n)]
+        for row in rows[:min(20, n)]:
+            # Calentamiento: cachés y asignaciones de la primera llamada
+            self._score(pipeline, row)
+        passes = []
+        for _ in range(max(1, self.repeats)):
+            durations = np.empty(n, dtype=np.int64)
+            for i, row in enumerate(rows):
+                start = time.perf_counter_ns()
+                self._score(pipeline, row)
+                durations[i] = time.perf_counter_ns() - start
+            passes.append(_percentiles_ms(durations))
+        p50, p99 = np.median(np.asarray(passes), axis=0)
+        return float(p50), float(p99)
+
+    def batch_throughput(self, pipeline, X):
+        """Filas por segundo para cada tamaño de lote (mediana de repeats)"""
+        throughput = {}
+        for size in self.batch_sizes:
+            size = min(size, len(X))
+            batch = X[:size]
+            elapsed = []
+            for _ in range(max(1, self.repeats)):
+                start = time.perf_counter()
+                self._score(pipeline, batch)
+                elapsed.append(time.perf_counter() - start)
+            median = float(np.median(elapsed))
+            throughput[str(size)] = size / median if median > 0 else None
+        return throughput
+
+    def evaluate(self, version, X, y, timestamps=None, source=None):
+        """
+        Evalúa una versión sobre el holdout (X sin escalar, en el orden de FEATURE_COLUMNS).
+
+        Returns:
+            dict con métricas, latencias, rendimiento, carga y tamaño
+        """
+        version = version or self.registry.current_version()
+        load_s, flat_load_s = self.measure_load(version)
+        pipeline = self.registry.load(version)
+        if pipeline is None:
+            raise ValueError(f"No existe la versión {version}")
+        features = pipeline.get('features') or FEATURE_COLUMNS
+        if list(features) != FEATURE_COLUMNS or not check_feature_version(pipeline.get('metadata')):
+            raise ValueError(f"La versión {version} espera otras features ({features})")
+
+        metrics = self.classification_metrics(pipeline, X, y)
+        p50, p99 = self.single_row_latency(pipeline, X)
+        throughput = self.batch_throughput(pipeline, X)
+        flat = pipeline.get('flat')
+        result = {
+            'evaluated_at': datetime.now().isoformat(timespec='seconds'),
+            'version': version,
+            'holdout': {
+                'source': source,
+                'rows': int(len(y)),
+                'positive_rate': float(np.mean(y)),
+                'start': str(timestamps[0]) if timestamps is not None and len(timestamps) else None,
+                'end': str(timestamps[-1]) if timestamps is not None and len(timestamps) else None
+            },
+            'metrics': metrics,
+            'latency_ms': {'p50': p50, 'p99': p99, 'engine': self.inference_engine},
+            'throughput_rows_s': throughput,
+            'load_s': load_s,
+            'flat_load_s': flat_load_s,
+            'size_bytes': _directory_bytes(self.registry.version_dir(version)),
+            'n_trees': len(getattr(pipeline['model'], 'estimators_', [])) or None,
+            'flat_nodes': int(len(flat.feature)) if flat is not None else None,
+            'training_metrics': pipeline.get('metrics', {})
+        }
+        self.stats['evaluations'] += 1
+        return result
+
+    def save(self, result):
+        """Añade el resultado al histórico JSONL y una fila al resumen CSV"""
+        with open(self.results_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, default=str) + '\n')
+        if not self.summary_path:
+            return
+        largest = max(result['throughput_rows_s'], key=int) if result['throughput_rows_s'] else None
+        row = {
+            'evaluated_at': result['evaluated_at'],
+            'version': result['version'],
+            'holdout_source': result['holdout']['source'],
+            'holdout_rows': result['holdout']['rows'],
+            'holdout_start': result['holdout']['start'],
+            'holdout_end': result['holdout']['end'],
+            'latency_p50_ms': round(result['latency_ms']['p50'], 4),
+            'latency_p99_ms': round(result['latency_ms']['p99'], 4),
+            'throughput_rows_s': round(result['throughput_rows_s'][largest]) if largest else None,
+            'load_s': round(result['load_s'], 4),
+            'size_mb': round(result['size_bytes'] / 1e6, 3)
+        }
+        for name in ('accuracy', 'precision', 'recall', 'f1', 'roc_auc'):
+            value = result['metrics'].get(name)
+            row[name] = round(value, 4) if value is not None else None
+        new_file = not os.path.exists(self.summary_path) or os.path.getsize(self.summary_path) == 0
+        if not new_file:
+            with open(self.summary_path, 'r', encoding='utf-8') as f:
+                header = f.readline().strip().split(',')
+            if header != SUMMARY_COLUMNS:
+                # Fichero de la evaluación anterior (una sola fila sin versión): se conserva aparte
+                os.replace(self.summary_path, self.summary_path + '.old')
+                self.logger.warning(f"{self.summary_path} tenía otro formato; se ha movido a {self.summary_path}.old")
+                new_file = True
+        with open(self.summary_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+
+    def history(self, version=None):
+        """Evaluaciones guardadas (de una versión o de todas), de la más antigua a la más reciente"""
+        if not os.path.exists(self.results_path):
+            return []
+        results = []
+        with open(self.results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if version is None or result.get('version') == version:
+                    results.append(result)
+        return results
+
+    def compare(self, candidate, baseline):
+        """
+        Regresiones del candidato frente a la referencia.
+
+        Los dos resultados deben venir del mismo holdout y de la misma máquina
+        (evaluate_model.py evalúa ambos en la misma ejecución). Solo el F1
+        rechaza al candidato; las regresiones de rendimiento se añaden si
+        performance_gate está activo y, si no, quedan como avisos.
+
+        Returns:
+            lista de regresiones (vacía si el candidato pasa)
+        """
+        regressions = []
+        f1, base_f1 = candidate['metrics']['f1'], baseline['metrics']['f1']
+        if f1 < base_f1 - self.thresholds['max_f1_drop']:
+            regressions.append(f"F1 {f1:.3f} frente a {base_f1:.3f}")
+        if self.performance_gate:
+            regressions += self.performance_regressions(candidate, baseline)
+        self.stats['comparisons'] += 1
+        self.stats['regressions'] += len(regressions)
+        return regressions
+
+    def performance_regressions(self, candidate, baseline):
+        """Empeoramientos de latencia p99, rendimiento por lotes y tiempo de carga"""
+        limits = self.thresholds
+        regressions = []
+        p99, base_p99 = candidate['latency_ms']['p99'], baseline['latency_ms']['p99']
+        if base_p99 > 0 and p99 > base_p99 * limits['max_latency_ratio']:
+            regressions.append(f"latencia p99 {p99:.3f} ms frente a {base_p99:.3f} ms")
+        for size, rate in candidate['throughput_rows_s'].items():
+            base_rate = baseline['throughput_rows_s'].get(size)
+            if rate and base_rate and rate < base_rate * (1 - limits['max_throughput_drop']):
+                regressions.append(f"rendimiento con lotes de {size}: {rate:,.0f} frente a {base_rate:,.0f} filas/s")
+        if baseline['load_s'] > 0 and candidate['load_s'] > baseline['load_s'] * limits['max_load_ratio']:
+            regressions.append(f"carga {candidate['load_s']:.3f} s frente a {baseline['load_s']:.3f} s")
+        if not self.performance_gate:
+            self.stats['warnings'] += len(regressions)
+        return regressions
+
+    def get_stats(self):
+        return dict(self.stats, results_path=self.results_path)
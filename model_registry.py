@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+import joblib
+from flat_forest import FOREST_FILE, FlatForest, check_parity, export_forest, is_exportable
+
+CURRENT_FILE = 'CURRENT'
+PIPELINE_FILE = 'pipeline.joblib'
+METADATA_FILE = 'metadata.json'
+LEGACY_MODEL_PATH = 'maintenance_model.joblib'
+
+
+def _write_atomic(path, content):
+    """Escribe un fichero de texto de forma atómica (tmp + os.replace)"""
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """
+    Registro versionado de pipelines de inferencia.
+
+    Cada versión es un directorio inmutable models/vNNNN con el pipeline
+    (scaler + modelo + lista de features) y un metadata.json con las métricas.
+    El fichero CURRENT apunta a la versión en producción y se reemplaza de forma
+    atómica, así que un lector ve siempre la versión anterior o la nueva completa.
+    """
+
+    def __init__(self, root='models'):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.logger = logging.getLogger('ModelRegistry')
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('model_registry', {}).get('path', 'models'))
+
+    def version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def list_versions(self):
+        """Versiones registradas, de la más antigua a la más reciente"""
+        return sorted(
+            name for name in os.listdir(self.root)
+            if name.startswith('v') and name[1:].isdigit()
+            and os.path.exists(os.path.join(self.root, name, METADATA_FILE))
+        )
+
+    def _next_version_number(self):
+        versions = [int(v[1:]) for v in os.listdir(self.root) if v.startswith('v') and v[1:].isdigit()]
+        return max(versions, default=0) + 1
+
+    def register(self, model, scaler, features, metrics=None, metadata=None, promote=True, extra=None,
+                 parity_sample=None):
+        """
+        Guarda una nueva versión y opcionalmente la promociona a CURRENT.
+
+        Args:
+            model: estimador entrenado
+            scaler: transformador ajustado (o None si el modelo usa features crudas)
+            features: lista ordenada de columnas de entrada
+            metrics: métricas de validación del entrenamiento
+            metadata: información adicional serializable en JSON
+            promote: si True, la versión pasa a ser la actual
+            extra: objetos adicionales que se guardan junto al pipeline
+            parity_sample: features sin escalar para verificar el bosque aplanado
+
+        Returns:
+            Identificador de la versión ('v0001', ...)
+        """
+        tmp_dir = os.path.join(self.root, f'.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}')
+        os.makedirs(tmp_dir)
+
+        pipeline = {'model': model, 'scaler': scaler, 'features': list(features)}
+        pipeline.update(extra or {})
+        # Sin compresión para poder mapear los arrays en memoria al cargar
+        joblib.dump(pipeline, os.path.join(tmp_dir, PIPELINE_FILE))
+
+        info = {
+            'created_at': datetime.now().isoformat(),
+            'features': list(features),
+            'metrics': metrics or {},
+            'model_class': type(model).__name__,
+            'flat_forest': self._export_flat(model, scaler, features, parity_sample, tmp_dir)
+        }
+        info.update(metadata or {})
+
+        # Publicar el directorio con un rename atómico; si otro proceso ganó el número, probar el siguiente
+        while True:
+            version = f"v{self._next_version_number():04d}"
+            info['version'] = version
+            with open(os.path.join(tmp_dir, METADATA_FILE), 'w', encoding='utf-8') as f:
+                json.dump(info, f, indent=2, default=str)
+            try:
+                os.rename(tmp_dir, self.version_dir(version))
+                break
+            except OSError:
+                if not os.path.exists(self.version_dir(version)):
+                    raise
+
+        self.logger.info(f"Modelo registrado como {version}")
+        if promote:
+            self.promote(version)
+        return version
+
+    def _export_flat(self, model, scaler, features, parity_sample, directory):
+        """Guarda la versión aplanada del bosque si es exportable y coincide con sklearn"""
+        if not is_exportable(model):
+            return False
+        flat = export_forest(model, scaler, features)
+        if parity_sample is not None and len(parity_sample):
+            ok, diff = check_parity(model, flat, parity_sample, scaler)
+            if not ok:
+                self.logger.warning(f"Bosque aplanado descartado: difiere de sklearn en {diff:.2e}")
+                return False
+        flat.save(os.path.join(directory, FOREST_FILE))
+        return True
+
+    def promote(self, version):
+        """Apunta CURRENT a una versión registrada"""
+        if not os.path.exists(os.path.join(self.version_dir(version), METADATA_FILE)):
+            raise ValueError(f"La versión {version} no existe en {self.root}")
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), version)
+        self.logger.info(f"Versión {version} promocionada a producción")
+
+    def current_version(self):
+        path = os.path.join(self.root, CURRENT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+
+    def get_metadata(self, version):
+        with open(os.path.join(self.version_dir(version), METADATA_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, version=None, mmap=True):
+        """
+        Carga el pipeline de una versión (por defecto, la actual).
+
+        Con mmap=True los arrays NumPy grandes se mapean desde disco en lugar de
+        copiarse al deserializar. Si el registro está vacío se recurre al modelo
+        antiguo maintenance_model.joblib (solo clasificador, sin scaler).
+
+        Returns:
+            dict con model, scaler, features, metrics y version; None si no hay modelo
+        """
+        version = version or self.current_version()
+        if version is None:
+            return self.load_legacy()
+
+        pipeline = joblib.load(
+            os.path.join(self.version_dir(version), PIPELINE_FILE),
+            mmap_mode='r' if mmap else None
+        )
+        metadata = self.get_metadata(version)
+        pipeline['version'] = version
+        pipeline['metrics'] = metadata.get('metrics', {})
+        pipeline['metadata'] = metadata
+        forest_path = os.path.join(self.version_dir(version), FOREST_FILE)
+        pipeline['flat'] = FlatForest.load(forest_path) if os.path.exists(forest_path) else None
+        return pipeline
+
+    def load_flat(self, version=None):
+        """
+        Carga solo el bosque aplanado de una versión, sin deserializar sklearn.
+
+        Returns:
+            dict con flat, features, version, metrics y metadata; None si no hay
+        """
+        version = version or self.current_version()
+        if version is None:
+            return None
+        forest_path = os.path.join(self.version_dir(version), FOREST_FILE)
+        if not os.path.exists(forest_path):
+            return None
+        metadata = self.get_metadata(version)
+        return {
+            'flat': FlatForest.load(forest_path),
+            'features': metadata.get('features'),
+            'version': version,
+            'metrics': metadata.get('metrics', {}),
+            'metadata': metadata
+        }
+
+    def load_legacy(self, path=LEGACY_MODEL_PATH):
+        if not os.path.exists(path):
+            return None
+        return {
+            'model': joblib.load(path),
+            'scaler': None,
+            'features': None,
+            'version': 'legacy',
+            'metrics': {},
+            'metadata': {},
+            'flat': None
+        }
+
+
+class ModelWatcher(threading.Thread):
+    """
+    Hilo que vigila CURRENT y carga la nueva versión en segundo plano.
+
+    La carga ocurre fuera del bucle de inferencia; solo cuando el pipeline está
+    completo se entrega a on_swap, que lo publica con una única asignación.
+    """
+
+    def __init__(self, registry, on_swap, interval=5.0, current_version=None):
+        super().__init__(daemon=True, name='ModelWatcher')
+        self.registry = registry
+        self.on_swap = on_swap
+        self.interval = interval
+        self.loaded_version = current_version
+        self._stop_event = threading.Event()
+        self.logger = logging.getLogger('ModelRegistry')
+
+    def check(self):
+        """Comprueba una vez si hay una nueva versión y la intercambia"""
+        version = self.registry.current_version()
+        if version is None or version == self.loaded_version:
+            return False
+        previous = self.loaded_version
+        pipeline = self.registry.load(version)
+        self.on_swap(pipeline)
+        self.loaded_version = version
+        self.logger.info(f"Modelo intercambiado en caliente: {previous} -> {version}")
+        return True
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Error recargando modelo: {e}")
+
+    def stop(self):
+        self._stop_event.set()
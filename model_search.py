@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+
+MODEL_FAMILIES = {
+    'random_forest': RandomForestClassifier,
+    'extra_trees': ExtraTreesClassifier,
+    'hist_gradient_boosting': HistGradientBoostingClassifier,
+    'logistic_regression': LogisticRegression
+}
+
+# Rejilla por familia: cada combinación es un candidato
+DEFAULT_SEARCH_SPACE = {
+    'random_forest': {
+        'n_estimators': [100, 200],
+        'max_depth': [None, 16],
+        'min_samples_leaf': [1, 5]
+    },
+    'extra_trees': {
+        'n_estimators': [200],
+        'max_depth': [None, 16],
+        'min_samples_leaf': [1, 5]
+    },
+    'hist_gradient_boosting': {
+        'learning_rate': [0.05, 0.1],
+        'max_leaf_nodes': [31, 63]
+    },
+    'logistic_regression': {
+        'C': [0.1, 1.0]
+    }
+}
+
+
+def expand_search_space(search_space):
+    """Lista de candidatos (familia, parámetros) a partir de las rejillas"""
+    candidates = []
+    for family, grid in search_space.items():
+        if family not in MODEL_FAMILIES:
+            raise ValueError(f"Familia de modelo desconocida: {family}")
+        names = sorted(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+            candidates.append((family, dict(zip(names, values))))
+    return candidates
+
+
+def build_model(family, params, n_jobs=1, random_state=42):
+    """Instancia un estimador de la familia indicada"""
+    cls = MODEL_FAMILIES[family]
+    kwargs = dict(params)
+    if family == 'logistic_regression':
+        kwargs.setdefault('max_iter', 1000)
+    else:
+        kwargs.setdefault('random_state', random_state)
+    if family in ('random_forest', 'extra_trees'):
+        kwargs['n_jobs'] = n_jobs
+    return cls(**kwargs)
+
+
+def _evaluate_fold(family, params, fold_dir, fold):
+    """Entrena y puntúa un candidato en un fold (se ejecuta en un proceso del pool)"""
+    # Los arrays del fold ya están escalados en disco y se mapean sin copiar
+    data = {
+        name: np.load(os.path.join(fold_dir, f'fold{fold}_{name}.npy'), mmap_mode='r')
+        for name in ('X_train', 'y_train', 'X_val', 'y_val')
+    }
+    cpu_start = time.process_time()
+    # Un hilo por tarea: el paralelismo lo da el pool (HistGradientBoosting usa OpenMP)
+    with threadpool_limits(limits=1):
+        model = build_model(family, params)
+        model.fit(data['X_train'], data['y_train'])
+        y_pred = model.predict(data['X_val'])
+    return {
+        'f1': f1_score(data['y_val'], y_pred, zero_division=0),
+        'accuracy': accuracy_score(data['y_val'], y_pred),
+        'cpu_s': time.process_time() - cpu_start
+    }
+
+
+class ModelSearch:
+    """
+    Búsqueda de hiperparámetros con validación cruzada temporal en paralelo.
+
+    Los folds son ventanas crecientes (TimeSeriesSplit): se entrena siempre con
+    el pasado y se valida con el tramo siguiente. El escalado de cada fold se
+    calcula una sola vez y se guarda como .npy; los procesos del pool lo mapean
+    en memoria, de modo que ningún candidato repite el preprocesado ni recibe
+    los datos serializados. Cada tarea es un par (candidato, fold) con un solo
+    núcleo, así el pool reparte el trabajo sin sobresuscribir la CPU.
+    """
+
+    def __init__(self, search_space=None, n_splits=3, n_workers=None, scoring='f1', logger=None):
+        self.candidates = expand_search_space(search_space or DEFAULT_SEARCH_SPACE)
+        self.n_splits = n_splits
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.scoring = scoring
+        self.logger = logger or logging.getLogger('ModelSearch')
+
+    def prepare_folds(self, X, y, fold_dir):
+        """Escala y guarda cada fold una sola vez"""
+        splitter = TimeSeriesSplit(n_splits=self.n_splits)
+        for fold, (train_idx, val_idx) in enumerate(splitter.split(X)):
+            scaler = StandardScaler().fit(X[train_idx])
+            arrays = {
+                'X_train': scaler.transform(X[train_idx]).astype(np.float32, copy=False),
+                'y_train': y[train_idx],
+                'X_val': scaler.transform(X[val_idx]).astype(np.float32, copy=False),
+                'y_val': y[val_idx]
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(fold_dir, f'fold{fold}_{name}.npy'), array)
+
+    def run(self, X, y):
+        """
+        Evalúa todos los candidatos sobre los folds temporales.
+
+        Args:
+            X: features sin escalar ordenadas por tiempo
+            y: etiquetas
+
+        Returns:
+            dict con best (familia y parámetros), candidates (puntuaciones por
+            candidato), wall_time_s, cpu_time_s y cpu_utilization
+        """
+        fold_dir = tempfile.mkdtemp(prefix='model_search_')
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            self.prepare_folds(X, y, fold_dir)
+            preprocessing_s = time.perf_counter() - start
+
+            scores = {index: [] for index in range(len(self.candidates))}
+            cpu_time = time.process_time() - cpu_start
+            with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+                futures = {
+                    pool.submit(_evaluate_fold, family, params, fold_dir, fold): index
+                    for index, (family, params) in enumerate(self.candidates)
+                    for fold in range(self.n_splits)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        family, params = self.candidates[index]
+                        self.logger.error(f"[ERROR] Candidato {family} {params} fallido: {e}")
+                        result = None
+                    scores[index].append(result)
+                    if result is not None:
+                        cpu_time += result['cpu_s']
+        finally:
+            shutil.rmtree(fold_dir, ignore_errors=True)
+
+        wall_time = time.perf_counter() - start
+        candidates = []
+        for index, (family, params) in enumerate(self.candidates):
+            folds = scores[index]
+            failed = any(result is None for result in folds)
+            candidates.append({
+                'family': family,
+                'params': params,
+                'fold_scores': None if failed else [round(r[self.scoring], 4) for r in folds],
+                'mean_score': None if failed else float(np.mean([r[self.scoring] for r in folds])),
+                'cpu_s': sum(r['cpu_s'] for r in folds if r is not None)
+            })
+        ranked = sorted(
+            (c for c in candidates if c['mean_score'] is not None),
+            key=lambda c: c['mean_score'], reverse=True
+        )
+        if not ranked:
+            raise RuntimeError("Ningún candidato pudo evaluarse")
+
+        report = {
+            'best': {'family': ranked[0]['family'], 'params': ranked[0]['params']},
+            'scoring': self.scoring,
+            'n_splits': self.n_splits,
+            'n_workers': self.n_workers,
+            'rows': int(len(y)),
+            'candidates': ranked + [c for c in candidates if c['mean_score'] is None],
+            'preprocessing_s': preprocessing_s,
+            'wall_time_s': wall_time,
+            'cpu_time_s': cpu_time,
+            'cpu_utilization': cpu_time / (wall_time * self.n_workers) if wall_time > 0 else 0.0
+        }
+        self.logger.info(
+            f"Búsqueda completada: {len(self.candidates)} candidatos x {self.n_splits} folds en "
+            f"{wall_time:.1f} s con {self.n_workers} procesos (uso de CPU {report['cpu_utilization']:.0%}); "
+            f"mejor {ranked[0]['family']} {ranked[0]['params']} ({self.scoring} {ranked[0]['mean_score']:.3f})"
+        )
+        return report
+
+
+def holdout_metrics(model, X_val, y_val):
+    """Métricas de validación con las mismas claves que el entrenamiento completo"""
+    y_pred = model.predict(X_val)
+    return {
+        'accuracy': accuracy_score(y_val, y_pred),
+        'precision': precision_score(y_val, y_pred, zero_division=0),
+        'recall': recall_score(y_val, y_pred, zero_division=0),
+        'f1': f1_score(y_val, y_pred, zero_division=0),
+        'validation_rows': int(len(y_val))
+    }
@@ -0,0 +1,690 @@
+# -*- coding: utf-8 -*-
+import html
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import string
+import struct
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SEVERITY_ORDER = {'info': 0, 'warning': 1, 'critical': 2}
+SEVERITY_COLORS = {'info': '#6c757d', 'warning': 'orange', 'critical': 'red'}
+_STOP = object()
+_FLUSH = object()
+
+
+class CompiledTemplate:
+    """
+    Plantilla con la sintaxis de str.format que se analiza una sola vez.
+
+    render() solo concatena los trozos fijos con los valores formateados
+    (mismas especificaciones que format, p. ej. {days:.1f}). Con escape=True
+    los valores de texto se escapan para HTML salvo los campos de raw, que ya
+    vienen renderizados.
+    """
+
+    def __init__(self, source, escape=False, raw=()):
+        self.parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if field is not None and (not field.isidentifier() or '{' in (spec or '')):
+                raise ValueError(f"Campo de plantilla no soportado: {{{field}:{spec}}}")
+            self.parts.append((literal, field, spec or '', conversion))
+        self.fields = {field for _, field, _, _ in self.parts if field is not None}
+        self.escape = escape
+        self.raw = set(raw)
+
+    def render(self, **values):
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            text = format(value, spec)
+            out.append(html.escape(text) if self.escape and field not in self.raw and isinstance(value, str) else text)
+        return ''.join(out)
+
+
+_EMAIL_HEAD = """
+<html>
+    <head>
+        <meta charset="utf-8">
+    </head>
+    <body style="font-family: Arial, sans-serif;">
+        <div style="padding: 20px; background-color: #f8f9fa; border-radius: 10px;">
+"""
+_EMAIL_FOOT = """
+            <div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #dee2e6;">
+                <small style="color: #6c757d;">
+                    Este es un mensaje automático del Sistema de Mantenimiento Predictivo.
+                    No responda a este email.
+                </small>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+# Plantillas compiladas al importar el módulo: cada aviso solo las rellena
+TEMPLATES = {
+    'maintenance_subject': CompiledTemplate("⚠️ Mantenimiento Requerido en {plc_id} en {days:.1f} días"),
+    'maintenance_text': CompiledTemplate(
+        "{plc_id}: mantenimiento requerido en {days:.1f} días. Temperatura {temperature:.1f}°C, "
+        "vibración {vibration:.2f} mm/s, desgaste {wear:.1f}%"
+    ),
+    'maintenance_html': CompiledTemplate(_EMAIL_HEAD + """
+            <h2 style="color: {color};">
+                ⚠️ Alerta de Mantenimiento
+            </h2>
+
+            <p>Estado actual de {plc_id}:</p>
+
+            <ul>
+                <li>🌡️ Temperatura: {temperature:.1f}°C</li>
+                <li>📳 Vibración: {vibration:.2f} mm/s</li>
+                <li>⚙️ Desgaste: {wear:.1f}%</li>
+            </ul>
+
+            <p style="background-color: #e9ecef; padding: 10px; border-radius: 5px;">
+                Por favor, programe el mantenimiento lo antes posible para evitar fallos del equipo.
+            </p>
+""" + _EMAIL_FOOT, escape=True),
+    'item_subject': CompiledTemplate("[{severity}] {plc_id}: {title}"),
+    'item_text': CompiledTemplate("{timestamp} [{severity}] {plc_id}: {title}. {description}"),
+    'item_html': CompiledTemplate(_EMAIL_HEAD + """
+            <h2 style="color: {color};">{title}</h2>
+            <p>{plc_id} ({timestamp}): {description}</p>
+""" + _EMAIL_FOOT, escape=True),
+    'digest_subject': CompiledTemplate(
+        "Resumen de alertas: {count} avisos en {machines} máquinas ({critical} críticos)"
+    ),
+    'digest_text_row': CompiledTemplate("{timestamp} [{severity}] {plc_id}: {title}. {description}"),
+    'digest_html_row': CompiledTemplate(
+        '<tr><td>{timestamp}</td><td>{plc_id}</td><td style="color: {color};">{severity}</td>'
+        '<td>{title}</td><td>{description}</td></tr>', escape=True
+    ),
+    'digest_html': CompiledTemplate(_EMAIL_HEAD + """
+            <h2>Resumen de alertas</h2>
+            <p>{count} avisos en {machines} máquinas entre {start} y {end} ({critical} críticos).</p>
+            <table style="border-collapse: collapse; font-size: 13px;">
+                <tr><th>Hora</th><th>Máquina</th><th>Severidad</th><th>Aviso</th><th>Detalle</th></tr>
+                {rows}
+            </table>
+            <p>{omitted}</p>
+""" + _EMAIL_FOOT, escape=True, raw=('rows',)),
+}
+
+
+def make_item(plc_id, alert_type, severity, title, description='', timestamp=None, **extra):
+    """Aviso individual con los campos que usan canales y plantillas"""
+    timestamp = timestamp or datetime.now()
+    return dict(extra, plc_id=str(plc_id), alert_type=alert_type, severity=severity, title=title,
+                description=description,
+                timestamp=timestamp.isoformat(timespec='seconds') if hasattr(timestamp, 'isoformat') else str(timestamp))
+
+
+def render_item(item):
+    """Notificación de un solo aviso (usa el texto ya renderizado si lo trae)"""
+    values = dict(item, color=SEVERITY_COLORS.get(item['severity'], 'black'))
+    return {
+        'subject': item.get('subject') or TEMPLATES['item_subject'].render(**values),
+        'text': item.get('text') or TEMPLATES['item_text'].render(**values),
+        'html': item.get('html') or TEMPLATES['item_html'].render(**values),
+        'severity': item['severity'],
+        'items': [item],
+        'digest': False
+    }
+
+
+def render_digest(items, max_rows=200):
+    """Una notificación con todos los avisos de la ventana, los más graves primero"""
+    ordered = sorted(items, key=lambda i: (-SEVERITY_ORDER.get(i['severity'], 0), i['timestamp']))
+    shown = ordered[:max_rows]
+    severities = Counter(item['severity'] for item in items)
+    timestamps = sorted(item['timestamp'] for item in items)
+    summary = {
+        'count': len(items),
+        'machines': len({item['plc_id'] for item in items}),
+        'critical': severities.get('critical', 0),
+        'start': timestamps[0],
+        'end': timestamps[-1]
+    }
+    omitted = len(ordered) - len(shown)
+    rows_text = [TEMPLATES['digest_text_row'].render(**item) for item in shown]
+    rows_html = [
+        TEMPLATES['digest_html_row'].render(**item, color=SEVERITY_COLORS.get(item['severity'], 'black'))
+        for item in shown
+    ]
+    omitted_text = f"y {omitted} avisos más" if omitted else ''
+    return {
+        'subject': TEMPLATES['digest_subject'].render(**summary),
+        'text': '\n'.join(rows_text + ([omitted_text] if omitted else [])),
+        'html': TEMPLATES['digest_html'].render(**summary, rows='\n'.join(rows_html), omitted=omitted_text),
+        'severity': max((item['severity'] for item in items), key=lambda s: SEVERITY_ORDER.get(s, 0)),
+        'items': items,
+        'digest': True
+    }
+
+
+def notification_payload(notification):
+    """Cuerpo JSON común para webhook, fichero y MQTT"""
+    return {
+        'subject': notification['subject'],
+        'text': notification['text'],
+        'severity': notification['severity'],
+        'digest': notification['digest'],
+        'items': [
+            {key: item[key] for key in ('plc_id', 'alert_type', 'severity', 'title', 'description', 'timestamp')}
+            for item in notification['items']
+        ]
+    }
+
+
+class TokenBucket:
+    """Límite de tasa: rate_per_s fichas por segundo con hasta capacity acumuladas"""
+
+    def __init__(self, rate_per_s, capacity):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_s)
+            self.updated = now
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def wait_s(self, tokens=1):
+        """Segundos hasta que haya tokens fichas (0 si ya las hay)"""
+        with self._lock:
+            available = min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate_per_s)
+            return max(0.0, (tokens - available) / self.rate_per_s)
+
+
+class NotificationChannel(ABC):
+    """
+    Canal de salida con su propio límite de tasa (rate_per_minute, burst).
+
+    Un aviso sin cupo no se pierde (su cooldown ya está reclamado): queda
+    aplazado y sale junto al siguiente envío del canal, o solo cuando vuelva
+    a haber cupo, como un resumen (hasta max_deferred avisos).
+    """
+
+    kind = None
+
+    def __init__(self, name=None, rate_per_minute=None, burst=None, max_deferred=5000, logger=None):
+        self.name = name or self.kind
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst or max(1, rate_per_minute)) if rate_per_minute else None
+        self.max_deferred = max_deferred
+        self.deferred = []
+        self.logger = logger or logging.getLogger('NotificationChannels')
+        self.stats = {'sent': 0, 'failed': 0, 'rate_limited': 0, 'deferred_dropped': 0, 'seconds': 0.0}
+
+    def deliver(self, notification):
+        if self.bucket is not None and not self.bucket.acquire():
+            self.stats['rate_limited'] += 1
+            self._defer(notification['items'])
+            self.logger.warning(f"Canal {self.name} sin cupo; se aplaza '{notification['subject']}'")
+            return False
+        if self.deferred:
+            items, self.deferred = self.deferred + list(notification['items']), []
+            notification = render_digest(items)
+        return self._send(notification)
+
+    def deliver_deferred(self, force=False):
+        """Envía los avisos aplazados si hay cupo (o siempre con force, al cerrar)"""
+        if not self.deferred:
+            return False
+        if not force and self.bucket is not None and not self.bucket.acquire():
+            return False
+        items, self.deferred = self.deferred, []
+        return self._send(render_digest(items) if len(items) > 1 else render_item(items[0]))
+
+    def retry_in_s(self):
+        """Segundos hasta poder enviar lo aplazado (None si no hay nada aplazado)"""
+        if not self.deferred:
+            return None
+        return self.bucket.wait_s() if self.bucket is not None else 0.0
+
+    def _defer(self, items):
+        self.deferred.extend(items)
+        overflow = len(self.deferred) - self.max_deferred
+        if overflow > 0:
+            # Se conservan los más recientes
+            del self.deferred[:overflow]
+            self.stats['deferred_dropped'] += overflow
+            self.logger.error(f"Canal {self.name}: {overflow} avisos aplazados descartados")
+
+    def _send(self, notification):
+        started = time.perf_counter()
+        try:
+            self.send(notification)
+            self.stats['sent'] += 1
+            return True
+        except Exception as e:
+            self.stats['failed'] += 1
+            self.logger.error(f"Error enviando por {self.name}: {e}")
+            return False
+        finally:
+            self.stats['seconds'] += time.perf_counter() - started
+
+    @abstractmethod
+    def send(self, notification):
+        """Envía una notificación ya renderizada (ver render_item y render_digest)"""
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        return dict(self.stats, name=self.name, type=self.kind, deferred=len(self.deferred))
+
+
+class SmtpChannel(NotificationChannel):
+    """Email por el NotificationDispatcher (envío asíncrono, sesión SMTP reutilizada)"""
+
+    kind = 'smtp'
+
+    def __init__(self, dispatcher, recipients=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dispatcher = dispatcher
+        self.recipients = list(recipients or dispatcher.recipients)
+
+    def send(self, notification):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.dispatcher.sender_email
+        msg['To'] = ', '.join(self.recipients)
+        msg['Subject'] = notification['subject']
+        msg.attach(MIMEText(notification['text'], 'plain', 'utf-8'))
+        msg.attach(MIMEText(notification['html'], 'html', 'utf-8'))
+        if not self.dispatcher.submit(msg, self.recipients):
+            raise RuntimeError("cola de email llena o cerrada")
+
+    def close(self):
+        self.dispatcher.close()
+
+
+class WebhookChannel(NotificationChannel):
+    """POST JSON a una URL (p. ej. un webhook de chat o de un sistema de tickets)"""
+
+    kind = 'webhook'
+
+    def __init__(self, url, headers=None, timeout_s=5, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+        self.timeout_s = timeout_s
+
+    def send(self, notification):
+        body = json.dumps(notification_payload(notification)).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+            response.read()
+
+
+class FileChannel(NotificationChannel):
+    """Añade cada notificación como una línea JSON a un fichero local"""
+
+    kind = 'file'
+
+    def __init__(self, path='notifications.jsonl', **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, notification):
+        line = json.dumps(dict(notification_payload(notification), sent_at=datetime.now().isoformat()))
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class SyslogChannel(NotificationChannel):
+    """Una línea por aviso al syslog local o remoto (UDP)"""
+
+    kind = 'syslog'
+    PRIORITIES = {'info': logging.INFO, 'warning': logging.WARNING, 'critical': logging.CRITICAL}
+
+    def __init__(self, host='localhost', port=514, address=None, facility='user', tag='predictive-maintenance',
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.handler = logging.handlers.SysLogHandler(
+            address=address or (host, port),
+            facility=logging.handlers.SysLogHandler.facility_names[facility]
+        )
+        self.handler.setFormatter(logging.Formatter(f'{tag}: %(message)s'))
+
+    def _frame(self, record):
+        """Mensaje syslog con prioridad (<PRI>tag: texto), como lo arma SysLogHandler.emit"""
+        handler = self.handler
+        message = handler.ident + handler.format(record) + ('\000' if handler.append_nul else '')
+        priority = handler.encodePriority(handler.facility, handler.mapPriority(record.levelname))
+        return f'<{priority}>'.encode('utf-8') + message.encode('utf-8')
+
+    def send(self, notification):
+        # SysLogHandler.emit se traga los errores de red (handleError): se envía por su
+        # socket directamente para que un fallo cuente como envío fallido
+        handler = self.handler
+        for line in notification['text'].splitlines() or [notification['subject']]:
+            record = logging.LogRecord('syslog', self.PRIORITIES.get(notification['severity'], logging.WARNING),
+                                       __file__, 0, line, None, None)
+            message = self._frame(record)
+            if handler.unixsocket:
+                try:
+                    handler.socket.send(message)
+                except OSError:
+                    # El demonio syslog local se reinició: reconectar una vez
+                    handler.socket.close()
+                    handler._connect_unixsocket(handler.address)
+                    handler.socket.send(message)
+            elif handler.socktype == socket.SOCK_DGRAM:
+                handler.socket.sendto(message, handler.address)
+            else:
+                handler.socket.sendall(message)
+
+    def close(self):
+        self.handler.close()
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _mqtt_string(value):
+    value = value.encode('utf-8') if isinstance(value, str) else value
+    return struct.pack('!H', len(value)) + value
+
+
+def mqtt_packet(packet_type, body=b''):
+    return bytes([packet_type]) + _encode_length(len(body)) + body
+
+
+def read_mqtt_packet(reader):
+    """(primer byte, cuerpo) del siguiente paquete MQTT; reader(n) devuelve n bytes"""
+    header = reader(1)
+    if not header:
+        raise ConnectionResetError("conexión MQTT cerrada")
+    length, multiplier = 0, 1
+    while True:
+        byte = reader(1)[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    return header[0], reader(length) if length else b''
+
+
+class MqttChannel(NotificationChannel):
+    """
+    Publica cada notificación en un topic MQTT 3.1.1 (QoS 0 o 1).
+
+    Cliente mínimo sin dependencias (CONNECT, PUBLISH, PUBACK, DISCONNECT)
+    sobre una conexión que se mantiene abierta y se rehace si se cae.
+    """
+
+    kind = 'mqtt'
+
+    def __init__(self, host='localhost', port=1883, topic='plc/notifications', qos=1, client_id=None,
+                 username=None, password=None, keepalive_s=60, timeout_s=5, retain=False, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.client_id = client_id or f'pm-notifications-{os.getpid()}'
+        self.username = username
+        self.password = password
+        self.keepalive_s = keepalive_s
+        self.timeout_s = timeout_s
+        self.retain = retain
+        self._socket = None
+        self._packet_id = 0
+        self._last_io = 0.0
+
+    def _read(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self._socket.recv(n - len(data))
+            if not chunk:
+                raise ConnectionResetError("el broker MQTT cerró la conexión")
+            data += chunk
+        return data
+
+    def _connect(self):
+        flags = 0x02 | (0x80 if self.username else 0) | (0x40 if self.password else 0)
+        body = _mqtt_string('MQTT') + bytes([4, flags]) + struct.pack('!H', self.keepalive_s)
+        body += _mqtt_string(self.client_id)
+        if self.username:
+            body += _mqtt_string(self.username)
+        if self.password:
+            body += _mqtt_string(self.password)
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout_s)
+        try:
+            self._socket.sendall(mqtt_packet(0x10, body))
+            packet_type, payload = read_mqtt_packet(self._read)
+            if packet_type != 0x20 or payload[1] != 0:
+                raise ConnectionError(f"CONNACK rechazado ({payload[1] if len(payload) > 1 else '?'})")
+        except Exception:
+            self._disconnect()
+            raise
+        self._last_io = time.monotonic()
+
+    def _disconnect(self):
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            sock.close()
+
+    def _publish(self, payload):
+        # Pasado el keepalive el broker ya habrá cerrado la sesión
+        if self._socket is not None and time.monotonic() - self._last_io > self.keepalive_s:
+            self._disconnect()
+        if self._socket is None:
+            self._connect()
+        flags = 0x30 | (self.qos << 1) | (0x01 if self.retain else 0)
+        body = _mqtt_string(self.topic)
+        if self.qos:
+            self._packet_id = self._packet_id % 65535 + 1
+            body += struct.pack('!H', self._packet_id)
+        self._socket.sendall(mqtt_packet(flags, body + payload))
+        if self.qos:
+            packet_type, ack = read_mqtt_packet(self._read)
+            if packet_type != 0x40 or struct.unpack('!H', ack[:2])[0] != self._packet_id:
+                raise ConnectionError("PUBACK inesperado")
+        self._last_io = time.monotonic()
+
+    def send(self, notification):
+        payload = json.dumps(notification_payload(notification)).encode('utf-8')
+        try:
+            self._publish(payload)
+        except (OSError, ConnectionError):
+            # Un reintento con conexión nueva cubre el cierre por inactividad del broker
+            self._disconnect()
+            self._publish(payload)
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.sendall(mqtt_packet(0xE0))
+            except OSError:
+                pass
+        self._disconnect()
+
+
+CHANNEL_TYPES = {cls.kind: cls for cls in (SmtpChannel, WebhookChannel, FileChannel, SyslogChannel, MqttChannel)}
+
+
+def create_channel(spec, config, dispatcher=None, logger=None):
+    """Crea un canal a partir de su entrada en notifications.channels"""
+    spec = dict(spec)
+    spec.pop('enabled', None)
+    kind = spec.pop('type')
+    if kind not in CHANNEL_TYPES:
+        raise ValueError(f"Canal de notificación desconocido: {kind}")
+    if kind == 'smtp':
+        from notification_dispatcher import NotificationDispatcher
+        spec['dispatcher'] = dispatcher or NotificationDispatcher.from_config(config, logger=logger)
+    return CHANNEL_TYPES[kind](logger=logger, **spec)
+
+
+class NotificationHub:
+    """
+    Reparto de avisos a todos los canales configurados.
+
+    notify() solo encola; un hilo entrega cada aviso a todos los canales,
+    cada uno con su límite de tasa (lo que no cabe se aplaza en el canal y
+    se reintenta al recuperar cupo). Con digest_window_s > 0 los avisos de
+    toda la flota se acumulan durante la ventana y sale una sola
+    notificación con todos ellos (los más graves primero), así que una
+    tormenta de alertas es un mensaje por canal y ventana.
+    """
+
+    def __init__(self, channels, digest_window_s=0, max_digest_items=5000, digest_max_rows=200, queue_size=10000,
+                 logger=None):
+        self.channels = list(channels)
+        self.digest_window_s = digest_window_s
+        self.max_digest_items = max_digest_items
+        self.digest_max_rows = digest_max_rows
+        self.logger = logger or logging.getLogger('NotificationHub')
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._digest = []
+        self._digest_due = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {'items': 0, 'dropped': 0, 'notifications': 0, 'digests': 0}
+
+    @classmethod
+    def from_config(cls, config, dispatcher=None, logger=None):
+        """
+        Canales de config['notifications']['channels']; sin esa sección, solo
+        email, aviso a aviso, como antes.
+        """
+        settings = dict(config.get('notifications', {}))
+        specs = settings.pop('channels', [{'type': 'smtp'}])
+        settings.pop('alerts_enabled', None)
+        channels = [create_channel(spec, config, dispatcher, logger) for spec in specs if spec.get('enabled', True)]
+        return cls(channels, logger=logger, **settings)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='NotificationHub', daemon=True)
+                self._thread.start()
+        return self
+
+    def notify(self, item):
+        """Encola un aviso (ver make_item); False si la cola está llena o el hub cerrado"""
+        if self._closed:
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            self.logger.warning(f"Cola de avisos llena; se descarta {item['plc_id']}: {item['title']}")
+            return False
+        self.stats['items'] += 1
+        return True
+
+    def flush(self, timeout=None):
+        """Envía ya el resumen pendiente y espera a que se vacíe la cola"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        self.queue.put(_FLUSH)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Envía lo pendiente (incluido el resumen en curso) y cierra los canales"""
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+        for channel in self.channels:
+            try:
+                channel.close()
+            except Exception as e:
+                self.logger.error(f"Error cerrando el canal {channel.name}: {e}")
+
+    def _run(self):
+        while True:
+            waits = [channel.retry_in_s() for channel in self.channels]
+            if self._digest_due is not None:
+                waits.append(self._digest_due - time.monotonic())
+            waits = [wait for wait in waits if wait is not None]
+            timeout = max(0.0, min(waits)) if waits else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                if self._digest_due is not None and time.monotonic() >= self._digest_due:
+                    self._send_digest()
+                self._deliver_deferred()
+                continue
+            try:
+                if item is _STOP or item is _FLUSH:
+                    self._send_digest()
+                    self._deliver_deferred(force=item is _STOP)
+                    if item is _STOP:
+                        return
+                elif self.digest_window_s:
+                    if self._digest_due is None:
+                        self._digest_due = time.monotonic() + self.digest_window_s
+                    self._digest.append(item)
+                    if len(self._digest) >= self.max_digest_items or time.monotonic() >= self._digest_due:
+                        self._send_digest()
+                else:
+                    self._deliver(render_item(item))
+            except Exception as e:
+                self.logger.error(f"Error repartiendo avisos: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _send_digest(self):
+        items, self._digest, self._digest_due = self._digest, [], None
+        if not items:
+            return
+        self.stats['digests'] += 1
+        self._deliver(render_digest(items, self.digest_max_rows) if len(items) > 1 else render_item(items[0]))
+
+    def _deliver(self, notification):
+        self.stats['notifications'] += 1
+        for channel in self.channels:
+            channel.deliver(notification)
+
+    def _deliver_deferred(self, force=False):
+        for channel in self.channels:
+            channel.deliver_deferred(force)
+
+    def get_stats(self):
+        return dict(self.stats, pending=self.queue.qsize(), digest_pending=len(self._digest),
+                    channels=[channel.get_stats() for channel in self.channels])
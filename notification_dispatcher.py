@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import random
+import smtplib
+import threading
+import time
+
+_STOP = object()
+
+
+class NotificationDispatcher:
+    """
+    Envío de emails en segundo plano.
+
+    submit() solo encola el mensaje y vuelve al momento, así que quien avisa
+    (un callback del dashboard, el bucle del agente) no espera al servidor de
+    correo. Un hilo de trabajo vacía la cola por lotes de hasta batch_size
+    mensajes sobre una única sesión SMTP autenticada, que se reutiliza
+    mientras haya tráfico y se cierra tras idle_timeout_s sin envíos. Si la
+    sesión se cae se reconecta; los errores temporales (desconexión, 4xx) se
+    reintentan con espera exponencial y los permanentes (5xx) descartan el
+    mensaje.
+    """
+
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password=None, recipients=(), use_tls=True,
+                 timeout_s=10, queue_size=1000, batch_size=20, batch_wait_s=0.5, max_retries=5, backoff_s=1.0,
+                 max_backoff_s=60, idle_timeout_s=120, noop_after_s=30, logger=None):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.recipients = list(recipients)
+        self.use_tls = use_tls
+        self.timeout_s = timeout_s
+        self.batch_size = batch_size
+        self.batch_wait_s = batch_wait_s
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.idle_timeout_s = idle_timeout_s
+        self.noop_after_s = noop_after_s
+        self.logger = logger or logging.getLogger('NotificationDispatcher')
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._server = None
+        self._last_used = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._abort = threading.Event()
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'dropped': 0, 'retries': 0,
+                      'connections': 0, 'batches': 0}
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        email_config = config['email_notifications']
+        return cls(
+            email_config['smtp_server'], email_config['smtp_port'], email_config['sender_email'],
+            email_config.get('sender_password'), email_config.get('recipients', []), logger=logger,
+            **config.get('notification_dispatcher', {})
+        )
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='NotificationDispatcher', daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, message, recipients=None):
+        """
+        Encola un email (email.message.Message) para sus destinatarios
+        (por defecto, los configurados).
+
+        Returns:
+            False si el dispatcher está cerrado o la cola llena
+        """
+        if self._closed:
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait((message, list(recipients or self.recipients)))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            self.logger.warning(f"Cola de notificaciones llena ({self.queue.maxsize}); se descarta '{message['Subject']}'")
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def flush(self, timeout=None):
+        """Espera a que la cola se vacíe; True si no queda nada pendiente"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Envía lo pendiente (hasta timeout segundos) y cierra la sesión SMTP"""
+        self._closed = True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self._disconnect()
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            # Sin tiempo para más reintentos: lo que quede se da por fallido
+            self._abort.set()
+            thread.join(self.timeout_s)
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.idle_timeout_s)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.batch_wait_s
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._deliver([item for item in batch if item is not _STOP])
+            except Exception as e:
+                self.logger.error(f"Error inesperado enviando notificaciones: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if batch[-1] is _STOP:
+                self._disconnect()
+                return
+
+    def _deliver(self, batch):
+        """Envía un lote por la sesión actual, reconectando y reintentando lo no enviado"""
+        if not batch:
+            return
+        self.stats['batches'] += 1
+        pending = list(batch)
+        attempt = 0
+        while pending:
+            if self._abort.is_set():
+                self._give_up(pending, "dispatcher cerrado")
+                return
+            try:
+                server = self._connection()
+                while pending:
+                    message, recipients = pending[0]
+                    server.send_message(message, from_addr=self.sender_email, to_addrs=recipients)
+                    self._last_used = time.monotonic()
+                    pending.pop(0)
+                    self.stats['sent'] += 1
+                    self.logger.info(f"Email enviado a {', '.join(recipients)}: {message['Subject']}")
+            except smtplib.SMTPAuthenticationError as e:
+                self._disconnect()
+                self._give_up(pending, f"autenticación rechazada ({e.smtp_code})")
+                return
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                code = getattr(e, 'smtp_code', 550)
+                if code >= 500:
+                    # Error permanente: reintentar no cambiaría la respuesta
+                    self._give_up(pending[:1], f"rechazado por el servidor ({code})")
+                    pending.pop(0)
+                    continue
+                attempt = self._backoff(attempt, e)
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                attempt = self._backoff(attempt, e)
+            if attempt > self.max_retries:
+                self._give_up(pending, f"{self.max_retries} reintentos agotados")
+                return
+
+    def _backoff(self, attempt, error):
+        attempt += 1
+        if attempt <= self.max_retries:
+            delay = min(self.max_backoff_s, self.backoff_s * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            self.stats['retries'] += 1
+            self.logger.warning(f"Fallo enviando notificaciones ({error}); reintento {attempt} en {delay:.1f} s")
+            self._abort.wait(delay)
+        return attempt
+
+    def _give_up(self, messages, reason):
+        self.stats['failed'] += len(messages)
+        for message, _ in messages:
+            self.logger.error(f"Error enviando alerta '{message['Subject']}': {reason}")
+
+    def _connection(self):
+        """Sesión SMTP autenticada; se comprueba con NOOP si lleva un rato sin usarse"""
+        if self._server is not None and time.monotonic() - self._last_used > self.noop_after_s:
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        if self._server is None:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout_s)
+            try:
+                server.ehlo()
+                if self.use_tls:
+                    server.starttls()
+                    server.ehlo()
+                if self.sender_password:
+                    server.login(self.sender_email, self.sender_password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+            self._last_used = time.monotonic()
+            self.stats['connections'] += 1
+            self.logger.info(f"Sesión SMTP abierta con {self.smtp_server}:{self.smtp_port}")
+        return self._server
+
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def get_stats(self):
+        return dict(self.stats, pending=self.queue.qsize(), connected=self._server is not None)
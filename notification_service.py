@@ -1,111 +1,133 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import logging
-from datetime import datetime
+import math
 import json
-from collections.abc import Sequence
+from alert_dedup import AlertDedupStore
+from notification_channels import NotificationHub, TEMPLATES, make_item
 
 class MaintenanceNotificationService:
-    def __init__(self, config_path='config.json'):
-        self.load_config(config_path)
+    """
+    Avisos de mantenimiento: cooldown compartido por (plc_id, tipo, severidad)
+    y reparto a los canales configurados (email, webhook, fichero/syslog,
+    MQTT), aviso a aviso o en resúmenes por ventana.
+    """
+
+    def __init__(self, config_path='config.json', config=None, dispatcher=None, dedup=None, hub=None):
+        if config is None:
+            self.load_config(config_path)
+        else:
+            self.config = config
         self.setup_logging()
-        self.last_notification = None
-        self.notification_cooldown_hours = 24  # Evitar spam de emails
-        
+        # Cooldown compartido entre procesos por (plc_id, tipo, severidad) para evitar spam de emails
+        self.dedup = dedup
+        # Canales y envío en segundo plano; se crean con el primer aviso
+        self.dispatcher = dispatcher
+        self.hub = hub
+        self.alerts_enabled = self.config.get('notifications', {}).get('alerts_enabled', False)
+
     def load_config(self, config_path):
         with open(config_path, 'r') as f:
             self.config = json.load(f)
-            
+
     def setup_logging(self):
         self.logger = logging.getLogger('MaintenanceNotification')
-        
-    def should_send_notification(self):
-        """Verifica si debemos enviar una nueva notificación"""
-        if not self.last_notification:
-            return True
-            
-        hours_since_last = (datetime.now() - self.last_notification).total_seconds() / 3600
-        return hours_since_last >= self.notification_cooldown_hours
-        
-    def send_maintenance_alert(self, days_to_maintenance, machine_status):
-        """Envía alerta de mantenimiento por email"""
+
+    def get_dedup(self):
+        if self.dedup is None:
+            self.dedup = AlertDedupStore.from_config(self.config)
+        return self.dedup
+
+    def get_hub(self):
+        if self.hub is None:
+            self.hub = NotificationHub.from_config(self.config, dispatcher=self.dispatcher, logger=self.logger)
+        return self.hub
+
+    def should_send_notification(self, plc_id, alert_type, severity):
+        """Verifica si debemos enviar una nueva notificación (y, si es así, abre su cooldown)"""
+        return self.get_dedup().claim(plc_id, alert_type, severity)
+
+    def _submit(self, item):
+        """Pasa el cooldown y encola el aviso; True si sale"""
+        claimed = False
         try:
-            if not self.should_send_notification():
-                self.logger.info("Notificación en cooldown, saltando...")
-                return
-                
-            self.logger.info("Preparando para enviar alerta de mantenimiento...")
-            email_config = self.config['email_notifications']
-            
-            msg = MIMEMultipart()
-            msg['From'] = email_config['sender_email']
-            msg['Subject'] = f"⚠️ Mantenimiento Requerido en {days_to_maintenance:.1f} días"
-            
-            # Crear contenido HTML del email
-            html = f"""
-            <html>
-                <head>
-                    <meta charset="utf-8">  <!-- Especificar UTF-8 -->
-                </head>
-                <body style="font-family: Arial, sans-serif;">
-                    <div style="padding: 20px; background-color: #f8f9fa; border-radius: 10px;">
-                        <h2 style="color: {'red' if days_to_maintenance < 2 else 'orange'};">
-                            ⚠️ Alerta de Mantenimiento
-                        </h2>
-                        
-                        <p>Estado actual:</p>
-                        
-                        <ul>
-                            <li>🌡️ Temperatura: {machine_status['temperature']:.1f}°C</li>
-                            <li>📳 Vibración: {machine_status['vibration']:.2f} mm/s</li>
-                            <li>⚙️ Desgaste: {machine_status['wear_level']*100:.1f}%</li>
-                        </ul>
-                        
-                        <p style="background-color: #e9ecef; padding: 10px; border-radius: 5px;">
-                            Por favor, programe el mantenimiento lo antes posible para evitar fallos del equipo.
-                        </p>
-                        
-                        <div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #dee2e6;">
-                            <small style="color: #6c757d;">
-                                Este es un mensaje automático del Sistema de Mantenimiento Predictivo.
-                                No responda a este email.
-                            </small>
-                        </div>
-                    </div>
-                </body>
-            </html>
-            """
-            
-            # Imprimir contenido del email en los logs
-            self.logger.info("============= CONTENIDO DEL EMAIL =============")
-            self.logger.info(f"De: {email_config['sender_email']}")
-            self.logger.info(f"Para: {', '.join(email_config['recipients'])}")
-            self.logger.info(f"Asunto: {msg['Subject']}")
-            self.logger.info("\nContenido HTML:")
-            self.logger.info(html)
-            self.logger.info("=============================================")
-            
-            part = MIMEText(html, 'html', 'utf-8')  # Especificar UTF-8
-            msg.attach(part)
-            
-            # Conectar y enviar
-            with smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port']) as server:
-                server.starttls()
-                self.logger.info("Intentando autenticar con el servidor SMTP...")
-                server.login(
-                    email_config['sender_email'],
-                    email_config['sender_password']
-                )
-                self.logger.info("Autenticación exitosa, enviando email...")
-                
-                for recipient in email_config['recipients']:
-                    msg['To'] = recipient
-                    server.send_message(msg)
-                    self.logger.info(f"Email enviado a {recipient}")
-                    
-            self.last_notification = datetime.now()
-            self.logger.info(f"Alerta de mantenimiento enviada: {days_to_maintenance:.1f} días")
-            
+            if not self.should_send_notification(item['plc_id'], item['alert_type'], item['severity']):
+                self.logger.debug(f"Notificación de {item['plc_id']} ({item['alert_type']}) en cooldown, saltando...")
+                return False
+            claimed = True
+            if self.get_hub().notify(item):
+                return True
+            # Sin encolar no hay aviso: otro intento puede volver a reclamar la clave
+            self.dedup.release(item['plc_id'], item['alert_type'], item['severity'])
         except Exception as e:
-            self.logger.error(f"Error enviando alerta de mantenimiento: {e}") 
\ No newline at end of file
+            self.logger.error(f"Error enviando alerta de mantenimiento: {e}")
+            if claimed:
+                self.dedup.release(item['plc_id'], item['alert_type'], item['severity'])
+        return False
+
+    def send_maintenance_alert(self, days_to_maintenance, machine_status, plc_id='default'):
+        """Encola la alerta de mantenimiento (el envío es asíncrono)"""
+        severity = 'critical' if days_to_maintenance < 2 else 'warning'
+        values = {
+            'plc_id': str(plc_id),
+            'days': days_to_maintenance,
+            'temperature': machine_status['temperature'],
+            'vibration': machine_status['vibration'],
+            'wear': machine_status['wear_level'] * 100,
+            'color': 'red' if severity == 'critical' else 'orange'
+        }
+        item = make_item(
+            plc_id, 'maintenance', severity,
+            title=f"Mantenimiento requerido en {days_to_maintenance:.1f} días",
+            description=TEMPLATES['maintenance_text'].render(**values),
+            # El email individual conserva su formato; en un resumen va como una fila más
+            subject=TEMPLATES['maintenance_subject'].render(**values),
+            text=TEMPLATES['maintenance_text'].render(**values),
+            html=TEMPLATES['maintenance_html'].render(**values)
+        )
+        if self._submit(item):
+            self.logger.info(f"Alerta de mantenimiento encolada para {plc_id}: {days_to_maintenance:.1f} días")
+
+    def notify_alert(self, alert):
+        """
+        Notifica una alerta del agente: un aviso por modelo, patrón, anomalía o
+        pronóstico, cada uno con su propio cooldown.
+
+        Returns:
+            avisos encolados
+        """
+        if not self.alerts_enabled:
+            return 0
+        plc_id, timestamp = alert.get('plc_id', 'default'), alert.get('timestamp')
+        items = []
+        if alert.get('maintenance_needed'):
+            rul = alert.get('rul_hours')
+            critical = rul is not None and math.isfinite(rul) and rul < 48
+            items.append(make_item(
+                plc_id, 'maintenance_model', 'critical' if critical else 'warning',
+                f"Mantenimiento necesario (probabilidad {alert['probability']:.0%})",
+                f"Vida útil restante estimada: {rul:.1f} h" if rul is not None and math.isfinite(rul) else '',
+                timestamp
+            ))
+        for pattern in alert.get('failure_patterns') or []:
+            items.append(make_item(plc_id, pattern['pattern'], pattern.get('severity', 'warning'),
+                                   pattern.get('description', pattern['pattern']), '', timestamp))
+        for anomaly in alert.get('anomalies') or []:
+            items.append(make_item(plc_id, f"anomaly:{anomaly['sensor']}", 'warning',
+                                   f"Anomalía ({anomaly['type']}) en {anomaly['sensor']}",
+                                   f"Puntuación {anomaly.get('score', 0):.2f}", timestamp))
+        for breach in alert.get('forecast_breaches') or []:
+            items.append(make_item(
+                plc_id, f"forecast:{breach['signal']}", 'warning',
+                f"Pronóstico: {breach['signal']} cruzará {breach['threshold']} en {breach['horizon_h']} h",
+                f"Previsto {breach['forecast']:.2f} (intervalo {breach['lower']:.2f} - {breach['upper']:.2f})",
+                timestamp
+            ))
+        return sum(self._submit(item) for item in items)
+
+    def close(self, timeout=30):
+        """Envía los avisos pendientes y cierra los canales"""
+        if self.hub is not None:
+            self.hub.close(timeout)
+        elif self.dispatcher is not None:
+            self.dispatcher.close(timeout)
+        if self.dedup is not None:
+            self.dedup.close()
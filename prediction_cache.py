@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Caché LRU de predicciones indexada por (plc_id, timestamp, versión del modelo).
+
+    Una misma lectura puntuada con el mismo modelo siempre da el mismo
+    resultado, así que repetir la consulta (el bucle de sondeo sin datos
+    nuevos, una reentrega del stream o varios visores del dashboard) no vuelve
+    a pasar por el modelo. Al cambiar de modelo la caché se vacía: las claves
+    de la versión anterior ya no se van a pedir.
+    """
+
+    def __init__(self, max_entries=10000, persist=True, read_through=False):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.read_through = read_through
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'persisted_hits': 0, 'evictions': 0, 'invalidations': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.get('prediction_cache', {})
+        return cls(
+            max_entries=settings.get('max_entries', 10000),
+            persist=settings.get('persist', True),
+            read_through=settings.get('read_through', False)
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        """Valores cacheados (None si no están) y los marca como usados recientemente"""
+        values = []
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                else:
+                    self.stats['misses'] += 1
+                values.append(value)
+        return values
+
+    def put_many(self, items, from_store=False):
+        """Guarda pares (clave, valor) y expulsa los menos usados si se supera el tamaño"""
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                if from_store:
+                    # Un fallo en memoria resuelto desde la tabla no ha necesitado inferencia
+                    self.stats['persisted_hits'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self):
+        """Vacía la caché (se llama al intercambiar el modelo)"""
+        with self._lock:
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+
+    def get_stats(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        served = self.stats['hits'] + self.stats['persisted_hits']
+        return dict(
+            self.stats,
+            size=len(self._entries),
+            hit_rate=self.stats['hits'] / lookups if lookups else None,
+            served_without_inference=served / lookups if lookups else None
+        )
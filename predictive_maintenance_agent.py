@@ -1,36 +1,89 @@
 # -*- coding: utf-8 -*-
 from notification_service import MaintenanceNotificationService
+from sensor_cache import SensorWindowCache
+from transport import create_transport
+from model_registry import ModelRegistry, ModelWatcher
+from retrain_scheduler import RetrainScheduler
+from incremental_training import add_trees, update_feature_stats
+from training_data import TrainingDataLoader
+from training_snapshots import TrainingSnapshotStore
+from model_search import ModelSearch, build_model, holdout_metrics
+from failure_rules import FailureRuleEngine
+from anomaly_detection import StreamingAnomalyDetector, SENSOR_COLUMNS
+from rul_estimator import TrendRULEstimator, rul_from_probability
+from sensor_forecast import FleetForecaster
+from prediction_cache import PredictionCache
+from batch_scoring import score_matrix, ensure_predictions_table, ensure_latest_reading_index, copy_predictions
+from alert_store import AlertStore
+from clock import SystemClock
+from feature_pipeline import (
+    FEATURE_COLUMNS, FEATURE_VERSION, build_features, scale_features, check_feature_version
+)
+from synthetic_data import generate_feature_samples
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestClassifier
-import joblib
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import logging
 import json
 from datetime import datetime, timedelta
 import time
+from collections import deque
 import warnings
 warnings.filterwarnings('ignore')
 
 class PredictiveMaintenanceAgent:
-    def __init__(self, config_path='config.json'):
+    def __init__(self, config_path='config.json', config=None, clock=None, alert_store=None):
         self.setup_logging()
-        self.load_config(config_path)
+        if config is None:
+            self.load_config(config_path)
+        else:
+            self.config = config
+        # Reloj de las alertas y de los intervalos; en la reproducción de histórico es virtual
+        self.clock = clock or SystemClock()
         self.setup_database_connection()
-        self.model = self.initialize_model()
-        self.scaler = StandardScaler()
-        self.failure_patterns = self._initialize_failure_patterns()
-        self.maintenance_history = []
-        self.alert_thresholds = {
-            'temperature': {'warning': 75, 'critical': 85},
-            'vibration': {'warning': 0.7, 'critical': 0.9},
-            'pressure': {'warning': 90, 'critical': 85},
-            'oil_level': {'warning': 0.3, 'critical': 0.2}
-        }
-        self.notification_service = MaintenanceNotificationService()
+        self.window_cache = None
+        self.training_loader = None
+        self.registry = ModelRegistry.from_config(self.config)
+        self.pipeline = self.initialize_model()
+        self.model_watcher = None
+        self.retrain_scheduler = None
+        self.rule_engine = FailureRuleEngine.from_config(self.config, FEATURE_COLUMNS)
+        self.anomaly_detector = StreamingAnomalyDetector.from_config(self.config, SENSOR_COLUMNS)
+        self.rul_estimator = TrendRULEstimator.from_config(self.config)
+        # Pronóstico de sensores de toda la flota; un pase por intervalo
+        self.forecaster = FleetForecaster.from_config(self.config, self.rule_engine.thresholds)
+        self.latest_forecast = {}
+        self.forecast_breaches = {}
+        # Señales con cruce esperado ya alertado, por máquina (solo las mantiene forecast_fleet)
+        self.alerted_breaches = {}
+        self.last_forecast_time = 0.0
+        self.prediction_cache = PredictionCache.from_config(self.config)
+        self.predictions_table_ready = False
+        self.last_seen = {}
+        self.latest_predictions = {}
+        # Historial de alertas acotado: anillo en memoria y log JSONL segmentado
+        self.alert_store = alert_store or AlertStore.from_config(self.config)
+        self.alert_thresholds = self.rule_engine.thresholds
+        self.notification_service = MaintenanceNotificationService(config=self.config)
+        self.decision_latencies = deque(maxlen=10000)
+        self.batch_processing_times = deque(maxlen=1000)
+        # 'auto': bosque aplanado para lotes pequeños, sklearn para lotes grandes
+        self.inference_engine = self.config.get('agent', {}).get('inference_engine', 'auto')
+        self.flat_max_rows = self.config.get('agent', {}).get('flat_max_rows', 512)
+        if self.config.get('model_registry', {}).get('watch', True):
+            self.start_model_watcher()
         
+    @property
+    def model(self):
+        return self.pipeline['model']
+
+    @property
+    def scaler(self):
+        return self.pipeline['scaler']
+
     def setup_logging(self):
         """Configura el sistema de logging con UTF-8"""
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -64,105 +117,414 @@ class PredictiveMaintenanceAgent:
         except Exception as e:
             self.logger.error(f"Error conectando a la base de datos: {e}")
 
-    def fetch_training_data(self, days=30):
-        """Obtiene datos históricos para entrenamiento"""
-        query = f"""
-        SELECT 
-            temperature, vibration, pressure, rotation_speed,
-            power_consumption, noise_level, oil_level, humidity,
-            machine_age, wear_level, maintenance_needed
+    def get_window_cache(self):
+        """Mapea en solo lectura la caché de ventana reciente del consumidor"""
+        if self.window_cache is None:
+            try:
+                self.window_cache = SensorWindowCache.from_config(self.config, readonly=True)
+            except Exception as e:
+                self.logger.warning(f"Caché de ventana no disponible: {e}")
+        return self.window_cache
+
+    def fetch_latest_reading(self):
+        """Última lectura registrada, desde la caché compartida o desde la BD"""
+        window_cache = self.get_window_cache()
+        if window_cache is not None:
+            latest = window_cache.latest()
+            if latest is not None:
+                frame = pd.DataFrame([{col: latest[col] for col in ['plc_id', 'timestamp'] + FEATURE_COLUMNS}])
+                frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='s')
+                return frame
+
+        query = """
+        SELECT plc_id, timestamp, temperature, vibration, pressure, rotation_speed,
+               power_consumption, noise_level, oil_level, humidity,
+               machine_age, wear_level
         FROM plc_mech
-        WHERE timestamp >= NOW() - INTERVAL '{days} days'
+        ORDER BY timestamp DESC
+        LIMIT 1
         """
         return pd.read_sql(query, self.engine)
 
-    def preprocess_data(self, df):
-        """Preprocesa los datos para el modelo"""
-        # Separar features y target
-        X = df.drop('maintenance_needed', axis=1)
-        y = df['maintenance_needed']
-        
-        # Escalar características
-        X_scaled = self.scaler.fit_transform(X)
-        
-        return X_scaled, y
+    def fetch_training_data(self, days=None, since=None):
+        """
+        Obtiene datos históricos para entrenamiento por bloques y en float32.
 
-    def train_model(self):
-        """Entrena el modelo de mantenimiento predictivo"""
+        Con training_snapshots.enabled se leen del snapshot local, que antes
+        copia de la BD solo las lecturas posteriores a su watermark.
+
+        Args:
+            days: ventana en días (por defecto training_data.days)
+            since: si se indica, solo las lecturas posteriores a este watermark
+
+        Returns:
+            (X sin escalar, y, timestamps) ordenados por timestamp
+        """
+        training_config = self.config.get('training_data', {})
+        self.training_loader = TrainingDataLoader(
+            self.engine, FEATURE_COLUMNS,
+            chunk_size=training_config.get('chunk_size', 100000),
+            logger=self.logger
+        )
+        if self.config.get('training_snapshots', {}).get('enabled', False):
+            store = TrainingSnapshotStore.from_config(self.config, self.training_loader, logger=self.logger)
+            store.sync(days=days or training_config.get('days', 30))
+            self.training_loader = store
+        if since is not None:
+            days = None
+        elif days is None:
+            days = training_config.get('days', 30)
+        return self.training_loader.load(
+            days=days, since=since,
+            sample_size=training_config.get('max_rows'),
+            seed=training_config.get('seed', 42)
+        )
+
+    def preprocess_data(self, X, scaler=None):
+        """Escala las features; con un scaler nuevo el del modelo en servicio no se toca"""
+        if scaler is None:
+            # Un scaler nuevo escala in situ el array float32 sin duplicarlo
+            scaler = StandardScaler().fit(X)
+            X_scaled = scale_features(X, scaler, out=X if X.dtype == np.float32 else None)
+        else:
+            X_scaled = scale_features(X, scaler)
+        return X_scaled, scaler
+
+    def train_model(self, promote=True, n_jobs=None, validation_fraction=0.2):
+        """
+        Entrena el modelo de mantenimiento predictivo y lo publica en el registro.
+
+        Las métricas se calculan sobre el tramo más reciente de los datos
+        (validación temporal), que no se usa para entrenar.
+
+        Args:
+            promote: si False se registra como candidato sin pasarlo a producción
+            n_jobs: núcleos para el bosque aleatorio
+            validation_fraction: fracción final de los datos reservada para validar
+        """
         try:
             # Obtener datos
             self.logger.info("Obteniendo datos de entrenamiento...")
-            df = self.fetch_training_data()
+            X, y, timestamps = self.fetch_training_data()
             
-            if df.empty:
+            if len(y) == 0:
+                if self.pipeline['version'] != 'untrained' or not promote:
+                    self.logger.warning("No hay datos reales, se mantiene el modelo actual")
+                    return None
                 self.logger.warning("No hay datos reales, usando datos dummy para entrenamiento inicial")
-                X = np.random.rand(100, 10)
-                y = np.random.randint(2, size=100)
+                X, y = generate_feature_samples()
+                X, scaler = self.preprocess_data(X)
+                watermark = None
+                parity_sample = None
             else:
+                # Muestra sin escalar para verificar el bosque aplanado (se escala in situ)
+                parity_sample = X[-1000:].copy()
                 # Preprocesar datos reales
-                X, y = self.preprocess_data(df)
-            
-            # Entrenar modelo
-            self.model.fit(X, y)
+                X, scaler = self.preprocess_data(X)
+                watermark = pd.Timestamp(timestamps.max()).isoformat()
             
-            # Guardar modelo
-            joblib.dump(self.model, 'maintenance_model.joblib')
+            # Separación temporal: los datos ya vienen ordenados por timestamp
+            split = int(len(y) * (1 - validation_fraction))
+            X_train, y_train, X_val, y_val = X[:split], y[:split], X[split:], y[split:]
             
-            self.logger.info("Modelo entrenado y guardado correctamente")
+            # Entrenar modelo
+            model = self._new_model(n_jobs=n_jobs)
+            model.fit(X_train, y_train)
             
             # Calcular métricas de eficacia
             from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
             
-            y_pred = self.model.predict(X)
-            accuracy = accuracy_score(y, y_pred)
-            precision = precision_score(y, y_pred)
-            recall = recall_score(y, y_pred)
-            f1 = f1_score(y, y_pred)
+            y_pred = model.predict(X_val)
+            metrics = {
+                'accuracy': accuracy_score(y_val, y_pred),
+                'precision': precision_score(y_val, y_pred, zero_division=0),
+                'recall': recall_score(y_val, y_pred, zero_division=0),
+                'f1': f1_score(y_val, y_pred, zero_division=0),
+                'validation_rows': int(len(y_val))
+            }
+            
+            self.logger.info(f"Metricas del modelo: Precision: {metrics['precision']:.2f}, Recuperacion: {metrics['recall']:.2f}, F1: {metrics['f1']:.2f}, Exactitud: {metrics['accuracy']:.2f}")
+            
+            # Registrar la versión (scaler + modelo + features)
+            version = self.registry.register(
+                model, scaler, FEATURE_COLUMNS, metrics,
+                metadata={
+                    'training_rows': int(len(y_train)),
+                    'watermark': watermark,
+                    'peak_rss_mb': self.training_loader.stats['peak_rss_mb'],
+                    'feature_version': FEATURE_VERSION
+                },
+                promote=promote,
+                parity_sample=parity_sample
+            )
+            if not promote:
+                self.logger.info(f"Candidato {version} registrado sin promocionar")
+                return self.registry.load(version)
+            self.swap_pipeline(self.registry.load(version))
             
-            self.logger.info(f"Metricas del modelo: Precision: {precision:.2f}, Recuperacion: {recall:.2f}, F1: {f1:.2f}, Exactitud: {accuracy:.2f}")
+            self.logger.info(f"Modelo entrenado y guardado correctamente ({version})")
+            return self.pipeline
             
         except Exception as e:
             self.logger.error(f"Error en entrenamiento: {e}")
 
+    def train_search(self, promote=True, n_workers=None, n_splits=3, validation_fraction=0.2, search_space=None):
+        """
+        Busca en paralelo la mejor familia de modelo e hiperparámetros y registra el ganador.
+
+        La búsqueda usa validación cruzada temporal sobre el tramo de
+        entrenamiento; el ganador se reentrena con todos los núcleos y se valida
+        sobre el mismo tramo final que train_model, así sus métricas son
+        comparables con las del modelo en servicio.
+
+        Returns:
+            (pipeline registrado, informe de la búsqueda) o (None, None) sin datos
+        """
+        X, y, timestamps = self.fetch_training_data()
+        if len(y) == 0:
+            self.logger.warning("No hay datos reales para la búsqueda de modelos")
+            return None, None
+
+        split = int(len(y) * (1 - validation_fraction))
+        search = ModelSearch(search_space, n_splits=n_splits, n_workers=n_workers, logger=self.logger)
+        report = search.run(X[:split], y[:split])
+
+        # El scaler se ajusta solo con el tramo de entrenamiento, igual que en la búsqueda
+        scaler = StandardScaler().fit(X[:split])
+        X_scaled = scale_features(X, scaler)
+        best = report['best']
+        start = time.perf_counter()
+        model = build_model(best['family'], best['params'], n_jobs=-1)
+        model.fit(X_scaled[:split], y[:split])
+        report['refit_s'] = time.perf_counter() - start
+        metrics = holdout_metrics(model, X_scaled[split:], y[split:])
+        self.logger.info(f"Metricas del mejor modelo ({best['family']}): F1: {metrics['f1']:.2f}, Exactitud: {metrics['accuracy']:.2f}")
+
+        version = self.registry.register(
+            model, scaler, FEATURE_COLUMNS, metrics,
+            metadata={
+                'training_rows': int(split),
+                'watermark': pd.Timestamp(timestamps.max()).isoformat(),
+                'peak_rss_mb': self.training_loader.stats['peak_rss_mb'],
+                'search': {k: v for k, v in report.items() if k != 'candidates'},
+                'feature_version': FEATURE_VERSION
+            },
+            promote=promote,
+            parity_sample=X[-1000:]
+        )
+        if promote:
+            self.swap_pipeline(self.registry.load(version))
+            return self.pipeline, report
+        return self.registry.load(version), report
+
+    def train_incremental(self, n_new_trees=10, max_trees=300, promote=True, validation_fraction=0.2):
+        """
+        Actualiza el modelo actual solo con los datos posteriores a su watermark.
+
+        Se añaden árboles entrenados con los datos nuevos (warm start) sobre el
+        scaler congelado del modelo, y las estadísticas de las features se
+        actualizan de forma incremental. El coste es proporcional a los datos
+        nuevos, no a la ventana completa. Si en los datos nuevos falta alguna
+        clase del modelo la actualización se omite, y con promote solo se promociona
+        si pasa min_f1 y no empeora el F1 del modelo actual más de max_f1_drop
+        (los mismos umbrales de 'retraining' que aplica el planificador).
+
+        Returns:
+            El pipeline registrado o None si no se pudo actualizar
+        """
+        pipeline = self.pipeline
+        watermark = (pipeline.get('metadata') or {}).get('watermark')
+        if pipeline['scaler'] is None or watermark is None or not hasattr(pipeline['model'], 'estimators_'):
+            self.logger.warning("El modelo actual no admite actualización incremental, entrenando completo...")
+            return self.train_model(promote=promote)
+
+        try:
+            self.logger.info(f"Obteniendo datos posteriores a {watermark}...")
+            X_raw, y, timestamps = self.fetch_training_data(since=watermark)
+            if len(y) == 0:
+                self.logger.info("No hay datos nuevos desde el último entrenamiento")
+                return None
+
+            X, _ = self.preprocess_data(X_raw, scaler=pipeline['scaler'])
+            split = int(len(y) * (1 - validation_fraction))
+
+            model = add_trees(pipeline['model'], X[:split], y[:split], n_new_trees, max_trees)
+            if model is None:
+                # Faltan clases en los datos nuevos: se reintenta cuando haya más
+                return None
+            feature_stats = update_feature_stats(pipeline.get('feature_stats') or pipeline['scaler'], X_raw)
+
+            from sklearn.metrics import accuracy_score, f1_score
+            y_pred = model.predict(X[split:])
+            metrics = {
+                'accuracy': accuracy_score(y[split:], y_pred),
+                'f1': f1_score(y[split:], y_pred, zero_division=0),
+                'validation_rows': int(len(y) - split)
+            }
+            self.logger.info(f"Metricas incrementales: F1: {metrics['f1']:.2f}, Exactitud: {metrics['accuracy']:.2f}")
+
+            version = self.registry.register(
+                model, pipeline['scaler'], FEATURE_COLUMNS, metrics,
+                metadata={
+                    'training_rows': int(split),
+                    'watermark': pd.Timestamp(timestamps.max()).isoformat(),
+                    'incremental_from': pipeline['version'],
+                    'peak_rss_mb': self.training_loader.stats['peak_rss_mb'],
+                    'n_trees': len(model.estimators_),
+                    'feature_version': FEATURE_VERSION
+                },
+                promote=False,
+                extra={'feature_stats': feature_stats},
+                parity_sample=X_raw[-1000:]
+            )
+            if not promote:
+                return self.registry.load(version)
+
+            retraining = self.config.get('retraining', {})
+            current_f1 = (pipeline.get('metrics') or {}).get('f1')
+            if metrics['f1'] < retraining.get('min_f1', 0.6):
+                self.logger.warning(f"Versión {version} sin promocionar: F1 {metrics['f1']:.3f} bajo el mínimo")
+                return self.registry.load(version)
+            if current_f1 is not None and metrics['f1'] < current_f1 - retraining.get('max_f1_drop', 0.02):
+                self.logger.warning(
+                    f"Versión {version} sin promocionar: F1 {metrics['f1']:.3f} peor que "
+                    f"{pipeline['version']} ({current_f1:.3f})"
+                )
+                return self.registry.load(version)
+            self.registry.promote(version)
+            self.swap_pipeline(self.registry.load(version))
+            return self.pipeline
+
+        except Exception as e:
+            self.logger.error(f"Error en entrenamiento incremental: {e}")
+            return None
+
     def predict_maintenance(self, current_data):
         """Predice si se necesita mantenimiento basado en datos actuales"""
         try:
-            if self.model is None:
-                self.model = joblib.load('maintenance_model.joblib')
-                self.scaler = StandardScaler()
-            
-            # Preparar datos
-            data_scaled = self.scaler.transform(current_data)
-            
-            # Realizar predicción
-            prediction = self.model.predict(data_scaled)
-            probability = self.model.predict_proba(data_scaled)
+            # Memoizado por lectura y versión del modelo: sin datos nuevos no se repite la inferencia
+            prediction = self.predict_cached(current_data).iloc[0]
             
             return {
-                'needs_maintenance': bool(prediction[0]),
-                'probability': float(probability[0][1]),
-                'timestamp': datetime.now()
+                'needs_maintenance': bool(prediction['needs_maintenance']),
+                'probability': float(prediction['probability']),
+                'timestamp': datetime.now(),
+                'cached': bool(prediction['cached'])
             }
             
         except Exception as e:
             self.logger.error(f"Error en predicción: {e}")
             return None
 
+    def predict_cached(self, current_data):
+        """
+        Predicciones de un lote con caché por (plc_id, timestamp, versión del modelo).
+
+        Solo las lecturas que no están en la caché (ni, con read_through, en
+        la tabla predictions) pasan por el modelo y por el estimador de RUL;
+        sus resultados se guardan en la caché y en la tabla.
+
+        Returns:
+            DataFrame alineado con el lote: needs_maintenance, probability,
+            rul_hours, rul_lower_hours, rul_upper_hours, rul_signal y cached
+        """
+        pipeline = self.pipeline
+        version = pipeline['version']
+        plc_ids, timestamps = self._batch_keys(current_data)
+        timestamps = np.asarray(timestamps)
+        # Sin timestamp en el lote se usa el epoch actual (la lectura no se volverá a pedir)
+        timestamps = pd.to_datetime(timestamps, unit='s') if timestamps.dtype.kind == 'f' else pd.to_datetime(timestamps)
+        keys = [(plc_id, ts, version) for plc_id, ts in zip(plc_ids, timestamps)]
+        values = self.prediction_cache.get_many(keys)
+        cached = np.array([value is not None for value in values], dtype=bool)
+
+        missing = np.flatnonzero(~cached)
+        if len(missing) and self.prediction_cache.read_through:
+            stored = self.load_persisted_predictions([keys[i] for i in missing])
+            if stored:
+                self.prediction_cache.put_many(stored.items(), from_store=True)
+                for i in missing:
+                    values[i] = stored.get(keys[i])
+                cached = np.array([value is not None for value in values], dtype=bool)
+                missing = np.flatnonzero(~cached)
+
+        if len(missing):
+            subset = current_data.iloc[missing]
+            needs_maintenance, probability = self.score_batch(subset, pipeline)
+            rul = self.estimate_rul(subset, probability)
+            computed = pd.DataFrame({
+                'needs_maintenance': needs_maintenance,
+                'probability': probability,
+                'rul_hours': rul['rul_hours'],
+                'rul_lower_hours': rul['rul_lower_hours'],
+                'rul_upper_hours': rul['rul_upper_hours'],
+                'rul_signal': rul['signal']
+            })
+            records = computed.to_dict('records')
+            self.prediction_cache.put_many((keys[i], record) for i, record in zip(missing, records))
+            for i, record in zip(missing, records):
+                values[i] = record
+            if self.prediction_cache.persist:
+                computed['plc_id'] = [keys[i][0] for i in missing]
+                computed['timestamp'] = [keys[i][1] for i in missing]
+                self.persist_predictions(computed, version)
+
+        result = pd.DataFrame(values, index=current_data.index)
+        result['cached'] = cached
+        return result
+
+    def persist_predictions(self, frame, model_version):
+        """Guarda predicciones nuevas en la tabla predictions; un fallo de la BD no detiene la inferencia"""
+        try:
+            if not self.predictions_table_ready:
+                self.ensure_predictions_table()
+                self.predictions_table_ready = True
+            self.write_predictions(frame, model_version)
+        except Exception as e:
+            self.logger.error(f"Error guardando predicciones: {e}")
+
+    def load_persisted_predictions(self, keys):
+        """Predicciones ya guardadas por otro proceso para las claves indicadas"""
+        if not keys:
+            return {}
+        try:
+            frame = pd.read_sql(
+                text("""
+                    SELECT p.plc_id, p.timestamp, p.model_version, p.needs_maintenance, p.probability,
+                           p.rul_hours, p.rul_lower_hours, p.rul_upper_hours
+                    FROM predictions p
+                    JOIN unnest(CAST(:plc_ids AS VARCHAR[]), CAST(:timestamps AS TIMESTAMP[])) AS k(plc_id, timestamp)
+                      ON p.plc_id = k.plc_id AND p.timestamp = k.timestamp
+                    WHERE p.model_version = :model_version
+                """),
+                self.engine,
+                params={
+                    'plc_ids': [key[0] for key in keys],
+                    'timestamps': [key[1].to_pydatetime() for key in keys],
+                    'model_version': keys[0][2]
+                }
+            )
+        except Exception as e:
+            self.logger.error(f"Error leyendo predicciones guardadas: {e}")
+            return {}
+        columns = ['needs_maintenance', 'probability', 'rul_hours', 'rul_lower_hours', 'rul_upper_hours']
+        return {
+            (row['plc_id'], pd.Timestamp(row['timestamp']), row['model_version']): {
+                col: (np.nan if row[col] is None else row[col]) for col in columns
+            }
+            for row in frame.to_dict('records')
+        }
+
     def analyze_feature_importance(self):
         """Analiza la importancia de cada caracteristica"""
         try:
             if not hasattr(self.model, 'feature_importances_'):
                 self.logger.warning("Modelo no entrenado completamente, entrenando con datos dummy...")
                 # Crear y entrenar con datos dummy si es necesario
-                X = np.random.rand(100, 10)
-                y = np.random.randint(2, size=100)
+                X, y = generate_feature_samples()
                 self.model.fit(X, y)
                 
-            feature_names = [
-                'temperature', 'vibration', 'pressure', 'rotation_speed',
-                'power_consumption', 'noise_level', 'oil_level', 'humidity',
-                'machine_age', 'wear_level'
-            ]
+            feature_names = self.pipeline.get('features') or FEATURE_COLUMNS
             
             importances = pd.DataFrame({
                 'feature': feature_names,
@@ -176,68 +538,137 @@ class PredictiveMaintenanceAgent:
         except Exception as e:
             self.logger.error(f"Error en analisis de caracteristicas: {e}")
 
-    def _initialize_failure_patterns(self):
-        """Inicializa patrones conocidos de fallo"""
-        return {
-            'bearing_failure': {
-                'conditions': {
-                    'vibration': lambda x: x > 0.8,
-                    'temperature': lambda x: x > 80,
-                    'noise_level': lambda x: x > 85
-                },
-                'description': 'Posible fallo en rodamientos'
-            },
-            'oil_degradation': {
-                'conditions': {
-                    'oil_level': lambda x: x < 0.3,
-                    'temperature': lambda x: x > 75
-                },
-                'description': 'Degradación del aceite detectada'
-            },
-            'overheating': {
-                'conditions': {
-                    'temperature': lambda x: x > 85,
-                    'power_consumption': lambda x: x > 90
-                },
-                'description': 'Sobrecalentamiento crítico'
-            }
-        }
-
     def calculate_remaining_useful_life(self, current_data):
         """Calcula la vida útil restante estimada"""
         try:
-            # Usar modelo de regresión para RUL
-            features = self.scaler.transform(current_data)
-            wear_rate = self.model.predict_proba(features)[0][1]
-            
-            # Estimación básica de RUL basada en desgaste
-            max_age = 8760  # 1 año en horas
-            current_age = current_data['machine_age'].iloc[0]
-            rul = max_age * (1 - wear_rate) - current_age
-            
-            return max(0, rul)
+            return float(self.predict_cached(current_data)['rul_hours'].iloc[0])
         except Exception as e:
             self.logger.error(f"Error calculando RUL: {e}")
             return None
 
+    def estimate_rul(self, current_data, probability=None):
+        """
+        RUL por tendencia de degradación para cada fila de un lote.
+
+        Actualiza la ventana de cada máquina con las lecturas y estima el tiempo
+        hasta el umbral con sus cotas de confianza. Mientras una máquina no
+        tiene lecturas suficientes en su ventana, rul_hours se completa con la
+        estimación por probabilidad (sin cotas).
+        """
+        plc_ids, timestamps = self._batch_keys(current_data)
+        signals = build_features(current_data, self.rul_estimator.names, dtype=np.float64)
+        self.rul_estimator.update(plc_ids, timestamps, signals)
+        estimate = self.rul_estimator.estimate(plc_ids)
+        missing = np.isnan(estimate['rul_hours'])
+        if probability is not None and missing.any():
+            fallback = np.atleast_1d(rul_from_probability(probability, current_data['machine_age'].to_numpy()))
+            estimate['rul_hours'] = np.where(missing, fallback, estimate['rul_hours'])
+        return estimate
+
     def detect_failure_patterns(self, current_data):
-        """Detecta patrones de fallo conocidos"""
-        active_patterns = []
-        
-        for pattern_name, pattern in self.failure_patterns.items():
-            conditions_met = all(
-                condition(current_data[param].iloc[0])
-                for param, condition in pattern['conditions'].items()
-            )
-            
-            if conditions_met:
-                active_patterns.append({
-                    'pattern': pattern_name,
-                    'description': pattern['description'],
-                    'timestamp': datetime.now()
-                })
-        
-        return active_patterns
+        """
+        Evalúa todas las reglas de fallo sobre un lote en una sola llamada.
+
+        Si el lote trae plc_id y timestamp, las duraciones y la histéresis se
+        aplican con el estado de cada máquina.
+
+        Returns:
+            lista con los patrones activos de cada fila
+        """
+        plc_ids, timestamps = self._batch_keys(current_data)
+        X = build_features(current_data, dtype=np.float64)
+        active = self.rule_engine.update(plc_ids, timestamps, X)
+        # Cada patrón lleva la hora de su lectura (en la reproducción, la del histórico)
+        if 'timestamp' in current_data:
+            when = pd.to_datetime(current_data['timestamp']).dt.to_pydatetime()
+        else:
+            when = self.clock.now()
+        return self.rule_engine.describe(active, when)
+
+    def _batch_keys(self, current_data):
+        """plc_id y timestamp de cada fila (valores por defecto si el lote no los trae)"""
+        n = len(current_data)
+        plc_ids = current_data['plc_id'].tolist() if 'plc_id' in current_data else ['default'] * n
+        timestamps = current_data['timestamp'] if 'timestamp' in current_data else np.full(n, self.clock.time())
+        return plc_ids, timestamps
+
+    def detect_anomalies(self, current_data):
+        """
+        Actualiza los detectores en streaming con un lote y devuelve sus marcas.
+
+        Returns:
+            lista con las anomalías (sensor, tipo y puntuación) de cada fila
+        """
+        plc_ids, timestamps = self._batch_keys(current_data)
+        X = build_features(current_data, SENSOR_COLUMNS, dtype=np.float64)
+        return self.anomaly_detector.describe(self.anomaly_detector.update(plc_ids, timestamps, X))
+
+    def update_forecasts(self, current_data, alert=True):
+        """
+        Añade un lote a los modelos de pronóstico y pronostica la flota si toca un pase.
+
+        Args:
+            alert: si False (dashboard) solo se actualiza latest_forecast; las
+                alertas de pronóstico las emiten únicamente los bucles del agente
+        """
+        plc_ids, timestamps = self._batch_keys(current_data)
+        Y = build_features(current_data, self.forecaster.names, dtype=np.float64)
+        self.forecaster.update(plc_ids, timestamps, Y)
+        if self.clock.time() - self.last_forecast_time >= self.forecaster.interval_s:
+            if alert:
+                return self.forecast_fleet()
+            self.refresh_forecast()
+        return []
+
+    def refresh_forecast(self):
+        """Pronostica todas las máquinas en un solo pase y actualiza latest_forecast y forecast_breaches"""
+        self.last_forecast_time = self.clock.time()
+        forecast = self.forecaster.forecast()
+        self.forecast_breaches = self.forecaster.breaches(forecast)
+        self.latest_forecast = self.forecaster.to_records(forecast)
+        return self.forecast_breaches
+
+    def forecast_fleet(self):
+        """
+        Pronostica la flota (refresh_forecast) y alerta de los cruces de umbral
+        esperados que no estaban en el pase anterior.
+
+        Returns:
+            lista de alertas generadas
+        """
+        breaches = self.refresh_forecast()
+
+        alerts = []
+        for plc_id, found in breaches.items():
+            previous = self.alerted_breaches.get(plc_id, set())
+            new = [b for b in found if b['likelihood'] == 'expected' and b['signal'] not in previous]
+            if not new:
+                continue
+            for breach in new:
+                self.logger.warning(
+                    f"Pronóstico: {plc_id} cruzará el umbral de {breach['signal']} ({breach['threshold']}) "
+                    f"en {breach['horizon_h']} h (previsto {breach['forecast']:.2f}, "
+                    f"intervalo {breach['lower']:.2f} - {breach['upper']:.2f})"
+                )
+            alert = {
+                'timestamp': self.clock.now(),
+                'plc_id': plc_id,
+                'alert_type': 'forecast',
+                'maintenance_needed': False,
+                'probability': None,
+                'rul_hours': None,
+                'failure_patterns': [],
+                'anomalies': [],
+                'forecast_breaches': new
+            }
+            self.alert_store.append(alert)
+            self.notification_service.notify_alert(alert)
+            alerts.append(alert)
+        self.alerted_breaches = {
+            plc_id: {b['signal'] for b in found if b['likelihood'] == 'expected'}
+            for plc_id, found in breaches.items()
+        }
+        return alerts
 
     def monitor_and_predict(self):
         """Monitoreo continuo y predicción mejorada"""
@@ -245,91 +676,442 @@ class PredictiveMaintenanceAgent:
         
         while True:
             try:
-                query = """
-                SELECT temperature, vibration, pressure, rotation_speed,
-                       power_consumption, noise_level, oil_level, humidity,
-                       machine_age, wear_level
-                FROM plc_mech
-                ORDER BY timestamp DESC
-                LIMIT 1
-                """
-                current_data = pd.read_sql(query, self.engine)
+                current_data = self.fetch_latest_reading()
                 
                 if not current_data.empty:
                     # Predicción de mantenimiento
                     prediction = self.predict_maintenance(current_data)
                     
-                    # Calcular RUL
-                    rul = self.calculate_remaining_useful_life(current_data)
-                    
-                    # Detectar patrones de fallo
-                    failure_patterns = self.detect_failure_patterns(current_data)
-                    
-                    # Generar alertas si es necesario
-                    if prediction['needs_maintenance'] or failure_patterns:
-                        alert = {
-                            'timestamp': datetime.now(),
-                            'maintenance_needed': prediction['needs_maintenance'],
-                            'probability': prediction['probability'],
-                            'rul_hours': rul,
-                            'failure_patterns': failure_patterns,
-                            'current_values': current_data.to_dict('records')[0]
-                        }
-                        
-                        self.logger.warning(f"""
-                        🚨 ALERTA DE MANTENIMIENTO
-                        Probabilidad de fallo: {alert['probability']:.2%}
-                        Vida util restante estimada: {alert['rul_hours']:.1f} horas
-                        
-                        Patrones de fallo detectados:
-                        {json.dumps(failure_patterns, indent=2)}
-                        
-                        Valores actuales:
-                        {json.dumps(alert['current_values'], indent=2)}
-                        """)
-                        
-                        # Guardar alerta en historial
-                        self.maintenance_history.append(alert)
-                    
-                    # Reentrenar modelo periódicamente
-                    if datetime.now().hour == 0:
-                        self.train_model()
-                        self.analyze_feature_importance()
+                    # Sin lectura nueva la predicción sale de la caché y la alerta ya se evaluó
+                    if prediction is not None and not prediction['cached']:
+                        # Calcular RUL
+                        rul = self.calculate_remaining_useful_life(current_data)
                         
-                        # Guardar historial de mantenimiento
-                        with open('maintenance_history.json', 'w') as f:
-                            json.dump(self.maintenance_history, f, default=str)
+                        self.evaluate_reading(current_data, prediction, rul)
+                        self.update_forecasts(current_data)
+                
+                # Las alertas se escriben por lotes; sin alertas nuevas el búfer se vacía por tiempo
+                self.alert_store.maybe_flush()
                 
             except Exception as e:
                 self.logger.error(f"Error en monitoreo: {e}")
             
             time.sleep(30)
 
-    def get_predictions(self, data):
-        maintenance_time = self.estimate_maintenance_time(data)
-        anomalies = self.detect_anomalies(data)
-        patterns = self.analyze_patterns(data)
+    def evaluate_reading(self, current_data, prediction, rul, failure_patterns=None, anomalies=None,
+                         plc_id=None, rul_bounds=None):
+        """Genera la alerta de una lectura ya puntuada (detecta patrones y anomalías si no se pasan)"""
+        # Detectar patrones de fallo
+        if failure_patterns is None:
+            failure_patterns = self.detect_failure_patterns(current_data)[0]
+        if anomalies is None:
+            anomalies = self.detect_anomalies(current_data)[0]
         
+        # Generar alertas si es necesario
+        if prediction['needs_maintenance'] or failure_patterns or anomalies:
+            if plc_id is None:
+                plc_id = current_data['plc_id'].iloc[0] if 'plc_id' in current_data else 'default'
+            alert = {
+                'timestamp': self.clock.now(),
+                'plc_id': plc_id,
+                'maintenance_needed': prediction['needs_maintenance'],
+                'probability': prediction['probability'],
+                'rul_hours': rul,
+                'failure_patterns': failure_patterns,
+                'anomalies': anomalies,
+                'current_values': current_data.to_dict('records')[0]
+            }
+            if rul_bounds is not None:
+                alert['rul_lower_hours'], alert['rul_upper_hours'] = rul_bounds
+            
+            self.logger.warning(f"""
+            🚨 ALERTA DE MANTENIMIENTO
+            Probabilidad de fallo: {alert['probability']:.2%}
+            Vida util restante estimada: {alert['rul_hours']:.1f} horas
+            
+            Patrones de fallo detectados:
+            {json.dumps(failure_patterns, indent=2, default=str)}
+            
+            Anomalías:
+            {json.dumps(anomalies, indent=2, default=str)}
+            
+            Valores actuales:
+            {json.dumps(alert['current_values'], indent=2, default=str)}
+            """)
+            
+            # Guardar alerta en historial y avisar (con cooldown y, si se configura, en resúmenes)
+            self.alert_store.append(alert)
+            self.notification_service.notify_alert(alert)
+            return alert
+        return None
+
+    def score_batch(self, current_data, pipeline=None):
+        """
+        Puntúa un lote de lecturas con una sola llamada a predict_proba.
+
+        Returns:
+            (needs_maintenance, probability) como arrays de longitud n
+        """
+        # Referencia local: un intercambio en caliente no afecta al lote en curso
+        pipeline = pipeline or self.pipeline
+        X = build_features(current_data, pipeline.get('features') or FEATURE_COLUMNS)
+        return score_matrix(pipeline, X, self.inference_engine, self.flat_max_rows)
+
+    def messages_to_frame(self, messages):
+        """Convierte mensajes del stream en un DataFrame con las features del modelo"""
+        frame = pd.DataFrame(build_features([message['data'] for message in messages]), columns=FEATURE_COLUMNS)
+        frame['plc_id'] = [message.get('plc_id') for message in messages]
+        frame['timestamp'] = pd.to_datetime([message.get('timestamp') for message in messages])
+        return frame
+
+    def process_stream_batch(self, messages, received_at):
+        """Puntúa un micro-lote del stream y registra la latencia de decisión"""
+        return self.process_frame(self.messages_to_frame(messages), received_at)
+
+    def process_frame(self, frame, received_at):
+        """
+        Puntúa un lote de lecturas (plc_id, timestamp y features) y genera sus alertas.
+
+        Es el camino del stream y el de la reproducción de histórico: con un
+        reloj virtual, cada alerta lleva la hora de su lectura.
+        """
+        predictions = self.predict_cached(frame)
+        needs_maintenance = predictions['needs_maintenance'].to_numpy()
+        probabilities = predictions['probability'].to_numpy()
+        rul = {col: predictions[col].to_numpy() for col in ('rul_hours', 'rul_lower_hours', 'rul_upper_hours')}
+        patterns = self.detect_failure_patterns(frame)
+        anomalies = self.detect_anomalies(frame)
+
+        alerts = []
+        for i in range(len(frame)):
+            self.clock.advance_to(frame['timestamp'].iloc[i])
+            row = frame.iloc[[i]][FEATURE_COLUMNS].reset_index(drop=True)
+            prediction = {
+                'needs_maintenance': bool(needs_maintenance[i]),
+                'probability': float(probabilities[i]),
+                'timestamp': self.clock.now()
+            }
+            alert = self.evaluate_reading(
+                row, prediction, float(rul['rul_hours'][i]), patterns[i], anomalies[i],
+                plc_id=frame['plc_id'].iloc[i],
+                rul_bounds=(float(rul['rul_lower_hours'][i]), float(rul['rul_upper_hours'][i]))
+            )
+            if alert:
+                alerts.append(alert)
+        alerts.extend(self.update_forecasts(frame))
+
+        # Latencia por mensaje: desde que el productor generó la lectura hasta la decisión
+        decided_at = self.clock.now()
+        self.decision_latencies.extend(
+            (decided_at - frame['timestamp']).dt.total_seconds().tolist()
+        )
+        self.batch_processing_times.append(time.time() - received_at)
+        return alerts
+
+    def replay(self, history, batch_rows=1000):
+        """
+        Reproduce lecturas históricas ordenadas por tiempo por el mismo camino
+        que el stream, en lotes de batch_rows y sin esperar entre lotes.
+
+        Returns:
+            alertas generadas
+        """
+        alerts = []
+        for start in range(0, len(history), batch_rows):
+            batch = history.iloc[start:start + batch_rows].reset_index(drop=True)
+            alerts.extend(self.process_frame(batch, time.time()))
+        return alerts
+
+    def ensure_predictions_table(self):
+        """Crea la tabla de predicciones si no existe"""
+        ensure_predictions_table(self.engine)
+
+    def fetch_fleet_latest(self, lookback_minutes=10):
+        """Última lectura de cada máquina activa, desde la caché compartida o la BD"""
+        window_cache = self.get_window_cache()
+        if window_cache is not None:
+            readings = [window_cache.latest(plc_id) for plc_id in window_cache.machine_ids()]
+            readings = [r for r in readings if r is not None]
+            if readings:
+                frame = pd.DataFrame(readings)
+                frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='s')
+                return frame[['plc_id', 'timestamp'] + FEATURE_COLUMNS]
+
+        query = text(f"""
+            SELECT DISTINCT ON (plc_id) plc_id, timestamp, {', '.join(FEATURE_COLUMNS)}
+            FROM plc_mech
+            WHERE timestamp >= NOW() - make_interval(mins => :minutes)
+            ORDER BY plc_id, timestamp DESC
+        """)
+        return pd.read_sql(query, self.engine, params={'minutes': lookback_minutes})
+
+    def write_predictions(self, frame, model_version='legacy'):
+        """Guarda las predicciones de un lote con COPY e INSERT ... ON CONFLICT (ver copy_predictions)"""
+        if frame.empty:
+            return 0
+        rows = pd.DataFrame({
+            'plc_id': frame['plc_id'].to_numpy(),
+            'timestamp': pd.to_datetime(frame['timestamp']).to_numpy(),
+            'model_version': model_version,
+            'predicted_at': datetime.now(),
+            'needs_maintenance': frame['needs_maintenance'].astype(bool).to_numpy(),
+            'probability': frame['probability'].astype(float).to_numpy(),
+            'rul_hours': frame['rul_hours'].astype(float).to_numpy(),
+            'rul_lower_hours': frame.get('rul_lower_hours', frame['rul_hours']).astype(float).to_numpy(),
+            'rul_upper_hours': frame.get('rul_upper_hours', frame['rul_hours']).astype(float).to_numpy()
+        })
+        return copy_predictions(self.engine, rows)
+
+    def score_fleet(self, lookback_minutes=10):
+        """Puntúa la última lectura de todas las máquinas con una sola llamada al modelo"""
+        fleet = self.fetch_fleet_latest(lookback_minutes)
+        if fleet.empty:
+            return fleet
+
+        # Las máquinas sin lectura nueva desde el último tick salen de la caché;
+        # las nuevas se puntúan con una sola llamada al modelo y se guardan en predictions
+        predictions = self.predict_cached(fleet)
+        for col in ('needs_maintenance', 'probability', 'rul_hours', 'rul_lower_hours', 'rul_upper_hours'):
+            fleet[col] = predictions[col].to_numpy()
+        needs_maintenance, probability = fleet['needs_maintenance'].to_numpy(), fleet['probability'].to_numpy()
+        rul = {col: fleet[col].to_numpy() for col in ('rul_hours', 'rul_lower_hours', 'rul_upper_hours')}
+
+        # Evaluar patrones de toda la flota de una vez; solo las máquinas marcadas generan alerta
+        patterns = self.detect_failure_patterns(fleet)
+        anomalies = self.detect_anomalies(fleet)
+        self.update_forecasts(fleet)
+        flagged = needs_maintenance.astype(bool) | np.array([bool(p) or bool(a) for p, a in zip(patterns, anomalies)])
+        for i in np.flatnonzero(flagged):
+            row = fleet.iloc[[i]][FEATURE_COLUMNS].reset_index(drop=True)
+            prediction = {
+                'needs_maintenance': bool(needs_maintenance[i]),
+                'probability': float(probability[i]),
+                'timestamp': datetime.now()
+            }
+            self.evaluate_reading(
+                row, prediction, float(rul['rul_hours'][i]), patterns[i], anomalies[i],
+                plc_id=fleet['plc_id'].iloc[i],
+                rul_bounds=(float(rul['rul_lower_hours'][i]), float(rul['rul_upper_hours'][i]))
+            )
+        return fleet
+
+    def run_fleet_scoring(self):
+        """Bucle de puntuación de toda la flota en cada tick"""
+        agent_config = self.config.get('agent', {})
+        interval = agent_config.get('fleet_interval_s', 30)
+        lookback_minutes = agent_config.get('fleet_lookback_minutes', 10)
+        self.ensure_predictions_table()
+        self.predictions_table_ready = True
+        if ensure_latest_reading_index(self.engine):
+            self.logger.info("Índice plc_mech_plc_id_timestamp_idx creado")
+        self.logger.info("Iniciando puntuación de flota...")
+
+        while True:
+            started = time.time()
+            try:
+                fleet = self.score_fleet(lookback_minutes)
+                cache = self.prediction_cache.get_stats()
+                self.logger.info(
+                    f"[STATUS] Flota puntuada: {len(fleet)} máquinas en {time.time() - started:.3f} s, "
+                    f"aciertos de caché {100 * (cache['hit_rate'] or 0):.1f}%"
+                )
+            except Exception as e:
+                self.logger.error(f"Error puntuando la flota: {e}")
+            time.sleep(max(0, interval - (time.time() - started)))
+
+    def get_latency_stats(self):
+        """Percentiles de latencia de decisión por mensaje y de procesado por lote"""
+        stats = {'count': len(self.decision_latencies)}
+        for name, values in (('decision', self.decision_latencies),
+                             ('batch_processing', self.batch_processing_times)):
+            values_ms = np.array(values) * 1000
+            stats[name] = {
+                'p50_ms': float(np.percentile(values_ms, 50)) if len(values_ms) else None,
+                'p99_ms': float(np.percentile(values_ms, 99)) if len(values_ms) else None
+            }
+        return stats
+
+    def run_streaming(self):
+        """Inferencia dirigida por eventos: puntúa las lecturas según llegan al stream"""
+        agent_config = self.config.get('agent', {})
+        topic = agent_config.get('topic', self.config.get('kinesis_stream', 'plc_data'))
+        batch_size = agent_config.get('batch_size', 100)
+        max_wait_ms = agent_config.get('max_wait_ms', 50)
+
+        transport = create_transport(self.config)
+        consumer = transport.consumer(
+            topic,
+            group_id=agent_config.get('group_id', 'ml-agent'),
+            auto_offset_reset='latest'
+        )
+        self.logger.info(f"Iniciando inferencia en streaming sobre '{topic}' (transporte: {transport.name})...")
+
+        last_status_time = time.time()
+        try:
+            while True:
+                try:
+                    records = consumer.poll(timeout_ms=max_wait_ms, max_records=batch_size)
+                    if records:
+                        self.process_stream_batch([record.value for record in records], time.time())
+                except Exception as e:
+                    self.logger.error(f"Error en inferencia en streaming: {e}")
+                    time.sleep(1)
+
+                self.alert_store.maybe_flush()
+                if time.time() - last_status_time >= 10:
+                    stats = self.get_latency_stats()
+                    if stats['count']:
+                        self.logger.info(
+                            f"[STATUS] Latencia de decisión: p50 {stats['decision']['p50_ms']:.2f} ms, "
+                            f"p99 {stats['decision']['p99_ms']:.2f} ms ({stats['count']} mensajes), "
+                            f"aciertos de caché {100 * (self.prediction_cache.get_stats()['hit_rate'] or 0):.1f}%"
+                        )
+                    last_status_time = time.time()
+        finally:
+            consumer.close()
+            self.alert_store.close()
+            self.notification_service.close()
+
+    def _fresh_rows(self, data):
+        """Filas posteriores a la última lectura ya procesada de cada máquina"""
+        data = data.copy()
+        if 'plc_id' not in data:
+            data['plc_id'] = 'default'
+        data['timestamp'] = pd.to_datetime(data['timestamp']) if 'timestamp' in data else pd.Timestamp.now()
+        data = data.sort_values('timestamp', kind='stable')
+        last_seen = data['plc_id'].map(self.last_seen).fillna(pd.Timestamp.min)
+        fresh = data[data['timestamp'] > last_seen]
+        self.last_seen.update(fresh.groupby('plc_id')['timestamp'].max().to_dict())
+        return fresh.reset_index(drop=True)
+
+    def estimate_maintenance_time(self, data):
+        """Probabilidad de mantenimiento y vida útil restante (con cotas) de la última lectura de cada máquina"""
+        data = data.reset_index(drop=True)
+        latest = data.groupby('plc_id', sort=False).tail(1)
+        # La ventana de tendencia se alimenta con todas las lecturas, no solo la última
+        self.estimate_rul(data)
+        predictions = self.predict_cached(latest)
         return {
-            'maintenance_time': maintenance_time,
+            plc_id: {
+                'timestamp': ts,
+                'needs_maintenance': bool(row['needs_maintenance']),
+                'probability': float(row['probability']),
+                'rul_hours': float(row['rul_hours']),
+                'rul_lower_hours': float(row['rul_lower_hours']),
+                'rul_upper_hours': float(row['rul_upper_hours']),
+                'rul_signal': row.get('rul_signal') if isinstance(row.get('rul_signal'), str) else None
+            }
+            for plc_id, ts, row in zip(latest['plc_id'], latest['timestamp'], predictions.to_dict('records'))
+        }
+
+    def analyze_patterns(self, data):
+        """Aplica las lecturas al motor de reglas y devuelve las reglas activas de cada máquina"""
+        self.detect_failure_patterns(data)
+        return {plc_id: self.rule_engine.active_rules(plc_id) for plc_id in data['plc_id'].unique()}
+
+    def get_alert_history(self, plc_id=None, start=None, end=None, limit=None):
+        """Alertas guardadas de una máquina en un rango de tiempo (incluye las de otros procesos del agente)"""
+        self.alert_store.refresh()
+        return self.alert_store.query(plc_id, start=start, end=end, limit=limit)
+
+    def get_predictions(self, data):
+        """
+        Predicciones para el dashboard a partir de un lote o ventana de lecturas.
+
+        Solo se procesan las lecturas nuevas de cada máquina, así que se puede
+        llamar en cada refresco con la ventana completa sin contar dos veces
+        una lectura en los detectores con estado. No guarda ni notifica
+        alertas de pronóstico: eso solo lo hacen los bucles del agente.
+
+        Returns:
+            dict con maintenance_time, patterns, forecasts y forecast_breaches
+            por máquina y la lista de anomalías de las lecturas nuevas
+        """
+        fresh = self._fresh_rows(data)
+        anomalies = []
+        if not fresh.empty:
+            for plc_id, ts, found in zip(fresh['plc_id'], fresh['timestamp'], self.detect_anomalies(fresh)):
+                anomalies.extend(dict(anomaly, plc_id=plc_id, timestamp=ts) for anomaly in found)
+            patterns = self.analyze_patterns(fresh)
+            self.update_forecasts(fresh, alert=False)
+            for plc_id, estimate in self.estimate_maintenance_time(fresh).items():
+                self.latest_predictions[plc_id] = dict(estimate, patterns=patterns.get(plc_id, []))
+
+        return {
+            'maintenance_time': {k: {f: v[f] for f in v if f != 'patterns'} for k, v in self.latest_predictions.items()},
             'anomalies': anomalies,
-            'patterns': patterns
+            'patterns': {k: v['patterns'] for k, v in self.latest_predictions.items()},
+            'forecasts': self.latest_forecast,
+            'forecast_breaches': self.forecast_breaches
         }
 
     def initialize_model(self):
         """Inicializa o carga el modelo de ML"""
         try:
-            # Intentar cargar modelo existente
-            return joblib.load('maintenance_model.joblib')
-        except:
-            # Si no existe, crear nuevo modelo
-            return RandomForestClassifier(
-                n_estimators=100,
-                random_state=42
-            )
+            # Intentar cargar la versión actual del registro
+            pipeline = self.registry.load()
+            if pipeline is not None:
+                self.logger.info(f"Modelo {pipeline['version']} cargado desde el registro")
+                check_feature_version(pipeline.get('metadata'), FEATURE_COLUMNS)
+                return pipeline
+        except Exception as e:
+            self.logger.error(f"Error cargando modelo del registro: {e}")
+        # Si no existe, crear nuevo modelo
+        return {
+            'model': self._new_model(),
+            'scaler': None,
+            'features': FEATURE_COLUMNS,
+            'version': 'untrained',
+            'metrics': {},
+            'flat': None
+        }
+
+    def _new_model(self, n_jobs=None):
+        if n_jobs is None:
+            # Por defecto el entrenamiento usa todos los núcleos
+            n_jobs = self.config.get('training_data', {}).get('n_jobs', -1)
+        return RandomForestClassifier(
+            n_estimators=100,
+            random_state=42,
+            n_jobs=n_jobs
+        )
+
+    def swap_pipeline(self, pipeline):
+        """Publica un pipeline nuevo con una sola asignación (seguro durante la inferencia)"""
+        check_feature_version(pipeline.get('metadata'), FEATURE_COLUMNS)
+        self.pipeline = pipeline
+        # Las predicciones cacheadas eran de la versión anterior
+        self.prediction_cache.invalidate()
+        if self.model_watcher is not None:
+            self.model_watcher.loaded_version = pipeline['version']
+
+    def start_model_watcher(self):
+        """Arranca el hilo que recarga el modelo cuando cambia la versión actual"""
+        interval = self.config.get('model_registry', {}).get('watch_interval_s', 5)
+        self.model_watcher = ModelWatcher(
+            self.registry, self.swap_pipeline, interval=interval,
+            current_version=self.pipeline['version']
+        )
+        self.model_watcher.start()
+
+    def start_retrain_scheduler(self):
+        """Arranca el planificador que reentrena en un proceso aparte y promociona si mejora"""
+        self.retrain_scheduler = RetrainScheduler(
+            self.config, self.registry, self.engine, lambda: self.pipeline
+        )
+        self.retrain_scheduler.start()
 
 if __name__ == "__main__":
     agent = PredictiveMaintenanceAgent()
-    agent.train_model()
+    if agent.pipeline['version'] == 'untrained':
+        agent.train_model()
     agent.analyze_feature_importance()
-    agent.monitor_and_predict()
\ No newline at end of file
+    if agent.config.get('retraining', {}).get('enabled', True):
+        agent.start_retrain_scheduler()
+    mode = agent.config.get('agent', {}).get('mode', 'stream')
+    if mode == 'stream':
+        agent.run_streaming()
+    elif mode == 'fleet':
+        agent.run_fleet_scoring()
+    else:
+        agent.monitor_and_predict()
\ No newline at end of file
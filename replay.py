@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+import copy
+import json
+import logging
+import math
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+import pandas as pd
+from sqlalchemy import create_engine, text
+from batch_scoring import database_url, time_chunks
+from clock import VirtualClock
+from feature_pipeline import FEATURE_COLUMNS
+
+
+def json_safe(value):
+    """Sustituye los float no finitos (p. ej. cotas de RUL sin estimar) por None: JSON no admite NaN"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_safe(item) for item in value]
+    return value
+
+
+class ReplayAlertSink:
+    """
+    Destino de las alertas durante una reproducción: las guarda en memoria en
+    lugar de escribirlas en el historial de alertas del agente en servicio.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.recording = True
+        self.discarded = 0
+
+    def append(self, alert):
+        if not self.recording:
+            # Calentamiento: las alertas anteriores al rango no cuentan
+            self.discarded += 1
+            return alert
+        record = json_safe(json.loads(json.dumps(alert, default=str)))
+        self.records.append(record)
+        return record
+
+    def maybe_flush(self):
+        pass
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        return {'stored': len(self.records), 'discarded': self.discarded}
+
+
+def replay_config(config, rules_path=None, overrides=None):
+    """
+    Configuración del agente para reproducir: sin vigilar el registro ni tocar
+    la tabla predictions, con las reglas y ajustes que se quieren probar.
+    """
+    config = copy.deepcopy(config)
+
+    def merge(target, changes):
+        for key, value in changes.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target[key] = value
+
+    merge(config, overrides or {})
+    if rules_path:
+        config.setdefault('failure_rules', {})['path'] = rules_path
+    config.setdefault('model_registry', {})['watch'] = False
+    config.setdefault('prediction_cache', {}).update(persist=False, read_through=False)
+    # Las alertas reproducidas no se notifican
+    config.setdefault('notifications', {})['alerts_enabled'] = False
+    return config
+
+
+# Estado de cada proceso del pool
+_worker = {}
+
+
+def _init_worker(settings):
+    from threadpoolctl import threadpool_limits
+    # Un núcleo por proceso: el paralelismo lo dan las máquinas repartidas entre procesos
+    threadpool_limits(limits=1)
+    # Las alertas se recogen en el resultado; el log de cada una solo frenaría la reproducción
+    logging.disable(logging.WARNING)
+    _worker.clear()
+    _worker.update(settings)
+    if settings['source'] == 'db':
+        _worker['engine'] = create_engine(database_url(settings['config']))
+
+
+def _read_history(group, plc_ids, start, end):
+    """Lecturas de las máquinas del grupo en [start, end), ordenadas por tiempo"""
+    if _worker['source'] == 'db':
+        query = text(f"""
+            SELECT plc_id, timestamp, {', '.join(FEATURE_COLUMNS)}
+            FROM plc_mech
+            WHERE plc_id = ANY(:plc_ids) AND timestamp >= :start AND timestamp < :end
+            ORDER BY timestamp
+        """)
+        return pd.read_sql(query, _worker['engine'],
+                           params={'plc_ids': list(plc_ids), 'start': start, 'end': end})
+
+    # Flota sintética: cada grupo genera sus máquinas (mismo grupo -> mismos datos)
+    from synthetic_data import generate_history
+    spec = _worker['source']
+    n_steps = int((end - start).total_seconds() // spec['freq_s'])
+    history = generate_history(n_machines=len(plc_ids), n_steps=max(n_steps, 0), start=start,
+                               freq_s=spec['freq_s'], seed=spec.get('seed', 42) + group)
+    names = {f"PLC_SIM_{i:04d}": plc_id for i, plc_id in enumerate(plc_ids)}
+    history['plc_id'] = history['plc_id'].map(names)
+    return history
+
+
+def _replay_group(group, plc_ids):
+    """Reproduce el rango para un grupo de máquinas con un agente propio y reloj virtual"""
+    from predictive_maintenance_agent import PredictiveMaintenanceAgent
+    cpu_start = time.process_time()
+    start, end = _worker['start'], _worker['end']
+    sink = ReplayAlertSink()
+    agent = PredictiveMaintenanceAgent(config=_worker['config'], clock=VirtualClock(), alert_store=sink)
+    if _worker['version'] and _worker['version'] != agent.pipeline['version']:
+        agent.swap_pipeline(agent.registry.load(_worker['version']))
+    if hasattr(agent.pipeline['model'], 'n_jobs'):
+        agent.pipeline['model'].n_jobs = 1
+
+    timings = {'read_s': 0.0, 'replay_s': 0.0}
+    warmup_start = start - timedelta(minutes=_worker['warmup_minutes'])
+    if _worker['source'] != 'db':
+        # El histórico sintético se genera de una vez para que sea continuo entre tramos
+        t = time.perf_counter()
+        synthetic = _read_history(group, plc_ids, warmup_start, end)
+        timings['read_s'] += time.perf_counter() - t
+
+    rows = 0
+    spans = [(warmup_start, start, False)] + [(a, b, True) for a, b in time_chunks(start, end, _worker['chunk_hours'])]
+    for span_start, span_end, recording in spans:
+        t = time.perf_counter()
+        if _worker['source'] == 'db':
+            history = _read_history(group, plc_ids, span_start, span_end)
+        else:
+            in_span = (synthetic['timestamp'] >= span_start) & (synthetic['timestamp'] < span_end)
+            history = synthetic[in_span.to_numpy()]
+        history = history.assign(timestamp=pd.to_datetime(history['timestamp']))
+        timings['read_s'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        sink.recording = recording
+        agent.replay(history, _worker['batch_rows'])
+        timings['replay_s'] += time.perf_counter() - t
+        if recording:
+            rows += len(history)
+
+    return dict(timings, group=group, machines=len(plc_ids), rows=rows, alerts=sink.records,
+                cpu_s=time.process_time() - cpu_start)
+
+
+def summarize_alerts(alerts):
+    """Recuento de las alertas por tipo, patrón, anomalía y máquina"""
+    by_type, patterns, anomalies, machines = Counter(), Counter(), Counter(), Counter()
+    for alert in alerts:
+        by_type[alert.get('alert_type', 'reading')] += 1
+        machines[alert.get('plc_id')] += 1
+        if alert.get('maintenance_needed'):
+            by_type['maintenance_needed'] += 1
+        patterns.update(p.get('pattern') for p in alert.get('failure_patterns') or [])
+        anomalies.update(f"{a['sensor']}:{a['type']}" for a in alert.get('anomalies') or [])
+        patterns.update(f"forecast:{b['signal']}" for b in alert.get('forecast_breaches') or [])
+    return {
+        'by_type': dict(by_type),
+        'patterns': dict(patterns.most_common()),
+        'anomalies': dict(anomalies.most_common()),
+        'machines': dict(machines.most_common())
+    }
+
+
+class ReplayJob:
+    """
+    Reproducción acelerada de un rango histórico por el agente.
+
+    Cada grupo de máquinas se reproduce en un proceso del pool con su propio
+    PredictiveMaintenanceAgent: mismas funciones de puntuación, reglas,
+    detectores, RUL, pronóstico y alertas que en servicio, con un reloj
+    virtual que sigue a las lecturas y sin esperas. Como todo el estado de
+    los detectores es por máquina, repartir las máquinas entre procesos da
+    las mismas alertas que una reproducción secuencial. Sirve para ver cómo
+    se habrían comportado unas reglas o umbrales nuevos con datos pasados.
+    """
+
+    def __init__(self, config, start, end, machines=None, version=None, rules_path=None, overrides=None,
+                 n_workers=None, groups_per_worker=2, chunk_hours=6, batch_rows=1000, warmup_minutes=15,
+                 source='db', output='replay_alerts.jsonl', logger=None):
+        self.config = replay_config(config, rules_path, overrides)
+        self.start = start
+        self.end = end
+        self.machines = list(machines) if machines else None
+        self.version = version
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.groups_per_worker = groups_per_worker
+        self.chunk_hours = chunk_hours
+        self.batch_rows = batch_rows
+        self.warmup_minutes = warmup_minutes
+        self.source = source
+        self.output = output
+        self.logger = logger or logging.getLogger('Replay')
+
+    def list_machines(self):
+        """Máquinas con lecturas en el rango"""
+        if self.machines:
+            return self.machines
+        if self.source != 'db':
+            return [f"PLC_SIM_{i:04d}" for i in range(self.source['machines'])]
+        engine = create_engine(database_url(self.config))
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT DISTINCT plc_id FROM plc_mech WHERE timestamp >= :start AND timestamp < :end"),
+                {'start': self.start, 'end': self.end}
+            ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def groups(self, machines):
+        n_groups = max(1, min(len(machines), self.n_workers * self.groups_per_worker))
+        return [machines[i::n_groups] for i in range(n_groups)]
+
+    def run(self):
+        """
+        Reproduce el rango y guarda las alertas en output (JSONL, por orden de tiempo).
+
+        Returns:
+            dict con filas, alertas, resumen, tiempo total, filas/s y aceleración
+        """
+        machines = self.list_machines()
+        groups = self.groups(machines)
+        self.logger.info(
+            f"[INFO] Reproduciendo {self.start} - {self.end}: {len(machines)} máquinas en {len(groups)} grupos "
+            f"con {self.n_workers} procesos"
+        )
+        settings = {
+            'config': self.config, 'version': self.version, 'source': self.source,
+            'start': self.start, 'end': self.end, 'chunk_hours': self.chunk_hours,
+            'batch_rows': self.batch_rows, 'warmup_minutes': self.warmup_minutes
+        }
+        totals = {'rows': 0, 'read_s': 0.0, 'replay_s': 0.0, 'cpu_s': 0.0}
+        alerts, failed = [], []
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker,
+                                 initargs=(settings,)) as pool:
+            futures = {pool.submit(_replay_group, i, group): i for i, group in enumerate(groups)}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error(f"[ERROR] Grupo {group} ({len(groups[group])} máquinas) fallido: {e}")
+                    failed.append(group)
+                    continue
+                for name in totals:
+                    totals[name] += result[name]
+                alerts.extend(result['alerts'])
+                self.logger.info(f"[STATUS] Grupo {group}: {result['rows']} lecturas, "
+                                 f"{len(result['alerts'])} alertas en {result['replay_s']:.1f} s")
+
+        wall_s = time.perf_counter() - started
+        alerts.sort(key=lambda alert: (alert['timestamp'], str(alert.get('plc_id'))))
+        if self.output:
+            tmp_path = self.output + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for alert in alerts:
+                    f.write(json.dumps(json_safe(alert), allow_nan=False) + '\n')
+            os.replace(tmp_path, self.output)
+
+        simulated_s = (self.end - self.start).total_seconds()
+        return dict(
+            totals,
+            machines=len(machines),
+            groups=len(groups),
+            groups_failed=failed,
+            alerts=len(alerts),
+            summary=summarize_alerts(alerts),
+            wall_time_s=wall_s,
+            rows_per_s=totals['rows'] / wall_s if wall_s > 0 else None,
+            speedup=simulated_s / wall_s if wall_s > 0 else None,
+            n_workers=self.n_workers,
+            output=self.output
+        )
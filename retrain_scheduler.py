@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'train_model.py')
+EVALUATE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'evaluate_model.py')
+
+
+class RetrainScheduler(threading.Thread):
+    """
+    Planificador de reentrenamientos en segundo plano.
+
+    Comprueba periódicamente si hace falta reentrenar (antigüedad del modelo,
+    volumen de datos nuevos o deriva de las features respecto al scaler del
+    modelo actual). period_hours cuenta desde el último intento, no solo desde
+    la creación del modelo, y tras cada candidato fallido o rechazado los
+    disparadores de volumen y deriva esperan el doble (hasta max_backoff_hours).
+    El último intento y los rechazos seguidos se guardan en state_path para
+    que un reinicio del agente no vuelva a lanzar el mismo entrenamiento. El entrenamiento se lanza en un proceso aparte con prioridad
+    baja y límite de CPU, y registra un candidato sin promocionarlo. Solo si sus
+    métricas de validación pasan el umbral y, con evaluation_gate, no empeora
+    al modelo actual en el holdout temporal (F1 medido por evaluate_model.py en
+    otro proceso; latencia, rendimiento y carga solo avisan salvo con
+    performance_gate) se promociona; el agente
+    sigue puntuando con el modelo anterior hasta que su ModelWatcher hace el cambio.
+    """
+
+    def __init__(self, config, registry, engine, get_pipeline):
+        super().__init__(daemon=True, name='RetrainScheduler')
+        self.registry = registry
+        self.engine = engine
+        self.get_pipeline = get_pipeline
+        self.logger = logging.getLogger('RetrainScheduler')
+
+        retraining = config.get('retraining', {})
+        self.period_hours = retraining.get('period_hours', 24)
+        self.min_new_rows = retraining.get('min_new_rows', 100000)
+        self.drift_threshold = retraining.get('drift_threshold', 1.0)
+        self.drift_window_minutes = retraining.get('drift_window_minutes', 60)
+        self.check_interval_s = retraining.get('check_interval_s', 300)
+        self.n_jobs = retraining.get('n_jobs', 1)
+        self.nice = retraining.get('nice', 10)
+        self.cpu_limit_s = retraining.get('cpu_limit_s', 3600)
+        self.timeout_s = retraining.get('timeout_s', 7200)
+        self.min_f1 = retraining.get('min_f1', 0.6)
+        self.max_f1_drop = retraining.get('max_f1_drop', 0.02)
+        self.min_interval_s = retraining.get('min_interval_hours', 1) * 3600
+        self.log_path = retraining.get('log_path', 'retraining.log')
+        self.training_args = retraining.get('training_args', [])
+        self.evaluation_gate = retraining.get('evaluation_gate', True)
+        self.evaluation_args = retraining.get('evaluation_args', [])
+        self.max_backoff_hours = retraining.get('max_backoff_hours', self.period_hours)
+        self.state_path = retraining.get('state_path', 'retraining_state.json')
+
+        self.process = None
+        self.process_started = None
+        self.last_attempt = None
+        self.rejections = 0
+        self.result_path = None
+        self.trigger_reason = None
+        self.pending_candidate = None
+        self._stop_event = threading.Event()
+        self.load_state()
+
+    def load_state(self):
+        """Recupera el último intento y los rechazos seguidos de una ejecución anterior"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"No se pudo leer el estado de reentrenamiento: {e}")
+            return
+        self.last_attempt = state.get('last_attempt')
+        self.rejections = int(state.get('rejections', 0))
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_attempt': self.last_attempt, 'rejections': self.rejections}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def record_rejection(self):
+        """Cuenta un candidato fallido o rechazado para espaciar los siguientes intentos"""
+        self.rejections += 1
+        self.save_state()
+
+    def backoff_hours(self):
+        """Espera mínima desde el último intento para los disparadores de volumen y deriva"""
+        if not self.rejections:
+            return 0.0
+        return min(self.min_interval_s / 3600 * 2 ** self.rejections, self.max_backoff_hours)
+
+    def should_retrain(self):
+        """Devuelve el motivo del reentrenamiento o None si no hace falta"""
+        pipeline = self.get_pipeline()
+        metadata = pipeline.get('metadata') or {}
+        if pipeline['version'] in ('untrained', 'legacy') or 'created_at' not in metadata:
+            return 'sin modelo registrado'
+
+        now = time.time()
+        since_attempt_hours = (now - self.last_attempt) / 3600 if self.last_attempt is not None else float('inf')
+        age_hours = (datetime.now() - datetime.fromisoformat(metadata['created_at'])).total_seconds() / 3600
+        # El periodo se aplica a los intentos: un candidato rechazado no se reintenta en cada comprobación
+        if age_hours >= self.period_hours and since_attempt_hours >= self.period_hours:
+            return f'modelo con {age_hours:.1f} h de antigüedad'
+
+        if since_attempt_hours < self.backoff_hours():
+            return None
+
+        watermark = metadata.get('watermark')
+        if watermark and self.last_attempt is not None:
+            # Tras un intento, las filas nuevas se cuentan desde él y no desde el modelo actual
+            watermark = max(pd.Timestamp(watermark), pd.Timestamp.fromtimestamp(self.last_attempt)).isoformat()
+        if watermark and self.min_new_rows:
+            with self.engine.connect() as conn:
+                new_rows = conn.execute(
+                    text("SELECT COUNT(*) FROM plc_mech WHERE timestamp > :watermark"),
+                    {'watermark': watermark}
+                ).scalar()
+            if new_rows >= self.min_new_rows:
+                return f'{new_rows} filas nuevas desde {watermark}'
+
+        drift = self.feature_drift(pipeline)
+        if drift is not None and drift[1] >= self.drift_threshold:
+            return f'deriva en {drift[0]} ({drift[1]:.2f} desviaciones)'
+        return None
+
+    def feature_drift(self, pipeline):
+        """Mayor desplazamiento de la media reciente, en desviaciones del scaler del modelo"""
+        scaler = pipeline.get('scaler')
+        features = pipeline.get('features')
+        if scaler is None or not features or not hasattr(scaler, 'mean_'):
+            return None
+        averages = ', '.join(f"AVG({col}) AS {col}" for col in features)
+        recent = pd.read_sql(
+            text(f"""
+                SELECT {averages} FROM plc_mech
+                WHERE timestamp >= NOW() - make_interval(mins => :minutes)
+            """),
+            self.engine, params={'minutes': self.drift_window_minutes}
+        )
+        if recent.empty or recent.isna().all(axis=1).iloc[0]:
+            return None
+        means = recent.iloc[0][features].to_numpy(dtype=np.float64)
+        z = np.abs(means - scaler.mean_) / np.where(scaler.scale_ > 0, scaler.scale_, 1.0)
+        z = np.nan_to_num(z)
+        worst = int(np.argmax(z))
+        return features[worst], float(z[worst])
+
+    def _limit_resources(self):
+        # Se ejecuta en el hijo antes de arrancar Python (solo POSIX)
+        os.nice(self.nice)
+        if resource is not None and self.cpu_limit_s:
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_limit_s, self.cpu_limit_s))
+
+    def _spawn(self, command):
+        """Lanza un script en un proceso aparte con prioridad baja y límites de CPU"""
+        env = os.environ.copy()
+        # Limitar los hilos de BLAS/OpenMP al número de núcleos asignado
+        for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            env[var] = str(self.n_jobs)
+        if sys.platform.startswith('win'):
+            env['PYTHONIOENCODING'] = 'utf-8'
+
+        self.result_path = os.path.abspath(f'retraining_result_{os.getpid()}.json')
+        if os.path.exists(self.result_path):
+            os.remove(self.result_path)
+        command = command + ['--resultado', self.result_path]
+        # La salida va a un fichero: un pipe sin leer bloquearía al hijo
+        with open(self.log_path, 'a', encoding='utf-8') as log_file:
+            self.process = subprocess.Popen(
+                command,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                env=env,
+                preexec_fn=self._limit_resources if not sys.platform.startswith('win') else None
+            )
+        if sys.platform.startswith('win'):
+            try:
+                import psutil
+                psutil.Process(self.process.pid).nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            except Exception as e:
+                self.logger.warning(f"No se pudo bajar la prioridad del proceso: {e}")
+        self.process_started = time.time()
+
+    def launch(self, reason):
+        """Lanza el entrenamiento de un candidato en un proceso aparte"""
+        self._spawn([sys.executable, TRAIN_SCRIPT, '--tipo', 'completo', '--candidato',
+                     '--n-jobs', str(self.n_jobs)] + list(self.training_args))
+        self.last_attempt = self.process_started
+        self.save_state()
+        self.trigger_reason = reason
+        self.logger.info(f"[INFO] Reentrenamiento lanzado (pid {self.process.pid}): {reason}")
+
+    def launch_evaluation(self, candidate):
+        """Evalúa el candidato frente al modelo actual sobre el holdout temporal en un proceso aparte"""
+        current = self.registry.current_version()
+        command = [sys.executable, EVALUATE_SCRIPT, '--version', candidate] + list(self.evaluation_args)
+        if current and current != candidate:
+            command += ['--comparar', current]
+        self._spawn(command)
+        self.pending_candidate = candidate
+        self.logger.info(f"[INFO] Evaluando el candidato {candidate} frente a {current} (pid {self.process.pid})")
+
+    def collect(self):
+        """Recoge el resultado del entrenamiento o la evaluación en curso; True si ha terminado"""
+        if self.process.poll() is None:
+            if time.time() - self.process_started > self.timeout_s:
+                self.logger.error("[ERROR] Reentrenamiento excede el tiempo máximo, se cancela")
+                self.process.kill()
+                self.process.wait()
+                self.process = None
+                self.pending_candidate = None
+                self.record_rejection()
+            return False
+
+        returncode = self.process.returncode
+        self.process = None
+
+        result = {}
+        if os.path.exists(self.result_path):
+            with open(self.result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.remove(self.result_path)
+
+        if self.pending_candidate is not None:
+            candidate, self.pending_candidate = self.pending_candidate, None
+            if not result.get('passed'):
+                problems = result.get('regressions') or [result.get('error') or f'código {returncode}']
+                self.logger.warning(f"Candidato {candidate} rechazado en la evaluación: {'; '.join(problems)}")
+                self.record_rejection()
+                return True
+            self.promote(candidate)
+            return True
+
+        candidate = result.get('version')
+        if returncode != 0 or candidate is None:
+            self.logger.error(f"[ERROR] Reentrenamiento fallido (código {returncode})")
+            self.record_rejection()
+            return True
+
+        self.evaluate_candidate(candidate)
+        return True
+
+    def evaluate_candidate(self, candidate):
+        """
+        Promociona el candidato si sus métricas de validación pasan el umbral;
+        con evaluation_gate lanza antes la evaluación frente al modelo actual.
+        """
+        metrics = self.registry.get_metadata(candidate).get('metrics', {})
+        current = self.get_pipeline()
+        candidate_f1 = metrics.get('f1')
+        current_f1 = (current.get('metrics') or {}).get('f1')
+
+        if candidate_f1 is None or candidate_f1 < self.min_f1:
+            self.logger.warning(f"Candidato {candidate} rechazado: F1 de validación {candidate_f1}")
+            self.record_rejection()
+            return False
+        if current_f1 is not None and candidate_f1 < current_f1 - self.max_f1_drop:
+            self.logger.warning(
+                f"Candidato {candidate} rechazado: F1 {candidate_f1:.3f} peor que {current['version']} ({current_f1:.3f})"
+            )
+            self.record_rejection()
+            return False
+
+        if self.evaluation_gate:
+            self.launch_evaluation(candidate)
+            return None
+        self.promote(candidate)
+        return True
+
+    def promote(self, candidate):
+        f1 = self.registry.get_metadata(candidate).get('metrics', {}).get('f1')
+        self.registry.promote(candidate)
+        self.rejections = 0
+        self.save_state()
+        self.logger.info(f"Candidato {candidate} promocionado (F1 {f1:.3f}, motivo: {self.trigger_reason})")
+
+    def tick(self):
+        """Una iteración del planificador; nunca bloquea a la espera del entrenamiento"""
+        if self.process is not None:
+            self.collect()
+            return
+        # Tras un intento fallido o rechazado, esperar antes de volver a probar
+        if self.last_attempt is not None and time.time() - self.last_attempt < self.min_interval_s:
+            return
+        reason = self.should_retrain()
+        if reason:
+            self.launch(reason)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"[ERROR] Error en el planificador de reentrenamiento: {e}")
+            # Con un entrenamiento en curso se comprueba más a menudo si ha terminado
+            self._stop_event.wait(5 if self.process is not None else self.check_interval_s)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.process is not None:
+            self.process.terminate()
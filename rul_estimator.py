@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import logging
+from statistics import NormalDist
+import numpy as np
+from fleet_state import MachineIndex, rank_within_group, to_epoch_seconds
+
+# Señales de degradación por defecto: el simulador marca mantenimiento con desgaste > 0.7
+DEFAULT_SIGNALS = {
+    'wear_level': {'threshold': 0.7, 'direction': 'above', 'reset_drop': 0.2}
+}
+
+
+def rul_from_probability(wear_rate, current_age, max_age=8760):
+    """Estimación de respaldo sin historial de tendencia (admite arrays de toda la flota)"""
+    rul = np.maximum(0, max_age * (1 - np.asarray(wear_rate)) - np.asarray(current_age))
+    return float(rul) if rul.ndim == 0 else rul
+
+
+class TrendRULEstimator:
+    """
+    Vida útil restante a partir de la tendencia de degradación de cada máquina.
+
+    Para cada máquina y señal se ajusta una recta y = a + b·t sobre una ventana
+    deslizante de las últimas `window` lecturas. Las sumas de la regresión
+    (Σt, Σt², Σy, Σy², Σty) se actualizan al entrar y salir cada lectura, así
+    que cada actualización es O(1) y no se reajusta nada sobre el histórico.
+    La RUL es el tiempo hasta que la recta cruza el umbral de la señal; las
+    cotas salen del intervalo de confianza de la pendiente. Con varias señales
+    manda la que cruza antes. Un descenso brusco (mantenimiento) reinicia la
+    ventana de la máquina.
+    """
+
+    def __init__(self, signals=None, window=600, min_points=30, confidence=0.95, resync_every=None):
+        self.signals = dict(signals or DEFAULT_SIGNALS)
+        self.names = list(self.signals)
+        self.window = window
+        self.min_points = min_points
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        # Cada cierto número de lecturas las sumas se recalculan desde la ventana
+        # para que no acumulen error de redondeo
+        self.resync_every = resync_every or window
+        self.threshold = np.array([s['threshold'] for s in self.signals.values()], dtype=np.float64)
+        self.direction = np.array(
+            [1.0 if s.get('direction', 'above') == 'above' else -1.0 for s in self.signals.values()]
+        )
+        self.reset_drop = np.array([s.get('reset_drop', np.inf) for s in self.signals.values()], dtype=np.float64)
+        self.logger = logging.getLogger('RULEstimator')
+
+        n_signals = len(self.names)
+        self.index = MachineIndex()
+        self.index.register('origin', fill=np.nan)
+        self.index.register('last_t', fill=-np.inf)
+        self.index.register('n', dtype=np.int64, fill=0)
+        self.index.register('pos', dtype=np.int64, fill=0)
+        self.index.register('updates', dtype=np.int64, fill=0)
+        self.index.register('ring_t', (window,))
+        self.index.register('ring_y', (window, n_signals))
+        self.index.register('sum_t', fill=0.0)
+        self.index.register('sum_tt', fill=0.0)
+        self.index.register('sum_y', (n_signals,))
+        self.index.register('sum_yy', (n_signals,))
+        self.index.register('sum_ty', (n_signals,))
+
+    @classmethod
+    def from_config(cls, config):
+        settings = dict(config.get('rul', {}))
+        return cls(**settings)
+
+    def _state(self):
+        return {name: self.index.array(name) for name in (
+            'origin', 'last_t', 'n', 'pos', 'updates', 'ring_t', 'ring_y',
+            'sum_t', 'sum_tt', 'sum_y', 'sum_yy', 'sum_ty'
+        )}
+
+    def update(self, plc_ids, timestamps, Y):
+        """
+        Añade lecturas a la ventana de cada máquina (O(1) por lectura).
+
+        Las lecturas no posteriores a la última ya vista de su máquina se
+        ignoran, así que volver a pasar una lectura no la cuenta dos veces.
+
+        Args:
+            Y: valores (n, n_señales) en el orden de self.names
+        """
+        Y = np.asarray(Y, dtype=np.float64)
+        if len(Y) == 0:
+            return np.empty(0, dtype=np.intp)
+        rows = self.index.indices(list(plc_ids))
+        seconds = to_epoch_seconds(timestamps)
+        state = self._state()
+        W = self.window
+
+        ranks = rank_within_group(rows)
+        order = np.argsort(ranks, kind='stable')
+        bounds = np.searchsorted(ranks[order], np.arange(ranks.max() + 2))
+        for r in range(len(bounds) - 1):
+            sel = order[bounds[r]:bounds[r + 1]]
+            sel = sel[seconds[sel] > state['last_t'][rows[sel]]]
+            if len(sel) == 0:
+                continue
+            m, y = rows[sel], Y[sel]
+
+            # Mantenimiento: la señal cae bruscamente respecto a la última lectura
+            last_y = state['ring_y'][m, (state['pos'][m] - 1) % W]
+            drop = (state['n'][m] > 0) & ((self.direction * (last_y - y)) > self.reset_drop).any(axis=1)
+            new = np.isnan(state['origin'][m]) | drop
+            if new.any():
+                reset = m[new]
+                state['origin'][reset] = seconds[sel][new]
+                for name in ('n', 'pos', 'updates'):
+                    state[name][reset] = 0
+                for name in ('sum_t', 'sum_tt', 'sum_y', 'sum_yy', 'sum_ty'):
+                    state[name][reset] = 0.0
+
+            # Tiempo en horas desde el origen de la máquina
+            t = (seconds[sel] - state['origin'][m]) / 3600.0
+            pos = state['pos'][m]
+            full = state['n'][m] >= W
+            # Sale de la ventana la lectura más antigua (la que se sobrescribe)
+            old_t = np.where(full, state['ring_t'][m, pos], 0.0)
+            old_y = np.where(full[:, None], state['ring_y'][m, pos], 0.0)
+            state['sum_t'][m] += t - old_t
+            state['sum_tt'][m] += t * t - old_t * old_t
+            state['sum_y'][m] += y - old_y
+            state['sum_yy'][m] += y * y - old_y * old_y
+            state['sum_ty'][m] += t[:, None] * y - old_t[:, None] * old_y
+            state['ring_t'][m, pos] = t
+            state['ring_y'][m, pos] = y
+            state['pos'][m] = (pos + 1) % W
+            state['n'][m] = np.minimum(state['n'][m] + 1, W)
+            state['last_t'][m] = seconds[sel]
+            state['updates'][m] += 1
+
+            resync = m[state['updates'][m] % self.resync_every == 0]
+            if len(resync):
+                self._resync(resync, state)
+        return rows
+
+    def _resync(self, machines, state):
+        """Recalcula las sumas desde la ventana (amortizado: una vez cada resync_every lecturas)"""
+        for m in machines:
+            n = int(state['n'][m])
+            t = state['ring_t'][m, :n] if n < self.window else state['ring_t'][m]
+            y = state['ring_y'][m, :n] if n < self.window else state['ring_y'][m]
+            state['sum_t'][m] = t.sum()
+            state['sum_tt'][m] = (t * t).sum()
+            state['sum_y'][m] = y.sum(axis=0)
+            state['sum_yy'][m] = (y * y).sum(axis=0)
+            state['sum_ty'][m] = (t[:, None] * y).sum(axis=0)
+
+    def estimate(self, plc_ids):
+        """
+        RUL de las máquinas indicadas a partir de la recta de su ventana.
+
+        Returns:
+            dict de arrays: rul_hours, rul_lower_hours, rul_upper_hours (NaN si
+            no hay datos suficientes; inf si la tendencia no se acerca al
+            umbral), slope (por hora, de la señal limitante), signal y n_points
+        """
+        rows = self.index.lookup(list(plc_ids))
+        known = rows >= 0
+        safe = np.where(known, rows, 0)
+        state = self._state()
+        n = np.where(known, state['n'][safe], 0).astype(np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_t, s_tt = state['sum_t'][safe][:, None], state['sum_tt'][safe][:, None]
+            s_y, s_yy, s_ty = state['sum_y'][safe], state['sum_yy'][safe], state['sum_ty'][safe]
+            nn = n[:, None]
+            stt = s_tt - s_t * s_t / nn
+            sty = s_ty - s_t * s_y / nn
+            syy = s_yy - s_y * s_y / nn
+            slope = sty / stt
+            intercept = (s_y - slope * s_t) / nn
+            sse = np.maximum(syy - slope * sty, 0.0)
+            slope_se = np.sqrt(sse / np.maximum(nn - 2, 1) / stt)
+
+            t_now = ((state['last_t'][safe] - state['origin'][safe]) / 3600.0)[:, None]
+            level = intercept + slope * t_now
+            # Distancia al umbral en el sentido de la degradación (<= 0: ya lo ha cruzado)
+            gap = self.direction * (self.threshold - level)
+            rate = self.direction * slope
+            margin = self.z * slope_se
+            rul = np.where(gap <= 0, 0.0, np.where(rate > 0, gap / rate, np.inf))
+            lower = np.where(gap <= 0, 0.0, np.where(rate + margin > 0, gap / (rate + margin), np.inf))
+            upper = np.where(gap <= 0, 0.0, np.where(rate - margin > 0, gap / (rate - margin), np.inf))
+
+        valid = (n >= self.min_points)[:, None] & np.isfinite(stt) & (stt > 0)
+        rul = np.where(valid, rul, np.nan)
+        limiting = np.argmin(np.where(np.isnan(rul), np.inf, rul), axis=1)
+        pick = np.arange(len(rows))
+        has_estimate = valid.any(axis=1)
+        return {
+            'rul_hours': np.where(has_estimate, rul[pick, limiting], np.nan),
+            'rul_lower_hours': np.where(has_estimate, lower[pick, limiting], np.nan),
+            'rul_upper_hours': np.where(has_estimate, upper[pick, limiting], np.nan),
+            'slope': np.where(has_estimate, slope[pick, limiting], np.nan),
+            'signal': [self.names[i] if ok else None for i, ok in zip(limiting, has_estimate)],
+            'n_points': n.astype(np.int64)
+        }
+
+    def update_frame(self, frame):
+        """Actualiza con un DataFrame (plc_id, timestamp y señales) y estima cada fila"""
+        plc_ids = frame['plc_id'].tolist()
+        self.update(plc_ids, frame['timestamp'], frame[self.names].to_numpy(dtype=np.float64))
+        return self.estimate(plc_ids)
+
+    def get_stats(self):
+        return {'machines': len(self.index), 'signals': self.names, 'window': self.window}
@@ -0,0 +1,97 @@
+import sys
+import os
+import argparse
+import json
+import logging
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_scoring import BackfillJob
+
+def setup_logging():
+    """Configura el sistema de logging"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('backfill_predictions.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+    return logging.getLogger(__name__)
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description='Puntúa un rango histórico de plc_mech y guarda las predicciones')
+    parser.add_argument('--desde', type=datetime.fromisoformat, default=None,
+                        help='Inicio del rango (ISO, p. ej. 2024-01-01T00:00:00)')
+    parser.add_argument('--hasta', type=datetime.fromisoformat, default=None,
+                        help='Fin del rango, excluido (por defecto, el inicio de la hora actual)')
+    parser.add_argument('--dias', type=float, default=None,
+                        help='Alternativa a --desde: los últimos N días hasta --hasta')
+    parser.add_argument('--version', default=None,
+                        help='Versión del modelo (por defecto, la actual); permite comparar versiones')
+    parser.add_argument('--trozo-horas', type=float, default=6,
+                        help='Duración de cada tramo que procesa un proceso')
+    parser.add_argument('--procesos', type=int, default=None,
+                        help='Procesos del pool (por defecto, todos los núcleos)')
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json',
+                        help='Fichero de progreso para reanudar el trabajo')
+    parser.add_argument('--reiniciar', action='store_true',
+                        help='Ignora el checkpoint y procesa todo el rango')
+    parser.add_argument('--directorio', default=None,
+                        help='Guarda un .npz por bloque de cada tramo en este directorio en lugar de la tabla predictions')
+    parser.add_argument('--calentamiento-min', type=float, default=15,
+                        help='Minutos anteriores a cada tramo para calentar la tendencia de la RUL')
+    parser.add_argument('--max-filas', type=int, default=200000,
+                        help='Filas máximas que un proceso lee y puntúa de una vez dentro de un tramo')
+    parser.add_argument('--sintetico', type=int, default=None, metavar='MAQUINAS',
+                        help='Puntúa una flota sintética de N máquinas en lugar de plc_mech (mide el rendimiento sin BD)')
+    parser.add_argument('--frecuencia-s', type=float, default=1.0,
+                        help='Segundos entre lecturas de la flota sintética')
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+    if args.desde is None and args.dias is None:
+        parser.error('Indica --desde o --dias')
+    return args
+
+def main():
+    args = parse_args()
+    logger = setup_logging()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+
+    # Por defecto se alinea a la hora para que relanzar el mismo comando reanude el trabajo
+    end = args.hasta or datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = args.desde or end - timedelta(days=args.dias)
+    if args.reiniciar and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    source = 'db' if args.sintetico is None else {'machines': args.sintetico, 'freq_s': args.frecuencia_s}
+    try:
+        job = BackfillJob(
+            config, start, end, version=args.version, chunk_hours=args.trozo_horas,
+            n_workers=args.procesos, checkpoint_path=args.checkpoint, output_dir=args.directorio,
+            source=source, warmup_minutes=args.calentamiento_min, max_rows=args.max_filas,
+            logger=logger
+        )
+        report = job.run()
+    except Exception as e:
+        logger.error(f"Error en el backfill: {e}")
+        return 1
+
+    busy = report['read_s'] + report['score_s'] + report['write_s']
+    logger.info(f"[INFO] Modelo {report['version']}: {report['rows']} filas en {report['wall_time_s']:.1f} s "
+                f"({report['rows_per_s'] or 0:,.0f} filas/s con {report['n_workers']} procesos)")
+    if busy > 0:
+        logger.info(f"[INFO] Reparto del tiempo: lectura {report['read_s'] / busy:.0%}, "
+                    f"puntuación {report['score_s'] / busy:.0%}, escritura {report['write_s'] / busy:.0%}")
+    logger.info(f"[INFO] Tramos completados {report['chunks_done']}/{report['chunks']} "
+                f"({report['total_rows']} filas en total con el checkpoint)")
+    if report['chunks_failed']:
+        logger.error(f"[ERROR] Tramos fallidos: {sorted(report['chunks_failed'])}; relanza para reintentarlos")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import sys
+import os
+import argparse
+import subprocess
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_pipeline import FEATURE_COLUMNS, build_features, scale_features
+from flat_forest import FlatForest, export_forest, check_parity
+from synthetic_data import generate_history
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+# Carga y puntuación en un proceso limpio: comprueba que sklearn no se importa
+SERVE_CHECK = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from flat_forest import FlatForest
+flat = FlatForest.load({path!r})
+flat.predict_proba([[0.0] * {n_features}])
+print(time.perf_counter() - start, 'sklearn' in sys.modules)
+"""
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description='Compara el bosque aplanado con la inferencia de sklearn')
+    parser.add_argument('--maquinas', type=int, default=10, help='Máquinas simuladas')
+    parser.add_argument('--lecturas', type=int, default=5000, help='Lecturas por máquina')
+    parser.add_argument('--arboles', type=int, default=100)
+    parser.add_argument('--repeticiones', type=int, default=300, help='Llamadas para medir la latencia por fila')
+    return parser.parse_args()
+
+def latency_ms(predict, rows):
+    """p50/p99 de una llamada con una sola fila"""
+    samples = []
+    for row in rows:
+        start = time.perf_counter()
+        predict(row)
+        samples.append((time.perf_counter() - start) * 1000)
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+def throughput(predict, X):
+    start = time.perf_counter()
+    predict(X)
+    return len(X) / (time.perf_counter() - start)
+
+def main():
+    args = parse_args()
+    df = generate_history(n_machines=args.maquinas, n_steps=args.lecturas)
+    X = build_features(df)
+    y = df['maintenance_needed'].to_numpy()
+
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=args.arboles, random_state=42, n_jobs=1)
+    model.fit(scale_features(X, scaler), y)
+    flat = export_forest(model, scaler, FEATURE_COLUMNS)
+
+    ok, diff = check_parity(model, flat, X, scaler)
+    print(f"[INFO] Paridad con sklearn sobre {len(X)} filas: {'OK' if ok else 'FALLO'} (máx. diferencia {diff:.2e})")
+
+    def sklearn_predict(rows):
+        return model.predict_proba(scale_features(rows, scaler))
+
+    rows = [X[i:i + 1] for i in np.random.default_rng(0).integers(0, len(X), args.repeticiones)]
+    print("\n[INFO] Latencia por fila (ms)")
+    for name, predict in (('sklearn', sklearn_predict), ('aplanado', flat.predict_proba)):
+        p50, p99 = latency_ms(predict, rows)
+        print(f"  {name:<9} p50 {p50:.3f}  p99 {p99:.3f}")
+
+    print("\n[INFO] Rendimiento por lotes (filas/s)")
+    for batch in (16, 256, 4096, len(X)):
+        sk = throughput(sklearn_predict, X[:batch])
+        fl = throughput(flat.predict_proba, X[:batch])
+        print(f"  lote {batch:>7}: sklearn {sk:>10.0f}  aplanado {fl:>10.0f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        joblib_path = os.path.join(tmp, 'pipeline.joblib')
+        flat_path = os.path.join(tmp, 'forest.npz')
+        joblib.dump({'model': model, 'scaler': scaler}, joblib_path)
+        flat.save(flat_path)
+
+        start = time.perf_counter()
+        joblib.load(joblib_path)
+        joblib_load = time.perf_counter() - start
+        start = time.perf_counter()
+        FlatForest.load(flat_path)
+        flat_load = time.perf_counter() - start
+
+        script = SERVE_CHECK.format(
+            root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            path=flat_path, n_features=len(FEATURE_COLUMNS)
+        )
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        cold_start, sklearn_imported = output.stdout.split()
+
+        print("\n[INFO] Memoria y carga")
+        print(f"  sklearn : {os.path.getsize(joblib_path) / 1e6:.2f} MB en disco, carga {joblib_load * 1000:.1f} ms")
+        print(f"  aplanado: {os.path.getsize(flat_path) / 1e6:.2f} MB en disco, {flat.nbytes / 1e6:.2f} MB en memoria, "
+              f"carga {flat_load * 1000:.1f} ms")
+        print(f"  arranque en frío sin sklearn: {float(cold_start) * 1000:.1f} ms "
+              f"(sklearn importado: {'sí' if sklearn_imported == 'True' else 'no'})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import sys
+import os
+import argparse
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_pipeline import build_features, scale_features
+from incremental_training import add_trees, update_feature_stats
+from synthetic_data import generate_history
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import accuracy_score, f1_score
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description='Compara reentrenamiento completo e incremental')
+    parser.add_argument('--maquinas', type=int, default=20, help='Máquinas simuladas')
+    parser.add_argument('--lecturas', type=int, default=20000, help='Lecturas por máquina')
+    parser.add_argument('--fraccion-nueva', type=float, default=0.05,
+                        help='Fracción del histórico que llega desde el último entrenamiento')
+    parser.add_argument('--arboles-nuevos', type=int, default=10)
+    parser.add_argument('--max-arboles', type=int, default=300)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    return parser.parse_args()
+
+def evaluate(model, X, y):
+    y_pred = model.predict(X)
+    return accuracy_score(y, y_pred), f1_score(y, y_pred, zero_division=0)
+
+def main():
+    args = parse_args()
+    df = generate_history(n_machines=args.maquinas, n_steps=args.lecturas)
+    X_all = build_features(df)
+    y_all = df['maintenance_needed'].to_numpy()
+
+    # Histórico ya entrenado | datos nuevos | validación (los más recientes)
+    n = len(df)
+    holdout_start = int(n * 0.9)
+    new_start = int(holdout_start * (1 - args.fraccion_nueva))
+    X_old, y_old = X_all[:new_start], y_all[:new_start]
+    X_new, y_new = X_all[new_start:holdout_start], y_all[new_start:holdout_start]
+    X_val, y_val = X_all[holdout_start:], y_all[holdout_start:]
+    print(f"[INFO] Histórico: {len(y_old)} filas, nuevas: {len(y_new)}, validación: {len(y_val)}")
+
+    # Modelo de partida entrenado sobre el histórico
+    scaler = StandardScaler().fit(X_old)
+    base_model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=args.n_jobs)
+    base_model.fit(scale_features(X_old, scaler), y_old)
+    base_acc, base_f1 = evaluate(base_model, scale_features(X_val, scaler), y_val)
+
+    # Reentrenamiento completo sobre histórico + nuevos
+    start = time.perf_counter()
+    X_full = np.vstack([X_old, X_new])
+    full_scaler = StandardScaler().fit(X_full)
+    full_model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=args.n_jobs)
+    full_model.fit(scale_features(X_full, full_scaler), np.concatenate([y_old, y_new]))
+    full_seconds = time.perf_counter() - start
+    full_acc, full_f1 = evaluate(full_model, scale_features(X_val, full_scaler), y_val)
+
+    # Incremental: solo los datos nuevos, scaler congelado y estadísticas en curso
+    start = time.perf_counter()
+    incremental_model = add_trees(base_model, scale_features(X_new, scaler), y_new,
+                                  args.arboles_nuevos, args.max_arboles)
+    if incremental_model is None:
+        print("[ERROR] Los datos nuevos no tienen todas las clases del modelo")
+        return 1
+    update_feature_stats(scaler, X_new)
+    incremental_seconds = time.perf_counter() - start
+    inc_acc, inc_f1 = evaluate(incremental_model, scale_features(X_val, scaler), y_val)
+
+    print(f"[INFO] Sin actualizar:  exactitud {base_acc:.4f}, F1 {base_f1:.4f}")
+    print(f"[INFO] Completo:        {full_seconds:8.2f} s, exactitud {full_acc:.4f}, F1 {full_f1:.4f}")
+    print(f"[INFO] Incremental:     {incremental_seconds:8.2f} s, exactitud {inc_acc:.4f}, F1 {inc_f1:.4f} "
+          f"({len(incremental_model.estimators_)} árboles)")
+    print(f"[INFO] Aceleración: x{full_seconds / max(incremental_seconds, 1e-9):.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import sys
+import os
+import argparse
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from transport import MemoryTransport, FileLogTransport, KafkaTransport
+from sensor_producerPLC import EnhancedPLCDataCollector
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description='Mide el coste del pipeline con cada backend de transporte')
+    parser.add_argument('--mensajes', type=int, default=20000, help='Mensajes a enviar por backend')
+    parser.add_argument('--backends', nargs='+', default=['memory', 'filelog'],
+                        choices=['memory', 'filelog', 'kafka'], help='Backends a medir')
+    parser.add_argument('--kafka-broker', default='localhost:9092')
+    return parser.parse_args()
+
+def build_messages(n_messages):
+    """Genera mensajes con el mismo formato y simulación que el productor"""
+    collector = EnhancedPLCDataCollector(plc_ip='10.0.0.1', config_path='', transport=MemoryTransport())
+    return [collector.build_message(collector.simulate_plc_data()) for _ in range(n_messages)]
+
+def run_backend(transport, messages, topic):
+    """Produce y consume todos los mensajes; devuelve rendimiento y latencias"""
+    latencies = []
+    received = threading.Event()
+    consumer = transport.consumer(topic, group_id='benchmark', auto_offset_reset='earliest')
+
+    def consume():
+        while len(latencies) < len(messages):
+            for record in consumer.poll(timeout_ms=100, max_records=1000):
+                latencies.append(time.perf_counter() - record.value['_sent_at'])
+        received.set()
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+
+    producer = transport.producer()
+    start = time.perf_counter()
+    for message in messages:
+        message['_sent_at'] = time.perf_counter()
+        producer.send(topic, message, key=message['plc_id'])
+    producer.flush()
+    produce_seconds = time.perf_counter() - start
+
+    received.wait(timeout=120)
+    total_seconds = time.perf_counter() - start
+    producer.close()
+    consumer.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'produce_msgs_s': len(messages) / produce_seconds,
+        'end_to_end_msgs_s': len(latencies) / total_seconds,
+        'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else float('nan'),
+        'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else float('nan'),
+        'received': len(latencies)
+    }
+
+def main():
+    args = parse_args()
+    messages = build_messages(args.mensajes)
+    topic = f'benchmark_{int(time.time())}'
+
+    for backend in args.backends:
+        if backend == 'memory':
+            transport = MemoryTransport()
+        elif backend == 'filelog':
+            transport = FileLogTransport(tempfile.mkdtemp(prefix='transport_bench_'))
+        else:
+            transport = KafkaTransport(args.kafka_broker)
+
+        try:
+            result = run_backend(transport, messages, topic)
+        except Exception as e:
+            print(f"[ERROR] {backend}: {e}")
+            continue
+
+        print(f"[INFO] {backend}: produce {result['produce_msgs_s']:.0f} msg/s, "
+              f"extremo a extremo {result['end_to_end_msgs_s']:.0f} msg/s, "
+              f"latencia p50 {result['latency_p50_ms']:.2f} ms / p99 {result['latency_p99_ms']:.2f} ms "
+              f"({result['received']}/{len(messages)} recibidos)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
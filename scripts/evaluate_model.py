@@ -1,11 +1,14 @@
-import joblib
-import numpy as np
-import pandas as pd
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-import logging
+import sys
+import os
+import argparse
 import json
-from datetime import datetime
-from sklearn.preprocessing import StandardScaler
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import ModelRegistry
+from model_evaluation import ModelEvaluator, load_holdout
+
+SOURCES = {'bd': 'db', 'csv': 'csv', 'sintetico': 'synthetic'}
 
 def setup_logging():
     """Configura el sistema de logging"""
@@ -19,87 +22,102 @@ def setup_logging():
     )
     return logging.getLogger(__name__)
 
-def generate_dummy_data():
-    """Genera datos dummy más realistas para evaluación"""
-    n_samples = 1000
-    np.random.seed(42)  # Para reproducibilidad
-    
-    # Generar características que simulan datos de sensores
-    X_test = np.zeros((n_samples, 10))
-    
-    # Generar datos normales para condiciones normales
-    normal_samples = int(n_samples * 0.7)  # 70% datos normales
-    failure_samples = n_samples - normal_samples  # 30% datos de fallo
-    
-    # Datos normales
-    X_test[:normal_samples, 0] = np.random.normal(50, 5, normal_samples)  # Temperatura normal
-    X_test[:normal_samples, 1] = np.random.normal(60, 5, normal_samples)  # Humedad normal
-    X_test[:normal_samples, 2] = np.random.normal(100, 10, normal_samples)  # Presión normal
-    X_test[:normal_samples, 3] = np.random.normal(40, 3, normal_samples)  # Vibración normal
-    
-    # Datos de fallo
-    X_test[normal_samples:, 0] = np.random.normal(75, 8, failure_samples)  # Temperatura alta
-    X_test[normal_samples:, 1] = np.random.normal(85, 8, failure_samples)  # Humedad alta
-    X_test[normal_samples:, 2] = np.random.normal(70, 15, failure_samples)  # Presión baja
-    X_test[normal_samples:, 3] = np.random.normal(70, 5, failure_samples)  # Vibración alta
-    
-    # Otras métricas
-    X_test[:, 4:] = np.random.rand(n_samples, 6) * 100
-    
-    # Generar etiquetas
-    y_test = np.zeros(n_samples)
-    y_test[normal_samples:] = 1  # Marcar datos de fallo
-    
-    # Escalar datos
-    scaler = StandardScaler()
-    X_test = scaler.fit_transform(X_test)
-    
-    return X_test, y_test
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(
+        description='Evalúa versiones registradas sobre un holdout temporal (métricas, latencia, rendimiento)'
+    )
+    parser.add_argument('--version', default=None, help='Versión a evaluar (por defecto, la actual)')
+    parser.add_argument('--comparar', default=None, metavar='VERSION',
+                        help='Evalúa también esta versión en la misma ejecución y falla si la primera empeora')
+    parser.add_argument('--fuente', choices=list(SOURCES), default=None,
+                        help='Origen del holdout: plc_mech, un CSV exportado o un histórico sintético')
+    parser.add_argument('--historico', default=None, help='Fichero CSV para --fuente csv')
+    parser.add_argument('--dias', type=float, default=None, help='Días de plc_mech de los que sale el holdout')
+    parser.add_argument('--fraccion', type=float, default=None, help='Parte más reciente que forma el holdout')
+    parser.add_argument('--max-filas', type=int, default=None, help='Lecturas más recientes que se conservan')
+    parser.add_argument('--resultado', default=None,
+                        help='Escribe aquí un JSON con el veredicto (lo usa el planificador de reentrenamiento)')
+    parser.add_argument('--config', default='config.json')
+    return parser.parse_args()
+
+def log_result(logger, result):
+    metrics = result['metrics']
+    logger.info(f"[INFO] Modelo {result['version']}: F1 {metrics['f1']:.3f}, precisión {metrics['precision']:.3f}, "
+                f"recall {metrics['recall']:.3f}, exactitud {metrics['accuracy']:.3f}"
+                + (f", AUC {metrics['roc_auc']:.3f}" if metrics['roc_auc'] is not None else ''))
+    logger.info(f"[INFO] Latencia de una lectura: p50 {result['latency_ms']['p50']:.3f} ms, "
+                f"p99 {result['latency_ms']['p99']:.3f} ms")
+    throughput = ', '.join(f"{size}: {rate:,.0f}" for size, rate in result['throughput_rows_s'].items() if rate)
+    logger.info(f"[INFO] Rendimiento por lote (filas/s): {throughput}")
+    logger.info(f"[INFO] Carga {result['load_s'] * 1000:.1f} ms"
+                + (f" (bosque aplanado {result['flat_load_s'] * 1000:.1f} ms)" if result['flat_load_s'] else '')
+                + f", tamaño {result['size_bytes'] / 1e6:.2f} MB")
+    if metrics.get('flat_max_abs_diff'):
+        logger.warning(f"Diferencia entre bosque aplanado y sklearn: {metrics['flat_max_abs_diff']:.2e}")
 
-def evaluate_model():
-    """Evalúa el modelo y guarda las métricas"""
+def write_verdict(path, verdict):
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(verdict, f, default=str)
+
+def main():
+    args = parse_args()
     logger = setup_logging()
-    
     try:
-        # Cargar el modelo
-        logger.info("Cargando modelo...")
-        model = joblib.load('maintenance_model.joblib')
-        
-        # Generar datos de prueba
-        logger.info("Preparando datos de evaluación...")
-        X_test, y_test = generate_dummy_data()
-        
-        # Realizar predicciones
-        logger.info("Realizando predicciones...")
-        y_pred = model.predict(X_test)
-        
-        # Calcular métricas
-        metrics = {
-            'accuracy': accuracy_score(y_test, y_pred),
-            'precision': precision_score(y_test, y_pred),
-            'recall': recall_score(y_test, y_pred),
-            'f1': f1_score(y_test, y_pred),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        # Guardar métricas en CSV
-        logger.info("Guardando métricas...")
-        metrics_df = pd.DataFrame([metrics])
-        metrics_df.to_csv('model_metrics.csv', index=False)
-        
-        # Mostrar resultados
-        logger.info("Métricas del modelo:")
-        logger.info(f"Exactitud: {metrics['accuracy']:.2f}")
-        logger.info(f"Precisión: {metrics['precision']:.2f}")
-        logger.info(f"Recall: {metrics['recall']:.2f}")
-        logger.info(f"F1-Score: {metrics['f1']:.2f}")
-        
-        return True
-        
+        config = {}
+        if os.path.exists(args.config):
+            with open(args.config, 'r') as f:
+                config = json.load(f)
+        holdout = config.get('evaluation', {}).get('holdout', {})
+        source = SOURCES[args.fuente] if args.fuente else holdout.get('source', 'db')
+
+        registry = ModelRegistry.from_config(config)
+        evaluator = ModelEvaluator.from_config(config, registry)
+        version = args.version or registry.current_version()
+        if version is None:
+            raise Exception("No hay ningún modelo registrado")
+
+        logger.info("Preparando holdout temporal...")
+        X, y, timestamps = load_holdout(
+            source, config,
+            days=args.dias if args.dias is not None else holdout.get('days', 7),
+            fraction=args.fraccion if args.fraccion is not None else holdout.get('fraction', 0.2),
+            max_rows=args.max_filas if args.max_filas is not None else holdout.get('max_rows'),
+            path=args.historico or holdout.get('path'),
+            logger=logger
+        )
+
+        baseline = None
+        if args.comparar and args.comparar != version:
+            # Misma máquina y mismo holdout: las latencias son comparables
+            baseline = evaluator.evaluate(args.comparar, X, y, timestamps, source)
+            evaluator.save(baseline)
+            log_result(logger, baseline)
+        result = evaluator.evaluate(version, X, y, timestamps, source)
+        evaluator.save(result)
+        log_result(logger, result)
+
+        regressions = evaluator.compare(result, baseline) if baseline else []
+        warnings = []
+        if baseline and not evaluator.performance_gate:
+            warnings = evaluator.performance_regressions(result, baseline)
+        for regression in regressions:
+            logger.error(f"[ERROR] Regresión de {version} frente a {args.comparar}: {regression}")
+        for warning in warnings:
+            logger.warning(f"Rendimiento de {version} frente a {args.comparar} (solo aviso): {warning}")
+        if baseline and not regressions:
+            logger.info(f"[INFO] {version} no empeora a {args.comparar}")
+        logger.info(f"Resultados añadidos a {evaluator.results_path}")
+        write_verdict(args.resultado, {'version': version, 'baseline': args.comparar,
+                                       'passed': not regressions, 'regressions': regressions,
+                                       'warnings': warnings})
+        return 2 if regressions else 0
+
     except Exception as e:
         logger.error(f"Error evaluando el modelo: {e}")
-        return False
+        write_verdict(args.resultado, {'version': args.version, 'passed': False, 'error': str(e)})
+        return 1
 
 if __name__ == "__main__":
-    success = evaluate_model()
-    exit(0 if success else 1) 
\ No newline at end of file
+    sys.exit(main())
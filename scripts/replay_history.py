@@ -0,0 +1,101 @@
+import sys
+import os
+import argparse
+import json
+import logging
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import ReplayJob
+
+def setup_logging():
+    """Configura el sistema de logging"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('replay_history.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+    return logging.getLogger(__name__)
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(
+        description='Reproduce un rango histórico por el agente con reloj virtual y lista las alertas que habría dado'
+    )
+    parser.add_argument('--desde', type=datetime.fromisoformat, default=None,
+                        help='Inicio del rango (ISO, p. ej. 2024-01-01T00:00:00)')
+    parser.add_argument('--hasta', type=datetime.fromisoformat, default=None,
+                        help='Fin del rango, excluido (por defecto, el inicio de la hora actual)')
+    parser.add_argument('--dias', type=float, default=None,
+                        help='Alternativa a --desde: los últimos N días hasta --hasta')
+    parser.add_argument('--maquinas', nargs='+', default=None,
+                        help='Solo estas máquinas (por defecto, todas las que tienen lecturas en el rango)')
+    parser.add_argument('--version', default=None, help='Versión del modelo (por defecto, la actual)')
+    parser.add_argument('--reglas', default=None,
+                        help='Fichero de reglas de fallo a probar en lugar del configurado')
+    parser.add_argument('--config-extra', default=None,
+                        help='JSON con ajustes que se mezclan sobre la configuración (p. ej. umbrales de anomalías)')
+    parser.add_argument('--procesos', type=int, default=None,
+                        help='Procesos del pool (por defecto, todos los núcleos)')
+    parser.add_argument('--trozo-horas', type=float, default=6,
+                        help='Horas de histórico que se leen de una vez por grupo de máquinas')
+    parser.add_argument('--lote', type=int, default=1000, help='Lecturas por lote del agente')
+    parser.add_argument('--calentamiento-min', type=float, default=15,
+                        help='Minutos anteriores al rango que se procesan sin registrar alertas')
+    parser.add_argument('--sintetico', type=int, default=None, metavar='MAQUINAS',
+                        help='Reproduce una flota sintética de N máquinas en lugar de plc_mech')
+    parser.add_argument('--frecuencia-s', type=float, default=1.0,
+                        help='Segundos entre lecturas de la flota sintética')
+    parser.add_argument('--salida', default='replay_alerts.jsonl', help='Fichero JSONL con las alertas')
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+    if args.desde is None and args.dias is None:
+        parser.error('Indica --desde o --dias')
+    return args
+
+def main():
+    args = parse_args()
+    logger = setup_logging()
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    overrides = None
+    if args.config_extra:
+        with open(args.config_extra, 'r') as f:
+            overrides = json.load(f)
+
+    end = args.hasta or datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = args.desde or end - timedelta(days=args.dias)
+    source = 'db' if args.sintetico is None else {'machines': args.sintetico, 'freq_s': args.frecuencia_s}
+    try:
+        job = ReplayJob(
+            config, start, end, machines=args.maquinas, version=args.version, rules_path=args.reglas,
+            overrides=overrides, n_workers=args.procesos, chunk_hours=args.trozo_horas,
+            batch_rows=args.lote, warmup_minutes=args.calentamiento_min, source=source,
+            output=args.salida, logger=logger
+        )
+        report = job.run()
+    except Exception as e:
+        logger.error(f"Error en la reproducción: {e}")
+        return 1
+
+    logger.info(f"[INFO] {report['rows']} lecturas de {report['machines']} máquinas en {report['wall_time_s']:.1f} s "
+                f"({report['rows_per_s'] or 0:,.0f} lecturas/s, {report['speedup'] or 0:,.0f}x tiempo real "
+                f"con {report['n_workers']} procesos)")
+    summary = report['summary']
+    logger.info(f"[INFO] {report['alerts']} alertas: "
+                + (', '.join(f"{name} {count}" for name, count in summary['by_type'].items()) or 'ninguna'))
+    for name, count in list(summary['patterns'].items())[:10]:
+        logger.info(f"[INFO]   patrón {name}: {count}")
+    for name, count in list(summary['anomalies'].items())[:10]:
+        logger.info(f"[INFO]   anomalía {name}: {count}")
+    logger.info(f"[INFO] Alertas guardadas en {report['output']}")
+    if report['groups_failed']:
+        logger.error(f"[ERROR] Grupos fallidos: {sorted(report['groups_failed'])}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
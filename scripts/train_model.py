@@ -1,13 +1,16 @@
 import sys
 import os
 import argparse
+import json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from predictive_maintenance_agent import PredictiveMaintenanceAgent
+from feature_pipeline import FEATURE_COLUMNS, FEATURE_VERSION, scale_features
+from synthetic_data import generate_feature_samples
+from model_registry import ModelRegistry
 import logging
-import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-import joblib
+from sklearn.preprocessing import StandardScaler
 
 def setup_logging():
     logging.basicConfig(
@@ -23,8 +26,26 @@ def setup_logging():
 def parse_args():
     """Procesa los argumentos de línea de comandos"""
     parser = argparse.ArgumentParser(description='Entrenamiento del modelo de mantenimiento predictivo')
-    parser.add_argument('--tipo', type=str, choices=['completo', 'incremental'],
+    parser.add_argument('--tipo', type=str, choices=['completo', 'incremental', 'busqueda'],
                       default='completo', help='Tipo de entrenamiento a realizar')
+    parser.add_argument('--candidato', action='store_true',
+                      help='Registra el modelo sin promocionarlo (lo promociona el planificador)')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                      help='Núcleos a usar en el entrenamiento')
+    parser.add_argument('--arboles-nuevos', type=int, default=10,
+                      help='Árboles a añadir en el entrenamiento incremental')
+    parser.add_argument('--max-arboles', type=int, default=300,
+                      help='Máximo de árboles que conserva el modelo incremental')
+    parser.add_argument('--dias', type=int, default=None,
+                      help='Días de histórico a usar (por defecto training_data.days)')
+    parser.add_argument('--max-filas', type=int, default=None,
+                      help='Tamaño máximo de la muestra estratificada de entrenamiento')
+    parser.add_argument('--particiones', type=int, default=3,
+                      help='Folds temporales de la búsqueda de modelos')
+    parser.add_argument('--informe', type=str, default='model_search_report.json',
+                      help='Fichero JSON con el informe de la búsqueda de modelos')
+    parser.add_argument('--resultado', type=str, default=None,
+                      help='Fichero JSON donde escribir la versión registrada y sus métricas')
     
     # Si no hay argumentos, usar los valores por defecto
     if len(sys.argv) == 1:
@@ -36,44 +57,38 @@ def train_with_dummy_data(tipo_entrenamiento):
     logger = logging.getLogger(__name__)
     logger.warning(f"Usando datos dummy para entrenamiento {tipo_entrenamiento}")
     
-    # Generar datos dummy
+    # Generar datos dummy con las mismas columnas y significado que en producción
     n_samples = 1000 if tipo_entrenamiento == 'completo' else 500
-    np.random.seed(42)  # Para reproducibilidad
+    X_raw, y = generate_feature_samples(n_samples)
     
-    # Generar características que simulan datos de sensores
-    X = np.zeros((n_samples, 10))
-    
-    # Datos normales (70%)
-    normal_samples = int(n_samples * 0.7)
-    failure_samples = n_samples - normal_samples
-    
-    # Datos normales
-    X[:normal_samples, 0] = np.random.normal(50, 5, normal_samples)  # Temperatura normal
-    X[:normal_samples, 1] = np.random.normal(60, 5, normal_samples)  # Humedad normal
-    X[:normal_samples, 2] = np.random.normal(100, 10, normal_samples)  # Presión normal
-    X[:normal_samples, 3] = np.random.normal(40, 3, normal_samples)  # Vibración normal
-    
-    # Datos de fallo (30%)
-    X[normal_samples:, 0] = np.random.normal(75, 8, failure_samples)  # Temperatura alta
-    X[normal_samples:, 1] = np.random.normal(85, 8, failure_samples)  # Humedad alta
-    X[normal_samples:, 2] = np.random.normal(70, 15, failure_samples)  # Presión baja
-    X[normal_samples:, 3] = np.random.normal(70, 5, failure_samples)  # Vibración alta
-    
-    # Otras métricas
-    X[:, 4:] = np.random.rand(n_samples, 6) * 100
-    
-    # Generar etiquetas
-    y = np.zeros(n_samples)
-    y[normal_samples:] = 1  # Marcar datos de fallo
-    
-    # Entrenar modelo
+    # Entrenar modelo sobre las features escaladas, igual que en producción
+    scaler = StandardScaler().fit(X_raw)
+    X = scale_features(X_raw, scaler)
     model = RandomForestClassifier(
         n_estimators=100 if tipo_entrenamiento == 'completo' else 50,
         random_state=42
     )
     model.fit(X, y)
     
-    return model, X, y
+    return model, scaler, X_raw, y
+
+def write_result(path, version, metrics):
+    """Escribe el resultado del entrenamiento para el planificador"""
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'metrics': metrics}, f, default=str)
+
+def write_search_report(path, version, report):
+    """Guarda y resume el informe de la búsqueda de modelos"""
+    logger = logging.getLogger(__name__)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(report, version=version), f, indent=2, default=str)
+    for candidate in report['candidates']:
+        score = candidate['mean_score']
+        logger.info(f"{candidate['family']:<24} {json.dumps(candidate['params'])}: "
+                    f"{'fallido' if score is None else f'{score:.3f}'} ({candidate['cpu_s']:.1f} s CPU)")
+    logger.info(f"Tiempo total {report['wall_time_s']:.1f} s, uso de CPU {report['cpu_utilization']:.0%} "
+                f"con {report['n_workers']} procesos; informe en {path}")
 
 def main():
     args = parse_args()
@@ -83,48 +98,59 @@ def main():
         
         # Inicializar agente
         agent = PredictiveMaintenanceAgent()
-        model_path = os.path.join(os.getcwd(), 'maintenance_model.joblib')
+        training_config = agent.config.setdefault('training_data', {})
+        if args.dias is not None:
+            training_config['days'] = args.dias
+        if args.max_filas is not None:
+            training_config['max_rows'] = args.max_filas
         
         try:
             # Intentar entrenar con datos reales
-            model = agent.train_model()
-            
-            # Guardar el modelo explícitamente
-            joblib.dump(model, model_path)
-            logger.info(f"Modelo guardado en: {model_path}")
-            
-            # Verificar que el modelo se guardó
-            if os.path.exists(model_path):
-                logger.info("✅ Modelo guardado exitosamente (datos reales)")
+            if args.tipo == 'busqueda':
+                # En la búsqueda --n-jobs es el número de procesos del pool
+                pipeline, report = agent.train_search(
+                    promote=not args.candidato, n_workers=args.n_jobs, n_splits=args.particiones
+                )
+                if report is not None:
+                    write_search_report(args.informe, pipeline['version'], report)
+            elif args.tipo == 'incremental':
+                pipeline = agent.train_incremental(
+                    n_new_trees=args.arboles_nuevos, max_trees=args.max_arboles,
+                    promote=not args.candidato
+                )
             else:
-                raise Exception("No se encontró el modelo después del entrenamiento con datos reales")
+                pipeline = agent.train_model(promote=not args.candidato, n_jobs=args.n_jobs)
+            if pipeline is None:
+                raise Exception("El entrenamiento con datos reales no produjo un modelo")
+            logger.info(f"✅ Modelo {pipeline['version']} registrado en: {agent.registry.root}")
+            if agent.training_loader is not None:
+                logger.info(f"Pico de memoria del entrenamiento: {agent.training_loader.stats['peak_rss_mb'] or 0:.0f} MB")
+            write_result(args.resultado, pipeline['version'], pipeline['metrics'])
                 
         except Exception as db_error:
+            # Un candidato nunca se sustituye por un modelo entrenado con datos dummy
+            if args.candidato or agent.pipeline['version'] != 'untrained':
+                logger.error(f"Entrenamiento cancelado: {db_error}")
+                return 1
+
             logger.error(f"Error accediendo a la base de datos: {db_error}")
             logger.info(f"Procediendo con entrenamiento {args.tipo} usando datos dummy...")
             
             # Entrenar con datos dummy
-            model, X, y = train_with_dummy_data(args.tipo)
+            model, scaler, X_raw, y = train_with_dummy_data(args.tipo)
             
-            # Guardar el modelo
-            joblib.dump(model, model_path)
-            logger.info(f"Modelo guardado en: {model_path}")
-            
-            # Verificar que el modelo se guardó
-            if os.path.exists(model_path):
-                logger.info("✅ Modelo guardado exitosamente (datos dummy)")
-            else:
-                logger.error("❌ Error: No se pudo guardar el modelo")
-                return 1
+            # Registrar el pipeline completo
+            registry = ModelRegistry.from_config(agent.config)
+            version = registry.register(
+                model, scaler, FEATURE_COLUMNS,
+                metadata={'training_rows': int(len(y)), 'dummy_data': True, 'feature_version': FEATURE_VERSION},
+                parity_sample=X_raw
+            )
+            logger.info(f"✅ Modelo {version} registrado en: {registry.root} (datos dummy)")
+            write_result(args.resultado, version, {})
             
             # Calcular y mostrar métricas básicas
-            feature_names = [
-                'temperature', 'vibration', 'pressure', 'rotation_speed',
-                'power_consumption', 'noise_level', 'oil_level', 'humidity',
-                'machine_age', 'wear_level'
-            ]
-            
-            importances = dict(zip(feature_names, model.feature_importances_))
+            importances = dict(zip(FEATURE_COLUMNS, model.feature_importances_))
             for feature, importance in sorted(importances.items(), key=lambda x: x[1], reverse=True):
                 logger.info(f"{feature}: {importance:.3f}")
         
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Columnas de ancho fijo que se guardan por lectura (mismo orden que plc_mech)
+CACHE_COLUMNS = {
+    'temperature': np.float32,
+    'vibration': np.float32,
+    'pressure': np.float32,
+    'rotation_speed': np.float32,
+    'power_consumption': np.float32,
+    'noise_level': np.float32,
+    'oil_level': np.float32,
+    'humidity': np.float32,
+    'machine_age': np.int32,
+    'wear_level': np.float32,
+    'maintenance_needed': np.bool_
+}
+
+MAGIC = b'PLCWIN01'
+PLC_ID_WIDTH = 50  # VARCHAR(50) en plc_mech
+ALIGNMENT = 64
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('max_machines', '<u4'),
+    ('capacity', '<u4'),
+    ('n_machines', '<u4')
+])
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(timestamp):
+    """Convierte un timestamp ingenuo (hora local, como en plc_mech) a segundos"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return (timestamp - EPOCH).total_seconds()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(max_machines, capacity):
+    """Calcula los offsets de cada bloque dentro del fichero"""
+    layout = {}
+    offset = _align(HEADER_DTYPE.itemsize)
+    blocks = [
+        ('plc_ids', np.dtype(f'S{PLC_ID_WIDTH}'), (max_machines,)),
+        ('cursor', np.dtype('<u8'), (max_machines,)),
+        ('seq', np.dtype('<u8'), (max_machines,)),
+        ('timestamp', np.dtype('<f8'), (max_machines, capacity))
+    ]
+    blocks += [(name, np.dtype(dtype), (max_machines, capacity)) for name, dtype in CACHE_COLUMNS.items()]
+
+    for name, dtype, shape in blocks:
+        layout[name] = (offset, dtype, shape)
+        offset = _align(offset + dtype.itemsize * int(np.prod(shape)))
+    return layout, offset
+
+
+class SensorWindowCache:
+    """
+    Ring buffer en memoria compartida (fichero mapeado) con la ventana reciente de cada PLC.
+
+    El consumidor es el único escritor. Cualquier otro proceso del host puede mapear
+    el fichero en solo lectura y leer la ventana sin consultas a Postgres.
+    Cada máquina tiene un cursor de escritura (lecturas totales) y un contador de
+    secuencia que es impar mientras se escribe una ranura.
+    """
+
+    def __init__(self, path, mmap, layout, writable):
+        self.path = path
+        self._mmap = mmap
+        self.writable = writable
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=mmap, offset=0)
+        self.columns = {}
+        for name, (offset, dtype, shape) in layout.items():
+            view = np.ndarray(shape, dtype=dtype, buffer=mmap, offset=offset)
+            if name == 'plc_ids':
+                self.plc_ids = view
+            elif name == 'cursor':
+                self.cursor = view
+            elif name == 'seq':
+                self.seq = view
+            else:
+                self.columns[name] = view
+        self.capacity = int(self.header['capacity'])
+        self.max_machines = int(self.header['max_machines'])
+        self._index = {}
+        self._refresh_index()
+
+    @classmethod
+    def create(cls, path, hours=6, sample_period_s=1.0, max_machines=32):
+        """Crea (o reabre si la geometría coincide) el fichero de caché para escritura"""
+        capacity = int(hours * 3600 / sample_period_s)
+        layout, size = _layout(max_machines, capacity)
+
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            mmap = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size,))
+            header = np.ndarray((), dtype=HEADER_DTYPE, buffer=mmap, offset=0)
+            if (header['magic'] == MAGIC and int(header['capacity']) == capacity
+                    and int(header['max_machines']) == max_machines):
+                return cls(path, mmap, layout, writable=True)
+            del mmap
+
+        mmap = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=mmap, offset=0)
+        header['version'] = 1
+        header['max_machines'] = max_machines
+        header['capacity'] = capacity
+        header['n_machines'] = 0
+        # La firma se escribe al final para que un lector nunca vea un fichero a medias
+        header['magic'] = MAGIC
+        mmap.flush()
+        return cls(path, mmap, layout, writable=True)
+
+    @classmethod
+    def open_readonly(cls, path):
+        """Mapea una caché existente en solo lectura"""
+        mmap = np.memmap(path, dtype=np.uint8, mode='r')
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=mmap, offset=0)
+        if header['magic'] != MAGIC:
+            raise ValueError(f"{path} no es una caché de ventana de sensores válida")
+        layout, size = _layout(int(header['max_machines']), int(header['capacity']))
+        if mmap.shape[0] < size:
+            raise ValueError(f"{path} está truncado ({mmap.shape[0]} < {size} bytes)")
+        return cls(path, mmap, layout, writable=False)
+
+    @classmethod
+    def from_config(cls, config, readonly=False):
+        """Abre la caché según la sección 'sensor_cache' del config; None si está desactivada"""
+        cache_config = config.get('sensor_cache', {})
+        if not cache_config.get('enabled', False):
+            return None
+        path = cache_config.get('path', 'sensor_window.cache')
+        if readonly:
+            if not os.path.exists(path):
+                return None
+            return cls.open_readonly(path)
+        return cls.create(
+            path,
+            hours=cache_config.get('hours', 6),
+            sample_period_s=cache_config.get('sample_period_s', 1.0),
+            max_machines=cache_config.get('max_machines', 32)
+        )
+
+    def _refresh_index(self):
+        n_machines = int(self.header['n_machines'])
+        if n_machines != len(self._index):
+            self._index = {
+                self.plc_ids[i].decode('utf-8'): i for i in range(n_machines)
+            }
+
+    def machine_ids(self):
+        self._refresh_index()
+        return list(self._index)
+
+    def _machine_row(self, plc_id, create=False):
+        row = self._index.get(plc_id)
+        if row is None:
+            self._refresh_index()
+            row = self._index.get(plc_id)
+        if row is None and create:
+            row = int(self.header['n_machines'])
+            if row >= self.max_machines:
+                raise ValueError(f"Caché llena: máximo {self.max_machines} máquinas")
+            self.plc_ids[row] = plc_id.encode('utf-8')[:PLC_ID_WIDTH]
+            self.header['n_machines'] = row + 1
+            self._index[plc_id] = row
+        return row
+
+    def append(self, plc_id, timestamp, values):
+        """Escribe una lectura en la siguiente ranura del ring buffer de la máquina"""
+        if not self.writable:
+            raise PermissionError("Caché abierta en solo lectura")
+        row = self._machine_row(plc_id, create=True)
+        slot = int(self.cursor[row]) % self.capacity
+
+        self.seq[row] += 1
+        self.columns['timestamp'][row, slot] = to_epoch(timestamp)
+        for name in CACHE_COLUMNS:
+            self.columns[name][row, slot] = values.get(name, 0)
+        self.cursor[row] += 1
+        self.seq[row] += 1
+
+    def append_message(self, message):
+        """Atajo para mensajes con el formato del productor"""
+        self.append(message['plc_id'], message['timestamp'], message['data'])
+
+    def _ordered_slices(self, row, count):
+        """Devuelve las ranuras (en orden de escritura) de las últimas `count` lecturas"""
+        end = int(self.cursor[row])
+        count = min(count, end, self.capacity)
+        start_slot = (end - count) % self.capacity
+        stop_slot = start_slot + count
+        if stop_slot <= self.capacity:
+            return [slice(start_slot, stop_slot)]
+        return [slice(start_slot, self.capacity), slice(0, stop_slot - self.capacity)]
+
+    def window(self, plc_id, seconds=None, now=None):
+        """
+        Obtiene la ventana reciente de una máquina como diccionario de columnas.
+
+        Los tramos se copian antes de volver a comprobar el contador de
+        secuencia: así la copia es coherente aunque el consumidor escriba a la
+        vez. Si no se consigue una lectura estable (p. ej. un escritor murió a
+        mitad de una escritura) devuelve None y quien llama debe ir a la BD.
+
+        Args:
+            plc_id: identificador de la máquina
+            seconds: antigüedad máxima de las lecturas (None = todo el buffer)
+            now: instante de referencia en segundos (por defecto, ahora)
+        """
+        row = self._machine_row(plc_id)
+        if row is None:
+            return {name: np.empty(0, dtype=col.dtype) for name, col in self.columns.items()}
+
+        for _ in range(100):
+            seq_before = int(self.seq[row])
+            if seq_before % 2:
+                time.sleep(0)
+                continue
+            slices = self._ordered_slices(row, self.capacity)
+            if seconds is not None:
+                cutoff = (to_epoch(datetime.now()) if now is None else now) - seconds
+                slices = self._trim(row, slices, cutoff)
+            # np.concatenate copia siempre, también con un solo tramo
+            result = {
+                name: np.concatenate([col[row, s] for s in slices])
+                for name, col in self.columns.items()
+            }
+            if int(self.seq[row]) == seq_before:
+                return result
+        return None
+
+    def _trim(self, row, slices, cutoff):
+        """Recorta los tramos a las lecturas con timestamp >= cutoff (búsqueda binaria)"""
+        timestamps = self.columns['timestamp'][row]
+        trimmed = []
+        for s in slices:
+            start = s.start + int(np.searchsorted(timestamps[s], cutoff, side='left'))
+            if start < s.stop:
+                trimmed.append(slice(start, s.stop))
+        return trimmed or [slice(0, 0)]
+
+    def latest(self, plc_id=None):
+        """
+        Última lectura de una máquina (o la más reciente de todas si plc_id es None).
+
+        None si no hay lecturas o no se consigue una lectura estable.
+        """
+        if plc_id is None:
+            candidates = [self.latest(machine) for machine in self.machine_ids()]
+            candidates = [c for c in candidates if c is not None]
+            if not candidates:
+                return None
+            return max(candidates, key=lambda c: c['timestamp'])
+
+        row = self._machine_row(plc_id)
+        if row is None:
+            return None
+        # Mismo protocolo que window(): copiar y volver a comprobar la secuencia
+        for _ in range(100):
+            seq_before = int(self.seq[row])
+            if seq_before % 2:
+                time.sleep(0)
+                continue
+            cursor = int(self.cursor[row])
+            if cursor == 0:
+                return None
+            slot = (cursor - 1) % self.capacity
+            reading = {name: col[row, slot].item() for name, col in self.columns.items()}
+            if int(self.seq[row]) == seq_before:
+                reading['plc_id'] = plc_id
+                return reading
+        return None
+
+    def to_frame(self, plc_id=None, minutes=5):
+        """Ventana reciente como DataFrame con las mismas columnas que plc_mech"""
+        machines = [plc_id] if plc_id is not None else self.machine_ids()
+        frames = []
+        for machine in machines:
+            columns = self.window(machine, seconds=minutes * 60)
+            if columns is None:
+                # Ventana inconsistente: mejor leer de la BD que mostrar datos a medias
+                return pd.DataFrame()
+            if len(columns['timestamp']) == 0:
+                continue
+            frame = pd.DataFrame(columns)
+            frame.insert(1, 'plc_id', machine)
+            frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+        return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+    def flush(self):
+        if self.writable:
+            self._mmap.flush()
+
+    def close(self):
+        self.flush()
+        self._mmap = None
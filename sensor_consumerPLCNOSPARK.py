@@ -1,10 +1,11 @@
 import json
 import os
-from kafka import KafkaConsumer
 import psycopg2
 from datetime import datetime
 import sys
 import time
+from sensor_cache import SensorWindowCache
+from transport import create_transport
 
 # Configurar salida para UTF-8 en Windows
 if sys.platform.startswith('win'):
@@ -112,20 +113,33 @@ def main():
 
     print("[INFO] Iniciando consumidor...")
     
+    # Ventana reciente compartida en memoria para dashboard y agente
+    window_cache = None
     try:
-        consumer = KafkaConsumer(
+        window_cache = SensorWindowCache.from_config(config)
+        if window_cache:
+            print(f"[INFO] Caché de ventana reciente activa en {window_cache.path}")
+    except Exception as e:
+        print(f"[ERROR] No se pudo crear la caché de ventana reciente: {e}")
+    
+    try:
+        transport = create_transport(config)
+        consumer = transport.consumer(
             config['kinesis_stream'],
-            bootstrap_servers=[config['kafka_broker']],
-            auto_offset_reset='earliest',
-            enable_auto_commit=True,
             group_id='my-group',
-            value_deserializer=lambda x: json.loads(x.decode('utf-8'))
+            auto_offset_reset='earliest',
+            enable_auto_commit=True
         )
 
-        print("[INFO] Esperando mensajes...")
+        print(f"[INFO] Esperando mensajes (transporte: {transport.name})...")
         
         for message in consumer:
             save_to_postgres(message.value)
+            if window_cache:
+                try:
+                    window_cache.append_message(message.value)
+                except Exception as e:
+                    print(f"[ERROR] Error actualizando caché de ventana: {e}")
 
     except Exception as e:
         print(f"[ERROR] Error en el consumidor: {e}")
@@ -133,6 +147,8 @@ def main():
         if 'consumer' in locals():
             consumer.close()
             print("[INFO] Consumidor cerrado")
+        if window_cache:
+            window_cache.close()
 
 def load_config(file_path):
     with open(file_path, 'r') as file:
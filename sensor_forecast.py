@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from statistics import NormalDist
+import numpy as np
+from fleet_state import MachineIndex, rank_within_group, to_epoch_seconds
+
+# Señales por defecto; con el motor de reglas se añaden sus umbrales críticos
+DEFAULT_SIGNALS = {
+    'wear_level': {'threshold': 0.7, 'direction': 'above', 'reset_drop': 0.2}
+}
+
+
+def signals_from_thresholds(thresholds, base=None):
+    """Señales a pronosticar a partir de los umbrales de failure_rules.json (nivel crítico)"""
+    signals = dict(base or DEFAULT_SIGNALS)
+    for feature, spec in (thresholds or {}).items():
+        if feature not in signals and 'critical' in spec:
+            signals[feature] = {'threshold': spec['critical'], 'direction': spec.get('direction', 'above')}
+    return signals
+
+
+class FleetForecaster:
+    """
+    Pronóstico multi-horizonte de los sensores de toda la flota.
+
+    Para cada máquina y señal se mantiene un modelo de Holt con tendencia
+    amortiguada (nivel, tendencia y varianza del error a un paso) sobre las
+    medias de cada intervalo de step_s segundos. Todas las series se
+    actualizan a la vez con operaciones vectorizadas (las lecturas de una
+    misma máquina por rondas, en orden). Como los parámetros son comunes, los
+    factores de cada horizonte (suma amortiguada de la tendencia y varianza
+    del error a h pasos) se precalculan, y el pronóstico de toda la flota es
+    una sola operación sobre los arrays de estado.
+
+    Un descenso brusco de una señal con reset_drop (mantenimiento) reinicia
+    la serie de esa máquina.
+    """
+
+    def __init__(self, signals=None, horizons_h=(1, 6, 24), step_s=60, alpha=0.3, beta=0.005, phi=0.999,
+                 var_alpha=0.05, confidence=0.95, min_points=10, interval_s=None):
+        self.signals = dict(signals or DEFAULT_SIGNALS)
+        self.names = list(self.signals)
+        self.horizons_h = tuple(horizons_h)
+        self.step_s = float(step_s)
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        self.var_alpha = var_alpha
+        self.min_points = min_points
+        # Un pase de pronóstico por intervalo cerrado
+        self.interval_s = interval_s or step_s
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.threshold = np.array([s['threshold'] for s in self.signals.values()], dtype=np.float64)
+        self.direction = np.array(
+            [1.0 if s.get('direction', 'above') == 'above' else -1.0 for s in self.signals.values()]
+        )
+        self.reset_drop = np.array([s.get('reset_drop', np.inf) for s in self.signals.values()], dtype=np.float64)
+        self.logger = logging.getLogger('SensorForecast')
+
+        # Factores por horizonte (h en pasos): media = nivel + tendencia·S(h) y
+        # varianza = σ²·V(h), con c_j = α + β·S(j) los pesos del error a j pasos
+        steps = np.maximum(1, np.round(np.asarray(self.horizons_h) * 3600 / self.step_s)).astype(np.int64)
+        self.horizon_steps = steps
+        self.damped_sum = np.array([self._damped_sum(h) for h in steps])
+        j = np.arange(1, steps.max(), dtype=np.float64)
+        c2 = (alpha + beta * self._damped_sum(j)) ** 2
+        cumulative = np.r_[0.0, np.cumsum(c2)]
+        self.variance_factor = 1.0 + cumulative[steps - 1]
+
+        n_signals = len(self.names)
+        self.index = MachineIndex()
+        self.index.register('bucket', dtype=np.int64, fill=-1)
+        self.index.register('bucket_sum', (n_signals,))
+        self.index.register('bucket_count', dtype=np.int64, fill=0)
+        self.index.register('last_bucket', dtype=np.int64, fill=-1)
+        self.index.register('n', dtype=np.int64, fill=0)
+        self.index.register('level', (n_signals,))
+        self.index.register('trend', (n_signals,))
+        self.index.register('var', (n_signals,))
+        self.stats = {'rows': 0, 'late_rows': 0, 'steps': 0, 'resets': 0, 'forecasts': 0, 'forecast_s': 0.0}
+
+    @classmethod
+    def from_config(cls, config, thresholds=None):
+        settings = dict(config.get('forecast', {}))
+        if 'signals' not in settings:
+            settings['signals'] = signals_from_thresholds(thresholds)
+        settings.pop('enabled', None)
+        return cls(**settings)
+
+    def _damped_sum(self, h):
+        """φ + φ² + ... + φ^h (h si no hay amortiguación)"""
+        if self.phi >= 1.0:
+            return np.asarray(h, dtype=np.float64)
+        return self.phi * (1 - self.phi ** np.asarray(h, dtype=np.float64)) / (1 - self.phi)
+
+    def _state(self):
+        return {name: self.index.array(name) for name in (
+            'bucket', 'bucket_sum', 'bucket_count', 'last_bucket', 'n', 'level', 'trend', 'var'
+        )}
+
+    def update(self, plc_ids, timestamps, Y):
+        """
+        Añade lecturas; cada intervalo cerrado actualiza el modelo de su máquina.
+
+        Las lecturas anteriores al intervalo abierto de su máquina se ignoran.
+
+        Args:
+            Y: valores (n, n_señales) en el orden de self.names
+        """
+        Y = np.asarray(Y, dtype=np.float64)
+        if len(Y) == 0:
+            return np.empty(0, dtype=np.intp)
+        rows = self.index.indices(list(plc_ids))
+        buckets = np.floor(to_epoch_seconds(timestamps) / self.step_s).astype(np.int64)
+        state = self._state()
+
+        ranks = rank_within_group(rows)
+        order = np.argsort(ranks, kind='stable')
+        bounds = np.searchsorted(ranks[order], np.arange(ranks.max() + 2))
+        for r in range(len(bounds) - 1):
+            sel = order[bounds[r]:bounds[r + 1]]
+            m, b, y = rows[sel], buckets[sel], Y[sel]
+            current = state['bucket'][m]
+            late = b < current
+            self.stats['late_rows'] += int(late.sum())
+
+            # La lectura abre un intervalo nuevo: se cierra el anterior
+            opens = b > current
+            closing = opens & (state['bucket_count'][m] > 0)
+            if closing.any():
+                mc = m[closing]
+                observed = state['bucket_sum'][mc] / state['bucket_count'][mc][:, None]
+                self._step(mc, current[closing], observed, state)
+            if opens.any():
+                mo = m[opens]
+                state['bucket'][mo] = b[opens]
+                state['bucket_sum'][mo] = 0.0
+                state['bucket_count'][mo] = 0
+
+            same = ~late
+            ms = m[same]
+            state['bucket_sum'][ms] += y[same]
+            state['bucket_count'][ms] += 1
+
+        self.stats['rows'] += len(Y)
+        return rows
+
+    def _step(self, m, bucket, observed, state):
+        """Actualización de Holt amortiguado con la media de un intervalo (vectorizada)"""
+        n = state['n'][m]
+        # Huecos sin lecturas: el modelo avanza k pasos antes de corregir
+        k = np.where(state['last_bucket'][m] >= 0, bucket - state['last_bucket'][m], 1).astype(np.float64)[:, None]
+        level, trend, var = state['level'][m], state['trend'][m], state['var'][m]
+
+        drop = (n > 0)[:, None] & (self.direction * (level - observed) > self.reset_drop)
+        reset = (n == 0) | drop.any(axis=1)
+        second = (n == 1) & ~reset
+
+        predicted = level + trend * self._damped_sum(k)
+        error = observed - predicted
+        new_level = predicted + self.alpha * error
+        new_trend = trend * (self.phi ** k) + self.beta * error
+        # Varianza del error a un paso; durante el arranque, media acumulada
+        weight = np.maximum(self.var_alpha, 1.0 / np.maximum(n - 1, 1))[:, None]
+        new_var = (1 - weight) * var + weight * error * error / k
+
+        new_level = np.where(second[:, None], observed, new_level)
+        new_trend = np.where(second[:, None], (observed - level) / k, new_trend)
+        new_var = np.where(second[:, None], var, new_var)
+        new_level = np.where(reset[:, None], observed, new_level)
+        new_trend = np.where(reset[:, None], 0.0, new_trend)
+        new_var = np.where(reset[:, None], 0.0, new_var)
+
+        state['level'][m], state['trend'][m], state['var'][m] = new_level, new_trend, new_var
+        state['n'][m] = np.where(reset, 1, n + 1)
+        state['last_bucket'][m] = bucket
+        self.stats['steps'] += len(m)
+        self.stats['resets'] += int((reset & (n > 0)).sum())
+
+    def update_frame(self, frame):
+        """Actualiza con un DataFrame (plc_id, timestamp y señales)"""
+        return self.update(frame['plc_id'].tolist(), frame['timestamp'], frame[self.names].to_numpy(dtype=np.float64))
+
+    def forecast(self, plc_ids=None):
+        """
+        Pronóstico de todas las máquinas (o de las indicadas) en un solo pase.
+
+        Returns:
+            dict con plc_ids, signals, horizons_h; mean, lower y upper
+            (n_máquinas, n_señales, n_horizontes), NaN sin datos suficientes;
+            hours_to_threshold (n_máquinas, n_señales), inf si la tendencia
+            amortiguada no llega al umbral; y valid (n_máquinas,)
+        """
+        started = time.perf_counter()
+        plc_ids = self.index.machine_ids() if plc_ids is None else list(plc_ids)
+        rows = self.index.lookup(plc_ids)
+        known = rows >= 0
+        safe = np.where(known, rows, 0)
+        state = self._state()
+        valid = known & (state['n'][safe] >= self.min_points)
+
+        level, trend = state['level'][safe], state['trend'][safe]
+        mean = level[:, :, None] + trend[:, :, None] * self.damped_sum
+        sd = np.sqrt(state['var'][safe][:, :, None] * self.variance_factor)
+        mask = ~valid[:, None, None]
+        mean = np.where(mask, np.nan, mean)
+        lower, upper = mean - self.z * sd, mean + self.z * sd
+
+        # Pasos hasta el umbral: S(k) = distancia / tendencia, con S(k) < φ/(1-φ)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gap = self.direction * (self.threshold - level)
+            rate = self.direction * trend
+            needed = gap / rate
+            if self.phi < 1.0:
+                reachable = (rate > 0) & (needed < self.phi / (1 - self.phi))
+                steps = np.log(1 - needed * (1 - self.phi) / self.phi) / np.log(self.phi)
+            else:
+                reachable = rate > 0
+                steps = needed
+            hours = np.where(gap <= 0, 0.0, np.where(reachable, steps * self.step_s / 3600.0, np.inf))
+        hours = np.where(valid[:, None], hours, np.nan)
+
+        self.stats['forecasts'] += 1
+        self.stats['forecast_s'] += time.perf_counter() - started
+        return {
+            'plc_ids': plc_ids, 'signals': self.names, 'horizons_h': self.horizons_h,
+            'mean': mean, 'lower': lower, 'upper': upper,
+            'hours_to_threshold': hours, 'valid': valid
+        }
+
+    def breaches(self, forecast):
+        """
+        Cruces de umbral pronosticados por máquina para las señales que ahora
+        no lo han pasado: el primer horizonte en que la media pasa el umbral
+        ('expected') o, si la media no lo pasa en ninguno, el primero en que lo
+        pasa la cota desfavorable del intervalo ('possible').
+
+        Returns:
+            dict plc_id -> lista de dicts (signal, horizon_h, forecast, lower,
+            upper, threshold, likelihood)
+        """
+        direction = self.direction[None, :, None]
+        threshold = self.threshold[None, :, None]
+        worst = np.where(direction > 0, forecast['upper'], forecast['lower'])
+        with np.errstate(invalid='ignore'):
+            expected = direction * (forecast['mean'] - threshold) >= 0
+            possible = direction * (worst - threshold) >= 0
+            already = forecast['hours_to_threshold'] == 0
+
+        results = {}
+        for i, j in zip(*np.nonzero(possible.any(axis=2) & ~already)):
+            # La media puede cruzar más tarde que el intervalo: cada caso con su propio horizonte
+            likely = expected[i, j].any()
+            h = int(np.argmax(expected[i, j] if likely else possible[i, j]))
+            plc_id = forecast['plc_ids'][i]
+            results.setdefault(plc_id, []).append({
+                'signal': self.names[j],
+                'horizon_h': self.horizons_h[h],
+                'forecast': float(forecast['mean'][i, j, h]),
+                'lower': float(forecast['lower'][i, j, h]),
+                'upper': float(forecast['upper'][i, j, h]),
+                'threshold': float(self.threshold[j]),
+                'likelihood': 'expected' if likely else 'possible'
+            })
+        return results
+
+    def to_records(self, forecast):
+        """Pronóstico por máquina: {plc_id: {señal: {horizonte: (media, inferior, superior)}, ...}}"""
+        records = {}
+        for i in np.flatnonzero(forecast['valid']):
+            plc_id = forecast['plc_ids'][i]
+            records[plc_id] = {
+                signal: {
+                    'horizons': {
+                        h: (float(forecast['mean'][i, j, k]), float(forecast['lower'][i, j, k]),
+                            float(forecast['upper'][i, j, k]))
+                        for k, h in enumerate(self.horizons_h)
+                    },
+                    'hours_to_threshold': float(forecast['hours_to_threshold'][i, j])
+                }
+                for j, signal in enumerate(self.names)
+            }
+        return records
+
+    def get_stats(self):
+        forecasts = self.stats['forecasts']
+        return dict(
+            self.stats,
+            machines=len(self.index),
+            signals=self.names,
+            forecast_ms=1000 * self.stats['forecast_s'] / forecasts if forecasts else None
+        )
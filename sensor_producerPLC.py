@@ -1,7 +1,5 @@
-from pymodbus.client import ModbusTcpClient
-import snap7
-from kafka import KafkaProducer
 import json
+import os
 import time
 from datetime import datetime
 import logging
@@ -9,16 +7,20 @@ import random
 import numpy as np
 import sys
 from collections.abc import Sequence
+from transport import create_transport
 
 # Configurar salida para UTF-8 en Windows
 if sys.platform.startswith('win'):
     sys.stdout.reconfigure(encoding='utf-8')
 
 class EnhancedPLCDataCollector:
-    def __init__(self, plc_ip, plc_port=502, plc_type='simulation'):
+    def __init__(self, plc_ip, plc_port=502, plc_type='simulation', config_path='config.json', transport=None):
         self.plc_type = plc_type
         self.plc_ip = plc_ip
         self.plc_port = plc_port
+        self.config = self.load_config(config_path)
+        self.topic = self.config.get('kinesis_stream', 'plc_data')
+        self.transport = transport or create_transport(self.config)
         
         # Estado interno de la máquina para simulación
         self.machine_age = 0  # Edad en horas
@@ -40,11 +42,21 @@ class EnhancedPLCDataCollector:
         self._setup_connections()
         self._setup_logging()
 
+    def load_config(self, config_path):
+        """Carga config.json si existe; el simulador funciona también sin él"""
+        if not os.path.exists(config_path):
+            return {}
+        with open(config_path, 'r') as f:
+            return json.load(f)
+
     def _setup_connections(self):
         """Configura las conexiones necesarias"""
+        # Las librerías de PLC solo se necesitan con hardware real
         if self.plc_type == 'modbus':
+            from pymodbus.client import ModbusTcpClient
             self.client = ModbusTcpClient(self.plc_ip, port=self.plc_port)
         elif self.plc_type == 'siemens':
+            import snap7
             self.client = snap7.client.Client()
             try:
                 self.client.connect(self.plc_ip, 0, 1)
@@ -53,13 +65,10 @@ class EnhancedPLCDataCollector:
                 self.client = None
 
         try:
-            self.kafka_producer = KafkaProducer(
-                bootstrap_servers=['localhost:9092'],
-                value_serializer=lambda x: json.dumps(x).encode('utf-8')
-            )
+            self.producer = self.transport.producer()
         except Exception as e:
-            print(f"⚠️ No se pudo conectar a Kafka: {e}")
-            self.kafka_producer = None
+            print(f"⚠️ No se pudo conectar al transporte {self.transport.name}: {e}")
+            self.producer = None
 
     def _setup_logging(self):
         """Configura el sistema de logging"""
@@ -138,6 +147,19 @@ class EnhancedPLCDataCollector:
         
         return data
 
+    def build_message(self, data):
+        """Construye el mensaje que se publica en el stream"""
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'plc_id': f"PLC_{self.plc_ip}",
+            'data': data,
+            'metadata': {
+                'machine_type': 'industrial_pump',
+                'installation_date': '2024-01-01',
+                'last_maintenance': self.last_maintenance
+            }
+        }
+
     def collect_and_send(self):
         """Recolecta y envía datos simulados"""
         message_count = 0
@@ -148,19 +170,10 @@ class EnhancedPLCDataCollector:
                 data = self.simulate_plc_data()
                 message_count += 1
                 
-                message = {
-                    'timestamp': datetime.now().isoformat(),
-                    'plc_id': f"PLC_{self.plc_ip}",
-                    'data': data,
-                    'metadata': {
-                        'machine_type': 'industrial_pump',
-                        'installation_date': '2024-01-01',
-                        'last_maintenance': self.last_maintenance
-                    }
-                }
+                message = self.build_message(data)
                 
-                if self.kafka_producer:
-                    self.kafka_producer.send('plc_data', message)
+                if self.producer:
+                    self.producer.send(self.topic, message, key=message['plc_id'])
                     
                     # Mostrar resumen cada 10 segundos
                     current_time = time.time()
@@ -180,8 +193,8 @@ class EnhancedPLCDataCollector:
         self.logger.info("[INFO] Cerrando colector de datos")
         if hasattr(self, 'client') and self.client:
             self.client.close()
-        if hasattr(self, 'kafka_producer') and self.kafka_producer:
-            self.kafka_producer.close()
+        if hasattr(self, 'producer') and self.producer:
+            self.producer.close()
 
 def main():
     PLC_IP = '192.168.1.10'
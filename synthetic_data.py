@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from feature_pipeline import FEATURE_COLUMNS, build_features
+
+# Mismos valores base y efectos de desgaste que EnhancedPLCDataCollector
+BASELINE_VALUES = {
+    'temperature': 23.0,
+    'vibration': 0.5,
+    'pressure': 1.5,
+    'rotation_speed': 1750,
+    'power_consumption': 75.0,
+    'noise_level': 65.0,
+    'oil_level': 95.0,
+    'humidity': 45.0
+}
+
+WEAR_EFFECTS = {
+    'temperature': 15,
+    'vibration': 1.5,
+    'pressure': -0.5,
+    'rotation_speed': -100,
+    'power_consumption': 25,
+    'noise_level': 20,
+    'oil_level': -30,
+    'humidity': 15
+}
+
+FAILURE_EFFECTS = [
+    ('temperature', 30),     # overheating
+    ('vibration', 2.0),      # vibration
+    ('pressure', -1.0)       # pressure_loss
+]
+
+
+def generate_history(n_machines=10, n_steps=3600, start=None, freq_s=1.0, seed=42):
+    """
+    Genera un histórico sintético de plc_mech para toda una flota de forma vectorizada.
+
+    Reproduce la simulación del productor (ruido del 5 %, efectos proporcionales
+    al desgaste y fallos aleatorios con probabilidad creciente), pero con un
+    mantenimiento que devuelve el desgaste a cero al llegar al 100 %.
+
+    Args:
+        n_machines: número de máquinas
+        n_steps: lecturas por máquina
+        start: timestamp de la primera lectura (por defecto, n_steps antes de ahora)
+        freq_s: segundos entre lecturas
+        seed: semilla para reproducibilidad
+
+    Returns:
+        DataFrame con las columnas de plc_mech ordenado por timestamp
+    """
+    rng = np.random.default_rng(seed)
+    if start is None:
+        start = datetime.now() - timedelta(seconds=n_steps * freq_s)
+
+    # Desgaste acumulado por máquina, con mantenimiento al llegar a 1.0
+    increments = rng.uniform(0.001, 0.003, size=(n_steps, n_machines))
+    initial_wear = rng.uniform(0, 1, size=n_machines)
+    wear = np.mod(initial_wear + np.cumsum(increments, axis=0), 1.0)
+
+    failures = rng.random((n_steps, n_machines)) < wear * 0.1
+    failure_type = rng.integers(0, len(FAILURE_EFFECTS), size=(n_steps, n_machines))
+
+    columns = {}
+    for param, baseline in BASELINE_VALUES.items():
+        trend = wear * WEAR_EFFECTS[param]
+        for index, (failure_param, effect) in enumerate(FAILURE_EFFECTS):
+            if failure_param == param:
+                trend = trend + np.where(failures & (failure_type == index), effect, 0.0)
+        noise = rng.normal(0, baseline * 0.05, size=(n_steps, n_machines))
+        columns[param] = np.maximum(0, baseline + noise + trend)
+
+    timestamps = np.datetime64(start) + (np.arange(n_steps) * freq_s * 1e6).astype('timedelta64[us]')
+    machine_age = np.arange(1, n_steps + 1)
+
+    # Orden fila a fila: todas las máquinas de un instante y luego el siguiente
+    df = pd.DataFrame({
+        'timestamp': np.repeat(timestamps, n_machines),
+        'plc_id': np.tile([f"PLC_SIM_{i:04d}" for i in range(n_machines)], n_steps)
+    })
+    for param in BASELINE_VALUES:
+        df[param] = columns[param].ravel()
+    df['rotation_speed'] = df['rotation_speed'].round().astype(np.int64)
+    df['machine_age'] = np.repeat(machine_age, n_machines)
+    df['wear_level'] = wear.ravel()
+    df['maintenance_needed'] = df['wear_level'] > 0.7
+    df['machine_type'] = 'industrial_pump'
+    df['installation_date'] = '2024-01-01'
+    df['last_maintenance'] = 0
+    return df
+
+
+def generate_feature_samples(n_samples=1000, failure_fraction=0.3, seed=42):
+    """
+    Muestras etiquetadas con las mismas columnas y el mismo significado que en producción.
+
+    Cada fila es una lectura con un desgaste aleatorio: las normales por debajo
+    del umbral de mantenimiento (0.7) y las de fallo por encima; los sensores
+    siguen los valores base y efectos de desgaste del simulador. Sirve de
+    respaldo cuando no hay datos reales para entrenar o evaluar. Las filas
+    salen en orden aleatorio (reproducible con seed).
+
+    Returns:
+        (X float32 [n, n_features] en el orden de FEATURE_COLUMNS, y bool [n])
+    """
+    rng = np.random.default_rng(seed)
+    n_failure = int(n_samples * failure_fraction)
+    y = np.zeros(n_samples, dtype=bool)
+    y[n_samples - n_failure:] = True
+    wear = np.where(y, rng.uniform(0.7, 1.0, n_samples), rng.uniform(0.0, 0.7, n_samples))
+
+    columns = {}
+    for param, baseline in BASELINE_VALUES.items():
+        noise = rng.normal(0, baseline * 0.05, n_samples)
+        columns[param] = np.maximum(0, baseline + noise + wear * WEAR_EFFECTS[param])
+    columns['rotation_speed'] = np.round(columns['rotation_speed'])
+    columns['machine_age'] = rng.integers(1, 8760, n_samples).astype(np.float64)
+    columns['wear_level'] = wear
+    # Filas barajadas: los cortes temporales (validación = tramo final) ven las dos clases
+    order = rng.permutation(n_samples)
+    return build_features(columns, FEATURE_COLUMNS)[order], y[order]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from flat_forest import FlatForest, check_parity, export_forest
+from synthetic_data import generate_feature_samples
+
+
+@pytest.fixture(scope='module')
+def samples():
+    X, y = generate_feature_samples(1500)
+    return np.asarray(X, dtype=np.float64), np.asarray(y)
+
+
+MODELS = [
+    RandomForestClassifier(n_estimators=15, max_depth=None, random_state=0),
+    RandomForestClassifier(n_estimators=15, max_depth=4, min_samples_leaf=5, random_state=0),
+    ExtraTreesClassifier(n_estimators=15, max_depth=None, random_state=0),
+    ExtraTreesClassifier(n_estimators=15, max_depth=3, random_state=0),
+]
+
+
+@pytest.mark.parametrize('model', MODELS, ids=lambda m: f'{type(m).__name__}-{m.max_depth}')
+def test_flat_forest_matches_sklearn_probabilities(model, samples):
+    X, y = samples
+    model = clone(model).fit(X[:1000], y[:1000])
+    flat = export_forest(model)
+    X_test = X[1000:]
+
+    assert np.allclose(flat.predict_proba(X_test), model.predict_proba(X_test))
+    assert np.allclose(flat.predict_proba(X_test[0]), model.predict_proba(X_test[:1]))
+    assert np.array_equal(flat.predict(X_test), model.predict(X_test))
+
+
+def test_unbounded_depth_has_single_class_leaves(samples):
+    X, y = samples
+    model = RandomForestClassifier(n_estimators=5, max_depth=None, random_state=0).fit(X, y)
+    flat = export_forest(model)
+
+    leaves = flat.feature < 0
+    # Hojas puras: toda la probabilidad en una sola clase
+    assert np.any(flat.value[leaves].max(axis=1) == 1.0)
+    assert flat.max_depth == max(tree.tree_.max_depth for tree in model.estimators_)
+    assert np.allclose(flat.predict_proba(X[:1]), model.predict_proba(X[:1]))
+
+
+def test_scaler_is_folded_in_and_survives_save_load(samples, tmp_path):
+    X, y = samples
+    scaler = StandardScaler().fit(X)
+    model = ExtraTreesClassifier(n_estimators=10, random_state=0).fit(scaler.transform(X), y)
+    path = str(tmp_path / 'forest.npz')
+    export_forest(model, scaler=scaler).save(path)
+    flat = FlatForest.load(path)
+
+    ok, diff = check_parity(model, flat, X, scaler=scaler)
+    assert ok, diff
+    assert np.allclose(flat.predict_proba(X[5]), model.predict_proba(scaler.transform(X[5:6])))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from incremental_training import add_trees
+from synthetic_data import generate_feature_samples
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def samples():
+    X, y = generate_feature_samples(2000)
+    return np.asarray(X, dtype=np.float32), np.asarray(y)
+
+
+def test_add_trees_grows_the_forest_and_caps_it(samples):
+    X, y = samples
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X[:1000], y[:1000])
+    updated = add_trees(model, X[1000:], y[1000:], n_new_trees=4, max_trees=7)
+
+    assert len(updated.estimators_) == 7
+    assert updated.estimators_[-1] not in model.estimators_
+    assert len(model.estimators_) == 5
+
+
+def test_add_trees_skips_data_without_every_class(samples, caplog):
+    X, y = samples
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    only_ok = y == y.min()
+
+    with caplog.at_level(logging.WARNING, logger='incremental_training'):
+        assert add_trees(model, X[only_ok], y[only_ok]) is None
+    assert 'Actualización incremental omitida' in caplog.text
+
+
+def test_agent_incremental_update_skips_single_class_window(samples, tmp_path, monkeypatch):
+    from predictive_maintenance_agent import PredictiveMaintenanceAgent
+
+    X, y = samples
+    timestamps = pd.Series(pd.date_range('2024-01-01', periods=len(y), freq='min'))
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(REPO_ROOT, 'config.json.example'), 'r') as f:
+        config = json.load(f)
+    config['model_registry']['watch'] = False
+    config['model_registry']['path'] = str(tmp_path / 'models')
+
+    agent = PredictiveMaintenanceAgent(config=config)
+    agent.training_loader = types.SimpleNamespace(stats={'peak_rss_mb': 0})
+    agent.fetch_training_data = lambda days=None, since=None: (X.copy(), y.copy(), timestamps)
+    trained = agent.train_model()
+    assert trained is not None
+
+    # Una ventana nueva sin fallos: no hay excepción ni versión nueva
+    new = timestamps + pd.Timedelta(days=30)
+    agent.fetch_training_data = lambda days=None, since=None: (X[:500].copy(), np.zeros(500, dtype=y.dtype), new[:500])
+    assert agent.train_incremental() is None
+    assert agent.registry.current_version() == trained['version']
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from email.message import EmailMessage
+import pytest
+from local_standins import LocalMQTTBroker, LocalSMTPServer, LocalSyslogServer, LocalWebhookServer
+from notification_channels import (
+    FileChannel, MqttChannel, NotificationHub, SyslogChannel, WebhookChannel, make_item, render_item
+)
+from notification_dispatcher import NotificationDispatcher
+
+CREDENTIALS = ('alertas@example.com', 'secreto')
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def email(subject):
+    message = EmailMessage()
+    message['From'] = CREDENTIALS[0]
+    message['To'] = 'mantenimiento@example.com'
+    message['Subject'] = subject
+    message.set_content(f'Cuerpo de {subject}')
+    return message
+
+
+@pytest.fixture
+def smtp_server():
+    with LocalSMTPServer(credentials=CREDENTIALS) as server:
+        yield server
+
+
+@pytest.fixture
+def dispatcher(smtp_server):
+    host, port = smtp_server.address
+    dispatcher = NotificationDispatcher(
+        host, port, CREDENTIALS[0], CREDENTIALS[1], recipients=['mantenimiento@example.com'],
+        use_tls=False, timeout_s=5, batch_wait_s=0.01, backoff_s=0.01, max_backoff_s=0.05, max_retries=3
+    )
+    yield dispatcher
+    dispatcher.close(timeout=5)
+
+
+def test_smtp_batch_reuses_one_authenticated_session(smtp_server, dispatcher):
+    for i in range(5):
+        assert dispatcher.submit(email(f'aviso {i}'))
+    assert dispatcher.flush(timeout=10)
+
+    assert [m['message']['Subject'] for m in smtp_server.messages] == [f'aviso {i}' for i in range(5)]
+    assert smtp_server.messages[0]['to'] == ['mantenimiento@example.com']
+    assert smtp_server.stats['connections'] == 1
+    assert smtp_server.stats['logins'] == 1
+    assert dispatcher.get_stats()['sent'] == 5
+
+
+def test_smtp_reconnects_after_server_drops_session(smtp_server, dispatcher):
+    dispatcher.submit(email('antes'))
+    assert dispatcher.flush(timeout=10)
+    smtp_server.drop_connections()
+    assert wait_for(lambda: not smtp_server._sessions)
+
+    dispatcher.submit(email('después'))
+    assert dispatcher.flush(timeout=10)
+
+    assert [m['message']['Subject'] for m in smtp_server.messages] == ['antes', 'después']
+    assert smtp_server.stats['connections'] == 2
+    assert dispatcher.get_stats()['failed'] == 0
+
+
+def test_smtp_retries_temporary_4xx_with_backoff(smtp_server, dispatcher):
+    smtp_server.fail_next(2, code=451)
+    dispatcher.submit(email('reintentado'))
+    assert dispatcher.flush(timeout=10)
+
+    stats = dispatcher.get_stats()
+    assert stats['retries'] == 2
+    assert stats['sent'] == 1 and stats['failed'] == 0
+    assert [m['message']['Subject'] for m in smtp_server.messages] == ['reintentado']
+
+
+def test_smtp_drops_message_on_permanent_5xx(smtp_server, dispatcher):
+    smtp_server.fail_next(1, code=550)
+    dispatcher.submit(email('rechazado'))
+    dispatcher.submit(email('entregado'))
+    assert dispatcher.flush(timeout=10)
+
+    stats = dispatcher.get_stats()
+    assert stats['failed'] == 1 and stats['retries'] == 0
+    assert [m['message']['Subject'] for m in smtp_server.messages] == ['entregado']
+
+
+def test_smtp_gives_up_after_max_retries(smtp_server, dispatcher):
+    smtp_server.fail_next(10, code=421)
+    dispatcher.submit(email('sin suerte'))
+    assert dispatcher.flush(timeout=10)
+
+    stats = dispatcher.get_stats()
+    assert stats['retries'] == dispatcher.max_retries
+    assert stats['failed'] == 1 and not smtp_server.messages
+
+
+def notification(plc_id='PLC_01', severity='warning', title='Vibración alta'):
+    return render_item(make_item(plc_id, 'anomaly:vibration', severity, title, 'Puntuación 5.20'))
+
+
+def test_webhook_channel_posts_json_and_counts_http_errors():
+    with LocalWebhookServer() as server:
+        channel = WebhookChannel(server.url)
+        assert channel.deliver(notification())
+        server.fail_next(1, status=503)
+        assert not channel.deliver(notification(plc_id='PLC_02'))
+
+    assert len(server.requests) == 1
+    payload = server.requests[0]['json']
+    assert server.requests[0]['path'] == '/alerts'
+    assert payload['items'][0]['plc_id'] == 'PLC_01'
+    assert payload['severity'] == 'warning' and payload['digest'] is False
+    assert channel.get_stats()['sent'] == 1 and channel.get_stats()['failed'] == 1
+
+
+def test_syslog_channel_sends_one_line_with_priority():
+    with LocalSyslogServer() as server:
+        host, port = server.address
+        channel = SyslogChannel(host=host, port=port, tag='pm-test')
+        assert channel.deliver(notification(severity='critical'))
+        assert wait_for(lambda: server.messages)
+        channel.close()
+
+    message = server.messages[0]
+    # facility user (1) * 8 + crit (2)
+    assert message['priority'] == 10
+    assert message['message'].startswith('pm-test: ')
+    assert 'PLC_01' in message['message']
+
+
+def test_syslog_channel_counts_socket_errors_as_failures():
+    with LocalSyslogServer() as server:
+        host, port = server.address
+        channel = SyslogChannel(host=host, port=port, tag='pm-test')
+        channel.handler.socket.close()
+        assert not channel.deliver(notification())
+        channel.close()
+
+    stats = channel.get_stats()
+    assert stats['failed'] == 1 and stats['sent'] == 0
+    assert not server.messages
+
+
+def test_mqtt_channel_publishes_qos1_and_reconnects():
+    with LocalMQTTBroker() as broker:
+        host, port = broker.address
+        channel = MqttChannel(host=host, port=port, topic='plc/test', qos=1)
+        assert channel.deliver(notification())
+        # El broker cierra la sesión: el siguiente envío reconecta una vez
+        channel._socket.close()
+        assert channel.deliver(notification(plc_id='PLC_02'))
+        channel.close()
+        assert wait_for(lambda: len(broker.payloads('plc/test')) == 2)
+
+    assert [p['items'][0]['plc_id'] for p in broker.payloads('plc/test')] == ['PLC_01', 'PLC_02']
+    assert all(m['qos'] == 1 for m in broker.messages)
+    assert broker.stats['connections'] == 2
+
+
+def test_file_channel_appends_json_lines(tmp_path):
+    path = tmp_path / 'avisos' / 'notifications.jsonl'
+    channel = FileChannel(path=str(path))
+    channel.deliver(notification())
+    channel.deliver(notification(plc_id='PLC_02'))
+
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [line['items'][0]['plc_id'] for line in lines] == ['PLC_01', 'PLC_02']
+    assert all('sent_at' in line for line in lines)
+
+
+def test_hub_digest_sends_one_notification_per_channel(tmp_path):
+    path = tmp_path / 'notifications.jsonl'
+    with LocalWebhookServer() as server:
+        hub = NotificationHub([FileChannel(path=str(path)), WebhookChannel(server.url)], digest_window_s=60)
+        for i in range(20):
+            severity = 'critical' if i == 7 else 'warning'
+            assert hub.notify(make_item(f'PLC_{i:02d}', 'anomaly:temperature', severity, 'Temperatura alta'))
+        assert hub.flush(timeout=10)
+        hub.close(timeout=5)
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 1 and len(server.requests) == 1
+    digest = json.loads(lines[0])
+    assert digest['digest'] is True and len(digest['items']) == 20
+    assert digest['severity'] == 'critical'
+    assert '20 avisos en 20 máquinas (1 críticos)' in digest['subject']
+    assert hub.get_stats()['digests'] == 1
+
+
+def test_rate_limited_channel_defers_into_next_notification(tmp_path):
+    path = tmp_path / 'notifications.jsonl'
+    channel = FileChannel(path=str(path), rate_per_minute=60, burst=1)
+    assert channel.deliver(notification(plc_id='PLC_01'))
+    assert not channel.deliver(notification(plc_id='PLC_02'))
+    assert channel.get_stats()['deferred'] == 1
+
+    # El siguiente envío con cupo lleva también el aviso aplazado
+    channel.bucket.tokens = 1.0
+    assert channel.deliver(notification(plc_id='PLC_03'))
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [[i['plc_id'] for i in line['items']] for line in lines] == [['PLC_01'], ['PLC_02', 'PLC_03']]
+    assert lines[1]['digest'] is True and channel.get_stats()['deferred'] == 0
+
+
+def test_hub_retries_deferred_items_when_the_bucket_refills(tmp_path):
+    path = tmp_path / 'notifications.jsonl'
+    hub = NotificationHub([FileChannel(path=str(path), rate_per_minute=600, burst=1)])
+    for i in range(3):
+        assert hub.notify(make_item(f'PLC_{i:02d}', 'anomaly:vibration', 'warning', 'Vibración alta'))
+
+    def delivered():
+        if not path.exists():
+            return []
+        lines = path.read_text(encoding='utf-8').splitlines()
+        return [item['plc_id'] for line in lines for item in json.loads(line)['items']]
+
+    # Sin avisos nuevos, el hilo del hub reintenta al recuperar cupo (una ficha cada 0.1 s)
+    assert wait_for(lambda: delivered() == ['PLC_00', 'PLC_01', 'PLC_02'])
+    hub.close(timeout=5)
+    assert hub.channels[0].get_stats()['rate_limited'] == 2
+
+
+def test_hub_close_sends_deferred_items_regardless_of_rate(tmp_path):
+    path = tmp_path / 'notifications.jsonl'
+    hub = NotificationHub([FileChannel(path=str(path), rate_per_minute=1, burst=1)])
+    for i in range(3):
+        hub.notify(make_item(f'PLC_{i:02d}', 'maintenance', 'critical', 'Mantenimiento'))
+    hub.close(timeout=5)
+
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert sum(len(line['items']) for line in lines) == 3
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from replay import ReplayJob, json_safe
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def strict_loads(line):
+    def reject(constant):
+        raise ValueError(f"Constante no válida en JSON: {constant}")
+    return json.loads(line, parse_constant=reject)
+
+
+def test_json_safe_replaces_non_finite_floats():
+    record = {'rul_lower_hours': float('nan'), 'rul_upper_hours': float('inf'), 'rul_hours': 12.5,
+              'failure_patterns': [{'score': float('-inf')}]}
+    assert json_safe(record) == {'rul_lower_hours': None, 'rul_upper_hours': None, 'rul_hours': 12.5,
+                                 'failure_patterns': [{'score': None}]}
+
+
+def test_replay_stamps_alerts_and_patterns_inside_the_range(tmp_path, monkeypatch):
+    from predictive_maintenance_agent import PredictiveMaintenanceAgent
+    from synthetic_data import generate_feature_samples
+
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(REPO_ROOT, 'config.json.example'), 'r') as f:
+        config = json.load(f)
+    config['model_registry'].update(path=str(tmp_path / 'models'), watch=False)
+    # Regla que se cumple siempre: cada lectura reproducida lleva un patrón
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps({'rules': [{
+        'name': 'always', 'severity': 'warning', 'for_seconds': 0,
+        'conditions': [{'feature': 'temperature', 'op': '>', 'value': -1000.0, 'clear': -1000.0}]
+    }]}), encoding='utf-8')
+
+    X, y = generate_feature_samples(1000)
+    agent = PredictiveMaintenanceAgent(config=config)
+    agent.fetch_training_data = lambda days=None, since=None: (
+        np.asarray(X, dtype=np.float32), np.asarray(y),
+        pd.Series(pd.date_range('2023-12-01', periods=len(y), freq='min'))
+    )
+    agent.training_loader = type('Loader', (), {'stats': {'peak_rss_mb': 0}})()
+    assert agent.train_model() is not None
+
+    start = datetime(2024, 1, 1, 8)
+    end = start + timedelta(minutes=20)
+    output = str(tmp_path / 'replay_alerts.jsonl')
+    job = ReplayJob(config, start, end, rules_path=str(rules_path), n_workers=1, warmup_minutes=5,
+                    source={'machines': 2, 'freq_s': 30}, output=output)
+    report = job.run()
+
+    assert report['groups_failed'] == [] and report['alerts'] > 0
+    with open(output, 'r', encoding='utf-8') as f:
+        alerts = [strict_loads(line) for line in f]
+    assert len(alerts) == report['alerts']
+
+    patterns = [p for alert in alerts for p in alert['failure_patterns']]
+    assert patterns
+    for stamp in [a['timestamp'] for a in alerts] + [p['timestamp'] for p in patterns]:
+        assert start <= datetime.fromisoformat(stamp) < end
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import timedelta
+from sensor_cache import CACHE_COLUMNS, EPOCH, SensorWindowCache
+
+N_WRITES = 20000
+
+
+def values(i):
+    return {name: (i % 2 == 0) if name == 'maintenance_needed' else i for name in CACHE_COLUMNS}
+
+
+def test_latest_is_consistent_while_the_writer_appends(tmp_path):
+    path = str(tmp_path / 'window.cache')
+    writer = SensorWindowCache.create(path, hours=1, sample_period_s=1.0, max_machines=2)
+    writer.append('PLC_01', EPOCH + timedelta(seconds=1), values(1))
+    reader = SensorWindowCache.open_readonly(path)
+
+    def write():
+        for i in range(2, N_WRITES + 1):
+            writer.append('PLC_01', EPOCH + timedelta(seconds=i), values(i))
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    seen = []
+    while thread.is_alive():
+        reading = reader.latest('PLC_01')
+        if reading is None:
+            continue
+        # Todas las columnas de una lectura deben venir de la misma escritura
+        i = int(reading['timestamp'])
+        assert reading['temperature'] == i and reading['machine_age'] == i
+        assert reading['maintenance_needed'] == (i % 2 == 0)
+        seen.append(i)
+    thread.join()
+
+    assert seen == sorted(seen)
+    assert reader.latest('PLC_01')['timestamp'] == N_WRITES
+    writer.close()
+    reader.close()
+
+
+def test_latest_gives_up_on_a_slot_that_stays_half_written(tmp_path):
+    path = str(tmp_path / 'window.cache')
+    cache = SensorWindowCache.create(path, hours=1, sample_period_s=1.0, max_machines=2)
+    cache.append('PLC_01', EPOCH + timedelta(seconds=1), values(1))
+    assert cache.latest('PLC_01')['temperature'] == 1
+
+    # Un escritor que muere a mitad deja la secuencia impar
+    cache.seq[0] += 1
+    assert cache.latest('PLC_01') is None
+    assert cache.latest() is None
+    cache.close()
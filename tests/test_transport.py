@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import json
+from transport import FileLogTransport
+
+
+def write_lines(path, lines):
+    with open(path, 'ab') as f:
+        f.write(b''.join(lines))
+
+
+def record(value):
+    return (json.dumps({'key': None, 'ts': 0.0, 'value': value}) + '\n').encode('utf-8')
+
+
+def test_latest_consumer_starts_after_the_last_complete_line(tmp_path):
+    broker = FileLogTransport(str(tmp_path))
+    path = broker.partition_path('plc', 0)
+    # La última línea aún se está escribiendo
+    write_lines(path, [record(1), record(2), record(3)[:10]])
+
+    consumer = broker.consumer('plc', 'latest-group', auto_offset_reset='latest')
+    assert consumer.positions[0] == [2, len(record(1) + record(2))]
+    write_lines(path, [record(3)[10:], record(4)])
+
+    messages = consumer.poll(timeout_ms=100)
+    assert [(m.offset, m.value) for m in messages] == [(2, 3), (3, 4)]
+    consumer.close()
+
+
+def test_malformed_line_is_skipped_and_keeps_its_offset(tmp_path):
+    broker = FileLogTransport(str(tmp_path))
+    write_lines(broker.partition_path('plc', 0), [record(1), b'{"key": nul\n', record(3)])
+
+    consumer = broker.consumer('plc', 'group')
+    messages = consumer.poll(timeout_ms=100)
+    assert [(m.offset, m.value) for m in messages] == [(0, 1), (2, 3)]
+    consumer.close()
+
+    # El offset confirmado ya incluye la línea dañada
+    resumed = broker.consumer('plc', 'group')
+    assert resumed.poll(timeout_ms=0) == []
+    resumed.close()
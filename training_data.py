@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import logging
+import sys
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from feature_pipeline import build_features
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux lo da en KB y macOS en bytes
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def _empty(n_features):
+    return (np.empty((0, n_features), dtype=np.float32),
+            np.empty(0, dtype=bool), np.empty(0, dtype='datetime64[ns]'))
+
+
+class StratifiedReservoir:
+    """
+    Muestreo de reservorio estratificado por clase en una sola pasada.
+
+    Cada fila recibe una clave aleatoria y por clase se conservan las
+    `capacity` filas con menor clave, que es una muestra uniforme de todas las
+    vistas. Al final se reparte el tamaño pedido en proporción a las filas
+    observadas de cada clase, así la memoria está acotada por
+    n_clases * capacity independientemente del tamaño del histórico.
+    """
+
+    def __init__(self, capacity, n_features, seed=42):
+        self.capacity = capacity
+        self.n_features = n_features
+        self.rng = np.random.default_rng(seed)
+        self.reservoirs = {}
+        self.counts = {}
+
+    def add(self, X, y, timestamps):
+        keys = self.rng.random(len(y))
+        for label in np.unique(y):
+            mask = y == label
+            self.counts[label] = self.counts.get(label, 0) + int(mask.sum())
+            current = self.reservoirs.get(label)
+            batch = (keys[mask], X[mask], timestamps[mask])
+            if current is not None:
+                batch = tuple(np.concatenate([a, b]) for a, b in zip(current, batch))
+            if len(batch[0]) > self.capacity:
+                keep = np.argpartition(batch[0], self.capacity - 1)[:self.capacity]
+                batch = tuple(a[keep] for a in batch)
+            self.reservoirs[label] = batch
+
+    def result(self):
+        """Muestra final (X, y, timestamps) ordenada por tiempo"""
+        total = sum(self.counts.values())
+        if total == 0:
+            return _empty(self.n_features)
+        parts = []
+        for label, (keys, X, timestamps) in self.reservoirs.items():
+            quota = max(1, int(round(self.capacity * self.counts[label] / total)))
+            keep = np.argsort(keys)[:quota]
+            parts.append((X[keep], np.full(len(keep), label), timestamps[keep]))
+        X = np.concatenate([p[0] for p in parts])
+        y = np.concatenate([p[1] for p in parts])
+        timestamps = np.concatenate([p[2] for p in parts])
+        order = np.argsort(timestamps, kind='stable')
+        return X[order], y[order], timestamps[order]
+
+
+class TrainingDataLoader:
+    """
+    Carga de datos de entrenamiento por bloques con memoria acotada.
+
+    Lee plc_mech con un cursor del lado del servidor en bloques de tamaño fijo,
+    convierte las features a float32 y, opcionalmente, construye en una sola
+    pasada una muestra estratificada de tamaño máximo fijo.
+    """
+
+    def __init__(self, engine, features, chunk_size=100000, logger=None):
+        self.engine = engine
+        self.features = list(features)
+        self.chunk_size = chunk_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = {'rows_read': 0, 'chunks': 0, 'peak_rss_mb': None}
+
+    def _query(self, days=None, since=None, until=None):
+        conditions, params = [], {}
+        if days is not None:
+            conditions.append("timestamp >= NOW() - make_interval(days => :days)")
+            params['days'] = int(days)
+        if since is not None:
+            conditions.append("timestamp > :since")
+            params['since'] = since
+        if until is not None:
+            conditions.append("timestamp <= :until")
+            params['until'] = until
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = text(f"""
+            SELECT timestamp, {', '.join(self.features)}, maintenance_needed
+            FROM plc_mech
+            {where}
+            ORDER BY timestamp
+        """)
+        return query, params
+
+    def iter_frames(self, days=30, since=None, until=None):
+        """Recorre el rango en DataFrames de chunk_size filas con las columnas crudas de plc_mech"""
+        query, params = self._query(days, since, until)
+        with self.engine.connect() as conn:
+            # stream_results usa un cursor con nombre: el servidor entrega las filas por bloques
+            conn = conn.execution_options(stream_results=True, max_row_buffer=self.chunk_size)
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=self.chunk_size):
+                self.stats['rows_read'] += len(chunk)
+                self.stats['chunks'] += 1
+                yield chunk
+
+    def iter_chunks(self, days=30, since=None):
+        """
+        Recorre el rango en bloques de chunk_size filas.
+
+        Yields:
+            (X float32 [n, n_features], y bool [n], timestamps datetime64 [n])
+        """
+        for chunk in self.iter_frames(days, since):
+            X = build_features(chunk, self.features)
+            y = chunk['maintenance_needed'].to_numpy(dtype=bool)
+            timestamps = pd.to_datetime(chunk['timestamp']).to_numpy()
+            yield X, y, timestamps
+
+    def load(self, days=30, since=None, sample_size=None, seed=42):
+        """
+        Carga el rango completo o una muestra estratificada acotada.
+
+        Returns:
+            (X float32, y bool, timestamps) ordenados por tiempo
+        """
+        if sample_size:
+            reservoir = StratifiedReservoir(sample_size, len(self.features), seed=seed)
+            for X, y, timestamps in self.iter_chunks(days, since):
+                reservoir.add(X, y, timestamps)
+            result = reservoir.result()
+        else:
+            parts = list(self.iter_chunks(days, since))
+            if parts:
+                result = tuple(np.concatenate([p[i] for p in parts]) for i in range(3))
+            else:
+                result = _empty(len(self.features))
+
+        self.stats['peak_rss_mb'] = peak_rss_mb()
+        self.logger.info(
+            f"Datos de entrenamiento: {self.stats['rows_read']} filas leídas en {self.stats['chunks']} bloques, "
+            f"{len(result[1])} usadas, pico de memoria {self.stats['peak_rss_mb'] or 0:.0f} MB"
+        )
+        return result
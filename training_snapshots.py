@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from feature_pipeline import FEATURE_COLUMNS, FEATURE_VERSION, build_features
+from training_data import StratifiedReservoir, _empty, peak_rss_mb
+
+MANIFEST_FILE = 'manifest.json'
+RAW_FILE = 'raw.npz'
+
+
+def _features_file(version=FEATURE_VERSION):
+    return f'features-v{version}.npy'
+
+
+def _as_datetime64(value):
+    return np.datetime64(pd.Timestamp(value).to_datetime64(), 'ns')
+
+
+class TrainingSnapshotStore:
+    """
+    Copia local e incremental del histórico de entrenamiento.
+
+    Las lecturas de plc_mech se guardan en trozos de hasta chunk_rows filas,
+    en orden de tiempo, con un watermark (el timestamp más reciente copiado).
+    Cada sincronización solo pide a la BD las filas posteriores al watermark.
+    Cada trozo guarda:
+      - raw.npz: las columnas crudas, comprimidas
+      - features-v{N}.npy: la matriz de features float32 de esa versión del pipeline
+      - y.npy, timestamp.npy
+    Los .npy se leen con memoria mapeada, así que un reentrenamiento no vuelve
+    a consultar ni a convertir el histórico. Si cambia FEATURE_VERSION, las
+    features de cada trozo se regeneran desde raw.npz sin volver a la BD.
+
+    Ofrece la misma interfaz que TrainingDataLoader (load y stats).
+    """
+
+    def __init__(self, directory='training_snapshots', loader=None, chunk_rows=1000000, retention_days=None,
+                 lag_seconds=120, features=None, logger=None):
+        self.directory = directory
+        self.loader = loader
+        self.chunk_rows = chunk_rows
+        self.retention_days = retention_days
+        self.lag = timedelta(seconds=lag_seconds)
+        self.features = list(features or FEATURE_COLUMNS)
+        self.logger = logger or logging.getLogger('TrainingSnapshots')
+        self.stats = {'rows_read': 0, 'chunks': 0, 'peak_rss_mb': None, 'rows_appended': 0,
+                      'chunks_written': 0, 'chunks_dropped': 0, 'features_rebuilt': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._load_manifest()
+        self._remove_orphans()
+
+    @classmethod
+    def from_config(cls, config, loader=None, logger=None):
+        settings = dict(config.get('training_snapshots', {}))
+        settings.pop('enabled', None)
+        return cls(loader=loader, logger=logger, **settings)
+
+    def _load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        empty = {'features': self.features, 'watermark': None, 'chunks': []}
+        if not os.path.exists(path):
+            return empty
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('features') != self.features:
+            # Las columnas crudas guardadas ya no sirven: se vuelve a copiar la ventana
+            self.logger.warning(f"Snapshot con otras columnas ({manifest.get('features')}); se reconstruye")
+            for chunk in manifest.get('chunks', []):
+                shutil.rmtree(os.path.join(self.directory, chunk['name']), ignore_errors=True)
+            return empty
+        return manifest
+
+    def _save_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _remove_orphans(self):
+        # Trozos a medio escribir o no confirmados en el manifiesto tras una caída
+        known = {chunk['name'] for chunk in self.manifest['chunks']}
+        for path in glob.glob(os.path.join(self.directory, 'chunk-*')):
+            if os.path.basename(path) not in known:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @property
+    def watermark(self):
+        return self.manifest['watermark']
+
+    def _write_chunk(self, frame):
+        """Guarda un trozo y avanza el watermark (el manifiesto se escribe después del trozo)"""
+        chunks = self.manifest['chunks']
+        seq = int(chunks[-1]['name'].split('-')[1]) + 1 if chunks else 1
+        name = f'chunk-{seq:06d}'
+        tmp_dir = os.path.join(self.directory, name + '.tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        timestamps = pd.to_datetime(frame['timestamp']).to_numpy(dtype='datetime64[ns]')
+        y = frame['maintenance_needed'].to_numpy(dtype=bool)
+        raw = {column: frame[column].to_numpy() for column in self.features}
+        np.savez_compressed(os.path.join(tmp_dir, RAW_FILE), timestamp=timestamps, maintenance_needed=y, **raw)
+        np.save(os.path.join(tmp_dir, _features_file()), build_features(frame, self.features))
+        np.save(os.path.join(tmp_dir, 'y.npy'), y)
+        np.save(os.path.join(tmp_dir, 'timestamp.npy'), timestamps)
+        os.replace(tmp_dir, os.path.join(self.directory, name))
+
+        end = pd.Timestamp(timestamps[-1]).isoformat()
+        chunks.append({'name': name, 'rows': int(len(y)), 'start': pd.Timestamp(timestamps[0]).isoformat(),
+                       'end': end})
+        self.manifest['watermark'] = end
+        self._save_manifest()
+        self.stats['chunks_written'] += 1
+        self.stats['rows_appended'] += len(y)
+
+    def sync(self, days=30):
+        """
+        Añade las filas de plc_mech posteriores al watermark (la primera vez,
+        los últimos `days` días) y aplica la retención.
+
+        Solo se copia hasta ahora - lag_seconds y el watermark queda en ese
+        límite: las lecturas que llegan con retraso (cola del consumidor,
+        transporte) aún no están en la BD y no se saltarían en la siguiente
+        sincronización.
+
+        Returns:
+            filas añadidas
+        """
+        if self.loader is None:
+            raise ValueError("El snapshot no tiene conexión a la BD para sincronizarse")
+        watermark = self.watermark
+        until = datetime.now() - self.lag
+        frames = self.loader.iter_frames(days=None if watermark else days, since=watermark, until=until)
+        appended = self.stats['rows_appended']
+        pending, pending_rows = [], 0
+        for frame in frames:
+            pending.append(frame)
+            pending_rows += len(frame)
+            if pending_rows < self.chunk_rows:
+                continue
+            buffer = pd.concat(pending, ignore_index=True)
+            # Las filas del último instante pasan al siguiente trozo: el watermark
+            # nunca deja a medias un timestamp si la copia se interrumpe
+            last = buffer['timestamp'].iloc[-1]
+            complete = buffer['timestamp'] < last
+            if complete.any():
+                self._write_chunk(buffer[complete])
+                buffer = buffer[~complete].reset_index(drop=True)
+            pending, pending_rows = [buffer], len(buffer)
+        if pending_rows:
+            self._write_chunk(pd.concat(pending, ignore_index=True))
+        # Todo lo anterior al límite ya está copiado, haya o no filas justo antes
+        if watermark is None or pd.Timestamp(until) > pd.Timestamp(watermark):
+            self.manifest['watermark'] = pd.Timestamp(until).isoformat()
+            self._save_manifest()
+
+        self.apply_retention()
+        added = self.stats['rows_appended'] - appended
+        self.logger.info(f"Snapshot de entrenamiento: {added} filas nuevas desde {watermark or 'el inicio'}, "
+                         f"{self.rows()} filas en {len(self.manifest['chunks'])} trozos")
+        return added
+
+    def apply_retention(self):
+        """Elimina los trozos que quedan enteros fuera de retention_days"""
+        if not self.retention_days:
+            return 0
+        horizon = datetime.now() - timedelta(days=self.retention_days)
+        chunks = self.manifest['chunks']
+        expired = [chunk for chunk in chunks if pd.Timestamp(chunk['end']) < horizon]
+        if not expired:
+            return 0
+        self.manifest['chunks'] = [chunk for chunk in chunks if chunk not in expired]
+        self._save_manifest()
+        for chunk in expired:
+            shutil.rmtree(os.path.join(self.directory, chunk['name']), ignore_errors=True)
+        self.stats['chunks_dropped'] += len(expired)
+        return len(expired)
+
+    def _chunk_arrays(self, chunk):
+        """Arrays mapeados de un trozo; las features se regeneran desde raw.npz si faltan"""
+        directory = os.path.join(self.directory, chunk['name'])
+        features_path = os.path.join(directory, _features_file())
+        if not os.path.exists(features_path):
+            with np.load(os.path.join(directory, RAW_FILE)) as raw:
+                X = build_features({column: raw[column] for column in self.features}, self.features)
+            tmp_path = features_path + '.tmp.npy'
+            np.save(tmp_path, X)
+            os.replace(tmp_path, features_path)
+            self.stats['features_rebuilt'] += 1
+        return (np.load(features_path, mmap_mode='r'),
+                np.load(os.path.join(directory, 'y.npy'), mmap_mode='r'),
+                np.load(os.path.join(directory, 'timestamp.npy'), mmap_mode='r'))
+
+    def iter_chunks(self, days=30, since=None):
+        """
+        Recorre los trozos que caen en la ventana, recortados a ella.
+
+        Yields:
+            (X float32, y bool, timestamps) mapeados desde disco
+        """
+        if since is not None:
+            start, side = _as_datetime64(since), 'right'
+        elif days is not None:
+            start, side = _as_datetime64(datetime.now() - timedelta(days=days)), 'left'
+        else:
+            start, side = None, 'left'
+        for chunk in self.manifest['chunks']:
+            if start is not None and _as_datetime64(chunk['end']) < start:
+                continue
+            X, y, timestamps = self._chunk_arrays(chunk)
+            first = int(np.searchsorted(timestamps, start, side=side)) if start is not None else 0
+            if first >= len(y):
+                continue
+            self.stats['rows_read'] += len(y) - first
+            self.stats['chunks'] += 1
+            yield X[first:], y[first:], timestamps[first:]
+
+    def load(self, days=30, since=None, sample_size=None, seed=42):
+        """
+        Ventana de entrenamiento desde el snapshot, con la misma salida que
+        TrainingDataLoader.load: solo se copian a memoria las filas usadas.
+
+        Returns:
+            (X float32, y bool, timestamps) ordenados por tiempo
+        """
+        if sample_size:
+            reservoir = StratifiedReservoir(sample_size, len(self.features), seed=seed)
+            for X, y, timestamps in self.iter_chunks(days, since):
+                reservoir.add(X, np.asarray(y), timestamps)
+            result = reservoir.result()
+        else:
+            parts = list(self.iter_chunks(days, since))
+            if parts:
+                result = tuple(np.concatenate([p[i] for p in parts]) for i in range(3))
+            else:
+                result = _empty(len(self.features))
+
+        self.stats['peak_rss_mb'] = peak_rss_mb()
+        self.logger.info(
+            f"Datos de entrenamiento desde el snapshot: {self.stats['rows_read']} filas en "
+            f"{self.stats['chunks']} trozos, {len(result[1])} usadas, "
+            f"pico de memoria {self.stats['peak_rss_mb'] or 0:.0f} MB"
+        )
+        return result
+
+    def rows(self):
+        return sum(chunk['rows'] for chunk in self.manifest['chunks'])
+
+    def get_stats(self):
+        disk_bytes = 0
+        for root, _, files in os.walk(self.directory):
+            disk_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return dict(
+            self.stats,
+            watermark=self.watermark,
+            stored_rows=self.rows(),
+            stored_chunks=len(self.manifest['chunks']),
+            disk_bytes=disk_bytes
+        )
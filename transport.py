@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Registro común a todos los backends (mismos campos que usa kafka-python)
+Message = namedtuple('Message', ['topic', 'partition', 'offset', 'key', 'value', 'timestamp'])
+
+
+def _partition_for(key, num_partitions, counter):
+    """Particionado estable por clave; round robin si no hay clave"""
+    if key is None:
+        return counter % num_partitions
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return zlib.crc32(key) % num_partitions
+
+
+def create_transport(config):
+    """
+    Crea el transporte configurado en config['transport'].
+
+    Las variables de entorno PLC_TRANSPORT y PLC_TRANSPORT_DIR tienen prioridad,
+    así main.py puede lanzar todo el pipeline con otro backend sin tocar config.json.
+    """
+    transport_config = dict(config.get('transport', {}))
+    backend = os.environ.get('PLC_TRANSPORT', transport_config.get('backend', 'kafka'))
+    if os.environ.get('PLC_TRANSPORT_DIR'):
+        transport_config['directory'] = os.environ['PLC_TRANSPORT_DIR']
+
+    if backend == 'kafka':
+        return KafkaTransport(config.get('kafka_broker', 'localhost:9092'))
+    if backend == 'memory':
+        return MemoryTransport.shared(transport_config.get('partitions', 1))
+    if backend == 'filelog':
+        return FileLogTransport(
+            transport_config.get('directory', 'transport_log'),
+            num_partitions=transport_config.get('partitions', 1)
+        )
+    raise ValueError(f"Backend de transporte desconocido: {backend}")
+
+
+class _BaseConsumer(ABC):
+    """Interfaz común: iterable y con poll() por lotes"""
+
+    def __iter__(self):
+        while True:
+            for message in self.poll(timeout_ms=1000):
+                yield message
+
+    @abstractmethod
+    def poll(self, timeout_ms=0, max_records=500):
+        """Lista de Message disponibles (espera hasta timeout_ms si no hay ninguno)"""
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Kafka
+# ---------------------------------------------------------------------------
+
+class KafkaTransport:
+    """Backend real sobre kafka-python"""
+
+    name = 'kafka'
+
+    def __init__(self, bootstrap_servers):
+        self.bootstrap_servers = bootstrap_servers
+
+    def producer(self):
+        from kafka import KafkaProducer
+        return KafkaProducer(
+            bootstrap_servers=[self.bootstrap_servers],
+            key_serializer=lambda k: k.encode('utf-8') if isinstance(k, str) else k,
+            value_serializer=lambda x: json.dumps(x).encode('utf-8')
+        )
+
+    def consumer(self, topic, group_id, auto_offset_reset='earliest', enable_auto_commit=True):
+        from kafka import KafkaConsumer
+        return _KafkaConsumer(KafkaConsumer(
+            topic,
+            bootstrap_servers=[self.bootstrap_servers],
+            auto_offset_reset=auto_offset_reset,
+            enable_auto_commit=enable_auto_commit,
+            group_id=group_id,
+            value_deserializer=lambda x: json.loads(x.decode('utf-8'))
+        ))
+
+
+class _KafkaConsumer(_BaseConsumer):
+    def __init__(self, consumer):
+        self._consumer = consumer
+
+    def __iter__(self):
+        return iter(self._consumer)
+
+    def poll(self, timeout_ms=0, max_records=500):
+        batches = self._consumer.poll(timeout_ms=timeout_ms, max_records=max_records)
+        return [record for records in batches.values() for record in records]
+
+    def commit(self):
+        self._consumer.commit()
+
+    def close(self):
+        self._consumer.close()
+
+
+# ---------------------------------------------------------------------------
+# Cola en memoria (un solo proceso)
+# ---------------------------------------------------------------------------
+
+class MemoryTransport:
+    """
+    Broker en memoria para un único proceso.
+
+    Los valores se guardan tal cual (sin serializar), de modo que sirve para medir
+    el coste del pipeline sin ningún broker de por medio.
+    """
+
+    name = 'memory'
+    _shared = None
+
+    def __init__(self, num_partitions=1):
+        self.num_partitions = num_partitions
+        self.topics = {}
+        self.group_offsets = {}
+        self.condition = threading.Condition()
+
+    @classmethod
+    def shared(cls, num_partitions=1):
+        if cls._shared is None:
+            cls._shared = cls(num_partitions)
+        return cls._shared
+
+    def _partitions(self, topic):
+        if topic not in self.topics:
+            self.topics[topic] = [[] for _ in range(self.num_partitions)]
+        return self.topics[topic]
+
+    def producer(self):
+        return _MemoryProducer(self)
+
+    def consumer(self, topic, group_id, auto_offset_reset='earliest', enable_auto_commit=True):
+        return _MemoryConsumer(self, topic, group_id, auto_offset_reset)
+
+
+class _MemoryProducer:
+    def __init__(self, broker):
+        self.broker = broker
+        self._counter = 0
+
+    def send(self, topic, value, key=None):
+        with self.broker.condition:
+            partitions = self.broker._partitions(topic)
+            partition = _partition_for(key, len(partitions), self._counter)
+            self._counter += 1
+            log = partitions[partition]
+            log.append(Message(topic, partition, len(log), key, value, time.time()))
+            self.broker.condition.notify_all()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _MemoryConsumer(_BaseConsumer):
+    def __init__(self, broker, topic, group_id, auto_offset_reset):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+        with broker.condition:
+            partitions = broker._partitions(topic)
+            key = (group_id, topic)
+            if key not in broker.group_offsets:
+                broker.group_offsets[key] = [
+                    0 if auto_offset_reset == 'earliest' else len(log) for log in partitions
+                ]
+            self.offsets = broker.group_offsets[key]
+
+    def poll(self, timeout_ms=0, max_records=500):
+        deadline = time.time() + timeout_ms / 1000.0
+        with self.broker.condition:
+            while True:
+                records = []
+                for partition, log in enumerate(self.broker._partitions(self.topic)):
+                    start = self.offsets[partition]
+                    taken = log[start:start + max_records - len(records)]
+                    self.offsets[partition] = start + len(taken)
+                    records.extend(taken)
+                    if len(records) >= max_records:
+                        break
+                remaining = deadline - time.time()
+                if records or remaining <= 0:
+                    return records
+                self.broker.condition.wait(remaining)
+
+
+# ---------------------------------------------------------------------------
+# Log en ficheros compartido entre procesos
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def _file_lock(path):
+    """Bloqueo exclusivo entre procesos sobre un fichero auxiliar"""
+    with open(path, 'a+b') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLogTransport:
+    """
+    Broker local basado en ficheros: un log JSONL append-only por partición.
+
+    El offset de un registro es su número de línea. Los offsets confirmados de
+    cada grupo se guardan en <dir>/<topic>/_offsets/<grupo>.json junto con la
+    posición en bytes, así varios procesos del host pueden producir y consumir
+    el mismo topic y un consumidor reanuda donde lo dejó.
+    """
+
+    name = 'filelog'
+
+    def __init__(self, directory, num_partitions=1):
+        self.directory = directory
+        self.num_partitions = num_partitions
+
+    def topic_dir(self, topic):
+        path = os.path.join(self.directory, topic)
+        os.makedirs(os.path.join(path, '_offsets'), exist_ok=True)
+        return path
+
+    def partition_path(self, topic, partition):
+        return os.path.join(self.topic_dir(topic), f'partition-{partition:05d}.log')
+
+    def producer(self):
+        return _FileLogProducer(self)
+
+    def consumer(self, topic, group_id, auto_offset_reset='earliest', enable_auto_commit=True,
+                 partitions=None):
+        return _FileLogConsumer(self, topic, group_id, auto_offset_reset,
+                                enable_auto_commit, partitions)
+
+
+class _FileLogProducer:
+    def __init__(self, broker):
+        self.broker = broker
+        self._counter = 0
+        self._files = {}
+
+    def _file(self, topic, partition):
+        key = (topic, partition)
+        if key not in self._files:
+            path = self.broker.partition_path(topic, partition)
+            self._files[key] = (os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644), path + '.lock')
+        return self._files[key]
+
+    def send(self, topic, value, key=None):
+        partition = _partition_for(key, self.broker.num_partitions, self._counter)
+        self._counter += 1
+        record = json.dumps({'key': key, 'ts': time.time(), 'value': value}) + '\n'
+        fd, lock_path = self._file(topic, partition)
+        # Una sola escritura por registro para que nunca se intercalen líneas
+        with _file_lock(lock_path):
+            os.write(fd, record.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for fd, _ in self._files.values():
+            os.close(fd)
+        self._files = {}
+
+
+class _FileLogConsumer(_BaseConsumer):
+    """
+    Consumidor de un topic del log en ficheros.
+
+    A diferencia de Kafka no hay reparto de particiones: los miembros de un
+    grupo solo comparten los offsets confirmados. Cada consumidor lee todas
+    las particiones salvo que se le pase `partitions`; para repartir la carga
+    entre procesos del mismo grupo hay que darles listas disjuntas.
+    """
+
+    def __init__(self, broker, topic, group_id, auto_offset_reset, enable_auto_commit, partitions):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+        self.enable_auto_commit = enable_auto_commit
+        self.partitions = list(partitions) if partitions is not None else list(range(broker.num_partitions))
+        self.offsets_path = os.path.join(broker.topic_dir(topic), '_offsets', f'{group_id}.json')
+        self.positions = self._load_positions(auto_offset_reset)
+        self._files = {}
+
+    def _load_positions(self, auto_offset_reset):
+        """Posiciones (offset, byte) confirmadas por el grupo para cada partición"""
+        committed = {}
+        if os.path.exists(self.offsets_path):
+            with open(self.offsets_path, 'r') as f:
+                committed = {int(k): v for k, v in json.load(f).items()}
+
+        positions = {}
+        for partition in self.partitions:
+            if partition in committed:
+                positions[partition] = list(committed[partition])
+            elif auto_offset_reset == 'latest':
+                positions[partition] = self._end_position(partition)
+            else:
+                positions[partition] = [0, 0]
+        return positions
+
+    def _end_position(self, partition):
+        """Posición justo después de la última línea completa (la última puede estar a medias)"""
+        path = self.broker.partition_path(self.topic, partition)
+        if not os.path.exists(path):
+            return [0, 0]
+        count, position, read = 0, 0, 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                newlines = block.count(b'\n')
+                if newlines:
+                    count += newlines
+                    position = read + block.rindex(b'\n') + 1
+                read += len(block)
+        return [count, position]
+
+    def _file(self, partition):
+        if partition not in self._files:
+            path = self.broker.partition_path(self.topic, partition)
+            if not os.path.exists(path):
+                return None
+            self._files[partition] = open(path, 'rb')
+        return self._files[partition]
+
+    def _read(self, partition, max_records):
+        f = self._file(partition)
+        if f is None:
+            return []
+        offset, position = self.positions[partition]
+        f.seek(position)
+        records = []
+        while len(records) < max_records:
+            line = f.readline()
+            # Una línea sin salto final aún se está escribiendo
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                # Se salta la línea dañada pero conserva su offset
+                logger.warning(f"Registro inválido en {self.topic}[{partition}] offset {offset}: {e}")
+                record = None
+            if record is not None:
+                records.append(Message(self.topic, partition, offset, record['key'],
+                                       record['value'], record['ts']))
+            offset += 1
+            position += len(line)
+        self.positions[partition] = [offset, position]
+        return records
+
+    def poll(self, timeout_ms=0, max_records=500, poll_interval=0.01):
+        deadline = time.time() + timeout_ms / 1000.0
+        while True:
+            records = []
+            for partition in self.partitions:
+                records.extend(self._read(partition, max_records - len(records)))
+                if len(records) >= max_records:
+                    break
+            if records:
+                if self.enable_auto_commit:
+                    self.commit()
+                return records
+            if time.time() >= deadline:
+                return records
+            time.sleep(poll_interval)
+
+    def commit(self):
+        # Otros procesos del grupo confirman sus propias particiones en el mismo
+        # fichero: se fusiona con lo que hay en disco bajo bloqueo
+        with _file_lock(self.offsets_path + '.lock'):
+            committed = {}
+            if os.path.exists(self.offsets_path):
+                with open(self.offsets_path, 'r') as f:
+                    committed = json.load(f)
+            committed.update({str(k): v for k, v in self.positions.items()})
+            tmp_path = self.offsets_path + f'.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(committed, f)
+            os.replace(tmp_path, self.offsets_path)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}